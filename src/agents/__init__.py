@@ -3,6 +3,26 @@ Agents module
 Agent 類型定義與行為特徵
 """
 
-from .types import AgentType, AgentTypeProfile, DEFAULT_PROFILES
+from .types import (
+    AgentType,
+    AgentTypeProfile,
+    DEFAULT_PROFILES,
+    TRAIT_BETA,
+    TRAIT_ETA,
+    TRAIT_V0,
+    TRAIT_MASS,
+    STATUS_ALIVE_BIT,
+    STATUS_TYPE_MASK,
+)
 
-__all__ = ["AgentType", "AgentTypeProfile", "DEFAULT_PROFILES"]
+__all__ = [
+    "AgentType",
+    "AgentTypeProfile",
+    "DEFAULT_PROFILES",
+    "TRAIT_BETA",
+    "TRAIT_ETA",
+    "TRAIT_V0",
+    "TRAIT_MASS",
+    "STATUS_ALIVE_BIT",
+    "STATUS_TYPE_MASK",
+]
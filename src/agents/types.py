@@ -30,6 +30,17 @@ class AgentTypeProfile:
     attack_range: float = 2.0  # 攻擊範圍（僅用於掠食者）
 
 
+# 個體參數向量 traits[i] 的分量索引（beta, eta, v0, mass）
+TRAIT_BETA = 0
+TRAIT_ETA = 1
+TRAIT_V0 = 2
+TRAIT_MASS = 3
+
+# agent_status[i]（u8）的位元配置：bit 7 = 存活，bits 0–3 = AgentType
+STATUS_ALIVE_BIT = 0x80
+STATUS_TYPE_MASK = 0x0F
+
+
 # 預設類型 profiles
 DEFAULT_PROFILES = {
     AgentType.FOLLOWER: AgentTypeProfile(
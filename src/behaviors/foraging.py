@@ -11,6 +11,8 @@ import taichi as ti
 import numpy as np
 from typing import TYPE_CHECKING
 
+from agents.types import TRAIT_V0
+
 if TYPE_CHECKING:
     from resources import ResourceSystem
 
@@ -23,8 +25,9 @@ class ForagingBehaviorMixin:
     依賴：
         • ResourceSystem: 資源管理系統
         • self.x: Agent 位置 (ti.Vector.field)
-        • self.params.boundary_mode: 邊界模式
+        • self.boundary_mode: 邊界模式（Python int，0 = PBC；kernel 內以 ti.static 展開）
         • self.pbc_dist(): PBC 距離計算函式
+        • self.traits / self.v0_base: 個體參數與基礎速度（健康懲罰用）
 
     提供功能：
         • 能量管理（消耗/恢復）
@@ -81,43 +84,34 @@ class ForagingBehaviorMixin:
             • 計算到所有資源的距離
             • 選擇最近且有效的資源
         """
-        N_res = self.resources.n_resources
-
         for i in self.x:
             # 只處理存活的 agents
             if self.agent_alive[i] == 0:
                 continue
 
-            energy = self.agent_energy[i]
-            current_target = self.agent_target_resource[i]
-
-            # 檢查是否需要覓食
-            if energy < self.energy_threshold or current_target >= 0:
-                min_dist = 1e10
-                best_res = -1
-
-                # 搜尋所有資源
-                for res_id in range(N_res):
-                    if self.resources.resource_active[res_id] == 1:
-                        if self.resources.resource_amount[res_id] > 0.0:
-                            # 計算距離
-                            res_pos = self.resources.resource_pos[res_id]
-
-                            # 考慮 PBC
-                            dx = ti.Vector([0.0, 0.0, 0.0])
-                            if self.params.boundary_mode == 0:  # PBC
-                                dx = self.pbc_dist(self.x[i], res_pos)
-                            else:
-                                dx = res_pos - self.x[i]
+            self.update_resource_target(i)
 
-                            dist = dx.norm()
+    @ti.func
+    def update_resource_target(self, i: ti.i32):
+        """更新單一 agent 的目標資源（供 find_nearest_resources 與融合 kernel 共用）"""
+        energy = self.agent_energy[i]
+        current_target = self.agent_target_resource[i]
 
-                            if dist < min_dist:
-                                min_dist = dist
-                                best_res = res_id
+        # 檢查是否需要覓食
+        if energy < self.energy_threshold or current_target >= 0:
+            self.agent_target_resource[i] = self.resources.nearest_resource(
+                self.x[i], self.resource_disp
+            )
 
-                # 更新目標
-                self.agent_target_resource[i] = best_res
+    @ti.func
+    def resource_disp(self, xi: ti.template(), res_pos: ti.template()) -> ti.math.vec3:
+        """agent → 資源的位移（PBC 下取最近映像）"""
+        dx = ti.Vector([0.0, 0.0, 0.0])
+        if ti.static(self.boundary_mode == 0):  # PBC
+            dx = self.pbc_dist(xi, res_pos)
+        else:
+            dx = res_pos - xi
+        return dx
 
     @ti.kernel
     def _update_energy_consumption(self, velocity_factor: ti.f32):
@@ -160,7 +154,7 @@ class ForagingBehaviorMixin:
             2 (虛弱):    能量 15-30 → 速度  60%
             3 (瀕死):    能量 <  15 → 速度  30%
 
-        副作用：直接修改 v0_individual[i] 來影響速度
+        副作用：直接修改 traits[i] 的 v0 分量來影響速度
         """
         for i in self.agent_energy:
             # 只處理存活的 agents
@@ -191,24 +185,26 @@ class ForagingBehaviorMixin:
         """
         根據健康狀態應用速度懲罰
 
-        使用 v0_base 作為基準，計算懲罰後的 v0_individual
+        使用 v0_base 作為基準，計算懲罰後的 v0（寫入 traits[i] 的 v0 分量）
+
+        traits 可能是 f16：結果一律由 f32 的 v0_base 重新計算，
+        不讀回前一次寫入的 v0，因此反覆改寫只有單次捨入誤差，不會漂移
         """
         for i in self.agent_health_status:
             status = self.agent_health_status[i]
             base_speed = self.v0_base[i]
 
-            if status == 0:
-                # 健康：100%
-                self.v0_individual[i] = base_speed
-            elif status == 1:
-                # 疲勞：85%
-                self.v0_individual[i] = base_speed * 0.85
+            # 健康：100%、疲勞：85%、虛弱：60%、瀕死：30%
+            factor = 1.0
+            if status == 1:
+                factor = 0.85
             elif status == 2:
-                # 虛弱：60%
-                self.v0_individual[i] = base_speed * 0.60
+                factor = 0.60
             elif status == 3:
-                # 瀕死：30%
-                self.v0_individual[i] = base_speed * 0.30
+                factor = 0.30
+
+            # traits 的精度由主類別決定（可能是 f16），明確轉型避免精度警告
+            self.traits[i][TRAIT_V0] = ti.cast(base_speed * factor, self.traits.dtype)
 
     def consume_resources_step(
         self,
@@ -237,6 +233,9 @@ class ForagingBehaviorMixin:
         x_np = self.x.to_numpy()
         target_res_np = self.agent_target_resource.to_numpy()
         alive_np = self.agent_alive.to_numpy()
+        # 資源位置與半徑一次拉回 host，避免迴圈內逐一讀取 field（每次都是一次同步）
+        res_pos_np = self.resources.resource_pos.to_numpy()
+        res_radius_np = self.resources.resource_radius.to_numpy()
 
         # resource_id -> [(agent_index, distance)]
         resource_consumers = {}
@@ -249,8 +248,8 @@ class ForagingBehaviorMixin:
             target_res = target_res_np[i]
             if target_res >= 0 and target_res < self.resources.n_resources:
                 agent_pos = x_np[i]
-                res_pos = self.resources.resource_pos[target_res].to_numpy()
-                res_radius = self.resources.resource_radius[target_res]
+                res_pos = res_pos_np[target_res]
+                res_radius = res_radius_np[target_res]
                 distance = np.linalg.norm(agent_pos - res_pos)
 
                 if distance < res_radius:
@@ -276,28 +275,29 @@ class ForagingBehaviorMixin:
 
         所有在範圍內的 agents 平分資源
         """
-        for res_id, consumers in resource_consumers.items():
-            n_consumers = len(consumers)
-            agent_indices = [idx for idx, _ in consumers]
-
-            # 總需求
-            total_demand = consumption_rate * n_consumers
-
-            # 實際消耗
-            consumed = self.resources.consume_resource(res_id, total_demand)
-
-            # 平分
-            per_agent_gain = (consumed / n_consumers) * conversion_efficiency
-
-            for agent_idx in agent_indices:
-                current_energy = self.agent_energy[agent_idx]
-                self.agent_energy[agent_idx] = min(
-                    100.0, current_energy + per_agent_gain
-                )
-
-                # 若能量已滿，清除目標
-                if self.agent_energy[agent_idx] >= 100.0:
-                    self.agent_target_resource[agent_idx] = -1
+        if not resource_consumers:
+            return
+
+        # 每個資源一個消耗事件（總需求 = 速率 × 消費者數）
+        res_ids = np.fromiter(resource_consumers.keys(), dtype=np.int32)
+        n_consumers = np.array(
+            [len(c) for c in resource_consumers.values()], dtype=np.int32
+        )
+        demands = (consumption_rate * n_consumers).astype(np.float32)
+        consumed = self._consume_batch(res_ids, demands)
+
+        # 平分
+        agent_ids = []
+        gains = []
+        for k, consumers in enumerate(resource_consumers.values()):
+            per_agent_gain = (
+                float(consumed[k]) / n_consumers[k]
+            ) * conversion_efficiency
+            for agent_idx, _ in consumers:
+                agent_ids.append(agent_idx)
+                gains.append(per_agent_gain)
+
+        self._apply_energy_gains(agent_ids, gains)
 
     def _allocate_fifo(
         self, resource_consumers, consumption_rate: float, conversion_efficiency: float
@@ -313,40 +313,51 @@ class ForagingBehaviorMixin:
             • 依序分配 consumption_rate 給每個 agent
             • 資源不足時，部分滿足最後幾個 agents
         """
+        if not resource_consumers:
+            return
+
+        # 按距離排序（距離近 = 先到）；批次 kernel 依陣列順序消耗，順序即優先權
+        agent_ids = []
+        res_ids = []
         for res_id, consumers in resource_consumers.items():
-            # 按距離排序（距離近 = 先到）
-            sorted_consumers = sorted(consumers, key=lambda x: x[1])
+            for agent_idx, _ in sorted(consumers, key=lambda x: x[1]):
+                agent_ids.append(agent_idx)
+                res_ids.append(res_id)
 
-            # 可用資源總量
-            available = self.resources.resource_amount[res_id]
+        demands = np.full(len(res_ids), consumption_rate, dtype=np.float32)
+        consumed = self._consume_batch(np.array(res_ids, dtype=np.int32), demands)
 
-            for agent_idx, distance in sorted_consumers:
-                if available <= 0.0:
-                    break  # 資源耗盡
+        # 轉換為能量（資源耗盡後的 agents 消耗量為 0）
+        gains = [float(c) * conversion_efficiency for c in consumed]
+        self._apply_energy_gains(agent_ids, gains)
 
-                # 該 agent 的需求量
-                demand = consumption_rate
+    def _consume_batch(self, res_ids: np.ndarray, demands: np.ndarray) -> np.ndarray:
+        """以單次 kernel launch 消耗整批資源，返回各事件實際消耗量"""
+        consumed = np.zeros(len(res_ids), dtype=np.float32)
+        self.resources.consume_resources_batch(res_ids, demands, consumed)
+        return consumed
 
-                # 實際獲得（可能不足）
-                take = min(demand, available)
-                consumed = self.resources.consume_resource(res_id, take)
+    def _apply_energy_gains(self, agent_ids, gains):
+        """
+        將能量增益寫回 agent_energy（上限 100），能量已滿者清除資源目標
 
-                # 轉換為能量
-                energy_gain = consumed * conversion_efficiency
+        能量與目標各做一次 to_numpy / from_numpy，取代逐個 agent 的 field 讀寫
+        """
+        energy = self.agent_energy.to_numpy()
+        target = self.agent_target_resource.to_numpy()
 
-                # 更新 agent 能量
-                current_energy = self.agent_energy[agent_idx]
-                self.agent_energy[agent_idx] = min(100.0, current_energy + energy_gain)
+        for agent_idx, gain in zip(agent_ids, gains):
+            energy[agent_idx] = min(100.0, float(energy[agent_idx]) + gain)
 
-                # 扣除已消耗量
-                available -= consumed
+            # 若能量已滿，清除目標
+            if energy[agent_idx] >= 100.0:
+                target[agent_idx] = -1
 
-                # 若能量已滿，清除目標
-                if self.agent_energy[agent_idx] >= 100.0:
-                    self.agent_target_resource[agent_idx] = -1
+        self.agent_energy.from_numpy(energy)
+        self.agent_target_resource.from_numpy(target)
 
     @ti.kernel
-    def _check_energy_death(self):
+    def _check_energy_death(self) -> ti.i32:
         """
         檢查能量耗盡導致的死亡（只檢查前 N 個活躍 agents）
 
@@ -354,12 +365,19 @@ class ForagingBehaviorMixin:
             • 能量 <= 0 → 標記為死亡 (agent_alive = 0)
             • 死亡 agent 移動到遠離模擬區域的位置（消失）
             • 速度設為 0，不再參與物理交互
+
+        Returns:
+            本次新死亡的 agent 數
         """
         dead_zone = 1e6  # 遠離模擬區域的位置
+        n_new_deaths = 0
 
         # 只檢查前 N 個 agents（實際活躍的）
         for i in range(self.N):
             if self.agent_energy[i] <= 0.0:
+                if self.agent_alive[i] == 1:
+                    n_new_deaths += 1
+
                 # 標記為死亡
                 self.agent_alive[i] = 0
 
@@ -375,13 +393,16 @@ class ForagingBehaviorMixin:
                 # 清空力（避免計算）
                 self.f[i] = ti.Vector([0.0, 0.0, 0.0])
 
+        return n_new_deaths
+
     def apply_energy_death(self):
         """
         應用能量耗盡死亡機制（每步呼叫）
 
         注意：應在 consume_resources_step() 之後呼叫
         """
-        self._check_energy_death()
+        if self._check_energy_death() > 0:
+            self.forces_valid = False  # 其他 agent 的 f 仍含死者的交互作用
 
         # 統計死亡數（只統計前 N 個 agents）
         alive_arr = self.agent_alive.to_numpy()[: self.N]
@@ -398,11 +419,13 @@ class ForagingBehaviorMixin:
     # ========================================================================
     def add_resource(self, config):
         """新增資源"""
+        self.forces_valid = False
         return self.resources.add_resource(config)
 
     def remove_resource(self, res_id: int):
         """移除資源"""
         self.resources.remove_resource(res_id)
+        self.forces_valid = False
 
     def get_resource_info(self, res_id: int):
         """獲取資源資訊"""
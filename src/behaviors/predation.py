@@ -18,8 +18,9 @@ class PredationBehaviorMixin:
 
     依賴：
         • self.x: Agent 位置 (ti.Vector.field)
-        • self.agent_type: Agent 類型 (ti.field(ti.i32))
-        • self.params.boundary_mode: 邊界模式
+        • self.agent_type_field: Agent 類型 (ti.field(ti.i32))
+        • self.agent_types_np: Agent 類型的 host 端鏡像（numpy array）
+        • self.boundary_mode: 邊界模式（Python int，0 = PBC；kernel 內以 ti.static 展開）
         • self.pbc_dist(): PBC 距離計算函式
         • self.agent_energy: 能量系統（ForagingBehaviorMixin）
 
@@ -38,57 +39,85 @@ class PredationBehaviorMixin:
         """
         # 掠食者目標與狀態
         self.agent_target_prey = ti.field(ti.i32, N)  # 目標獵物 ID（-1 = 無目標）
-        self.agent_alive = ti.field(ti.i32, N)  # agent 是否存活（0/1）
+        # agent 是否存活（0/1）；主類別若已依 pre-allocated pool 設定存活遮罩則沿用
+        has_alive_mask = hasattr(self, "agent_alive")
+        if not has_alive_mask:
+            self.agent_alive = ti.field(ti.i32, N)
 
         # 掠食者參數
         self.predator_hunt_range = ti.field(ti.f32, N)  # 追捕範圍
         self.predator_attack_range = ti.field(ti.f32, N)  # 攻擊範圍
 
+        # 存活掠食者的索引列表（P ≪ N，由 build_predator_index 重建）
+        self.predator_indices = ti.field(ti.i32, N)
+        self.n_predators = ti.field(ti.i32, ())
+
         # 初始化
         self.agent_target_prey.fill(-1)
-        self.agent_alive.fill(1)  # 所有 agent 初始存活
+        if not has_alive_mask:
+            self.agent_alive.fill(1)  # 所有 agent 初始存活
 
         print(f"[PredationBehavior] Initialized for N={N} agents")
 
     @ti.kernel
+    def build_predator_index(self):
+        """收集存活掠食者的索引到 predator_indices（長度 P ≪ N）"""
+        self.n_predators[None] = 0
+        # 序列化寫入，保持索引順序固定（力的累加順序可重現）
+        ti.loop_config(serialize=True)
+        for i in range(self.predator_indices.shape[0]):
+            if self.agent_alive[i] == 1 and self.agent_type_field[i] == 3:
+                self.predator_indices[self.n_predators[None]] = i
+                self.n_predators[None] += 1
+
     def find_nearest_prey(self):
         """
         掠食者搜尋最近的獵物
 
         邏輯：
-            • 只有 PREDATOR 類型（type=3）會執行
+            • 只有存活的 PREDATOR 類型（type=3）會執行
             • 搜尋範圍內最近且存活的非掠食者
             • 更新 agent_target_prey[i]
         """
-        for i in self.x:
-            # 只有存活的掠食者才追捕
-            if self.agent_type_field[i] == 3 and self.agent_alive[i] == 1:  # PREDATOR
-                hunt_range = self.predator_hunt_range[i]
-                min_dist = hunt_range
-                best_prey = -1
-
-                # 搜尋所有存活的非掠食者
-                for j in range(self.N):
-                    if i == j:
-                        continue
-
-                    # 只追捕存活且非掠食者的 agent
-                    if self.agent_alive[j] == 1 and self.agent_type_field[j] != 3:
-                        # 計算距離（考慮 PBC）
-                        dx = ti.Vector([0.0, 0.0, 0.0])
-                        if self.params.boundary_mode == 0:  # PBC
-                            dx = self.pbc_dist(self.x[i], self.x[j])
-                        else:
-                            dx = self.x[j] - self.x[i]
+        self.build_predator_index()
+        self._find_nearest_prey()
+
+    @ti.kernel
+    def _find_nearest_prey(self):
+        """走訪掠食者列表（需先呼叫 build_predator_index）"""
+        for k in range(self.n_predators[None]):
+            self.update_prey_target(self.predator_indices[k])
+
+    @ti.func
+    def update_prey_target(self, i: ti.i32):
+        """更新掠食者 i 的目標獵物（供 _find_nearest_prey 與融合 kernel 共用）"""
+        xi = self.x[i]
+        hunt_range = self.predator_hunt_range[i]
+        min_dist2 = hunt_range * hunt_range  # 以距離平方比較，免開根號
+        best_prey = -1
+
+        # 搜尋所有存活的非掠食者
+        for j in range(self.N):
+            if i == j:
+                continue
 
-                        dist = dx.norm()
+            # 只追捕存活且非掠食者的 agent
+            if self.agent_alive[j] == 1 and self.agent_type_field[j] != 3:
+                # 計算距離（考慮 PBC）
+                dx = ti.Vector([0.0, 0.0, 0.0])
+                if ti.static(self.boundary_mode == 0):  # PBC
+                    dx = self.pbc_dist(xi, self.x[j])
+                else:
+                    dx = self.x[j] - xi
 
-                        if dist < min_dist:
-                            min_dist = dist
-                            best_prey = j
+                dist2 = dx.dot(dx)
 
-                # 更新目標獵物
-                self.agent_target_prey[i] = best_prey
+                if dist2 < min_dist2:
+                    min_dist2 = dist2
+                    best_prey = j
+
+        # 更新目標獵物
+        self.agent_target_prey[i] = best_prey
 
     def attack_prey_step(self):
         """
@@ -100,11 +129,15 @@ class PredationBehaviorMixin:
             • 成功：獵物死亡，掠食者獲得能量
             • 失敗：掠食者損失體力
         """
+        # 沒有掠食者時不必把位置 / 速度拉回 host（類型只看 host 鏡像，不觸發同步）
+        if not np.any(self.agent_types_np == 3):
+            return
+
         x_np = self.x.to_numpy()
         v_np = self.v.to_numpy()
         target_prey_np = self.agent_target_prey.to_numpy()
         alive_np = self.agent_alive.to_numpy()
-        agent_type_np = self.agent_type_field.to_numpy()
+        agent_type_np = self.agent_types_np
 
         for i in range(len(x_np)):
             # 只有存活的掠食者才能攻擊
@@ -221,7 +254,7 @@ class PredationBehaviorMixin:
         """
         x_np = self.x.to_numpy()
         alive_np = self.agent_alive.to_numpy()
-        agent_type_np = self.agent_type_field.to_numpy()
+        agent_type_np = self.agent_types_np
 
         prey_pos = x_np[prey_id]
         prey_type = agent_type_np[prey_id]
@@ -267,6 +300,7 @@ class PredationBehaviorMixin:
         v_np = self.v.to_numpy()
         v_np[agent_id] = [0.0, 0.0, 0.0]
         self.v.from_numpy(v_np)
+        self.forces_valid = False
 
     # ========================================================================
     # Query API
@@ -277,11 +311,11 @@ class PredationBehaviorMixin:
 
     def get_predator_count(self) -> int:
         """獲取掠食者數量"""
-        agent_type_np = self.agent_type_field.to_numpy()
+        agent_type_np = self.agent_types_np
         return int((agent_type_np == 3).sum())
 
     def get_prey_count(self) -> int:
         """獲取獵物數量（非掠食者且存活）"""
-        agent_type_np = self.agent_type_field.to_numpy()
+        agent_type_np = self.agent_types_np
         alive_np = self.agent_alive.to_numpy()
         return int(((agent_type_np != 3) & (alive_np == 1)).sum())
@@ -12,6 +12,8 @@ import taichi as ti
 import numpy as np
 from typing import TYPE_CHECKING
 
+from agents.types import TRAIT_V0
+
 if TYPE_CHECKING:
     from flocking_heterogeneous import AgentType
 
@@ -27,6 +29,7 @@ class ReproductionBehaviorMixin:
         • self.agent_energy: Agent 能量
         • self.agent_alive: Agent 存活狀態
         • self.agent_types_np: Agent 類型（numpy array）
+        • self.traits: Agent 個體參數 (ti.Vector.field(4)，beta/eta/v0/mass)
         • self.v0_base: Agent 基礎速度
 
     提供功能：
@@ -130,6 +133,7 @@ class ReproductionBehaviorMixin:
 
         # 日誌
         if births_this_step > 0:
+            self.forces_valid = False  # 新生 agent 尚未計入任何人的 f
             alive_count = int(alive_np.sum())
             print(
                 f"🐣 Reproduction: {births_this_step} offspring born (population: {alive_count})"
@@ -186,11 +190,11 @@ class ReproductionBehaviorMixin:
         # 5. 基礎速度：繼承父代
         parent_v0 = self.v0_base[parent_idx]
         self.v0_base[offspring_idx] = parent_v0
-        self.v0_individual[offspring_idx] = parent_v0
 
-        # 6. 質量：繼承父代
-        parent_mass = self.mass[parent_idx]
-        self.mass[offspring_idx] = parent_mass
+        # 6. 個體參數（beta, eta, mass）：繼承父代；v0 從基礎速度重新開始
+        offspring_traits = self.traits[parent_idx]
+        offspring_traits[TRAIT_V0] = parent_v0
+        self.traits[offspring_idx] = offspring_traits
 
         # 7. 健康狀態：初始為健康
         self.agent_health_status[offspring_idx] = 0
@@ -147,10 +147,9 @@ class Flocking2D:
         """
         rij = xj - xi
 
-        boundary_mode = ti.cast(self.p[12], ti.i32)
-
-        # Mode 0: PBC (向後相容)
-        if ti.static(self.params.use_pbc) or boundary_mode == 0:
+        # Mode 0: PBC (向後相容)；邊界模式在建構時固定，編譯期即決定是否套用，
+        # 非週期邊界下整段不會出現在 kernel 裡
+        if ti.static(self.params.use_pbc or self.boundary_mode == 0):
             box = self.p[8]
             half_box = box * 0.5
 
@@ -179,6 +178,11 @@ class Flocking2D:
     @ti.kernel
     def compute_forces(self):
         """計算所有力（Morse + Alignment）"""
+        self._compute_forces()
+
+    @ti.func
+    def _compute_forces(self):
+        """compute_forces 的本體（ti.func，供 step_n 融合成單一 kernel）"""
         # 清空
         for i in self.f:
             self.f[i] = ti.Vector([0.0, 0.0])
@@ -234,6 +238,11 @@ class Flocking2D:
     @ti.kernel
     def verlet_step1(self, dt: ti.f32):
         """Verlet 第一步：半步速度 + 位置更新 + 邊界處理"""
+        self._verlet_step1(dt)
+
+    @ti.func
+    def _verlet_step1(self, dt: ti.f32):
+        """verlet_step1 的本體（ti.func，供 step_n 融合成單一 kernel）"""
         inv_m = 1.0 / self.p[9]
         box = self.p[8]
         half_box = box * 0.5
@@ -282,6 +291,11 @@ class Flocking2D:
     @ti.kernel
     def verlet_step2(self, dt: ti.f32):
         """Verlet 第二步：完整速度更新 + Rayleigh friction + Vicsek noise"""
+        self._verlet_step2(dt)
+
+    @ti.func
+    def _verlet_step2(self, dt: ti.f32):
+        """verlet_step2 的本體（ti.func，供 step_n 融合成單一 kernel）"""
         inv_m = 1.0 / self.p[9]
         alpha, v0 = self.p[5], self.p[6]
         eta = self.p[10]  # Vicsek noise 強度
@@ -329,6 +343,31 @@ class Flocking2D:
         self.compute_forces()
         self.verlet_step2(dt)
 
+    def step_n(self, dt: float, n: int):
+        """
+        執行 n 個時間步（dashboard 每幀呼叫一次）
+
+        子類別未覆寫 step / 力 / 積分時，每步以單一融合 kernel 完成（4 次 launch → 1 次）；
+        否則逐步呼叫 step()。n 不在編譯期展開：每個不同的 n 都得重新編譯，
+        n=10 的冷編譯需十數秒，遠大於省下的 launch 開銷。
+        """
+        cls = type(self)
+        fusable = all(
+            getattr(cls, name) is getattr(Flocking2D, name)
+            for name in ("step", "compute_forces", "verlet_step1", "verlet_step2")
+        )
+        step = self._fused_step if fusable else self.step
+        for _ in range(n):
+            step(dt)
+
+    @ti.kernel
+    def _fused_step(self, dt: ti.f32):
+        """與 step() 相同的一個時間步，融合成單一 kernel（各頂層迴圈仍各自平行化）"""
+        self._compute_forces()
+        self._verlet_step1(dt)
+        self._compute_forces()
+        self._verlet_step2(dt)
+
     @ti.kernel
     def _accumulate_diag(self):
         """累加診斷量（第一次掃描）"""
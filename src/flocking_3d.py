@@ -84,9 +84,10 @@ class Flocking3D:
         self.v = ti.Vector.field(3, ti.f32, N)
         self.f = ti.Vector.field(3, ti.f32, N)
 
-        # 參數快取（擴展為 13 個參數）
-        # [Ca, Cr, la, lr, rc, alpha, v0, beta, box, m, eta, wall_stiffness, boundary_mode]
-        self.p = ti.field(ti.f32, 13)
+        # 參數快取（13 個參數 + 6 個導出常數）
+        # [Ca, Cr, la, lr, rc, alpha, v0, beta, box, m, eta, wall_stiffness, boundary_mode,
+        #  1/la, 1/lr, rc², Ca/la, Cr/lr, 1/box]
+        self.p = ti.field(ti.f32, 19)
         self._sync_params()
 
         # 診斷用累加器
@@ -117,6 +118,14 @@ class Flocking3D:
         self.p[11] = self.params.wall_stiffness  # 壁面剛度
         self.p[12] = float(self.boundary_mode)  # 邊界模式
 
+        # 導出常數：力計算的每對粒子只需乘法
+        self.p[13] = 1.0 / self.params.la
+        self.p[14] = 1.0 / self.params.lr
+        self.p[15] = self.params.rc * self.params.rc
+        self.p[16] = self.params.Ca / self.params.la
+        self.p[17] = self.params.Cr / self.params.lr
+        self.p[18] = 1.0 / self.params.box_size
+
     def initialize(self, box_size: float = None, v_scale: float = 0.1, seed: int = 0):
         """
         初始化粒子位置與速度
@@ -147,18 +156,12 @@ class Flocking3D:
         """
         rij = xj - xi
 
-        boundary_mode = ti.cast(self.p[12], ti.i32)
-
-        # Mode 0: PBC (向後相容)
-        if ti.static(self.params.use_pbc) or boundary_mode == 0:
-            box = self.p[8]
-            half_box = box * 0.5
-
-            for d in ti.static(range(3)):
-                if rij[d] > half_box:
-                    rij[d] -= box
-                elif rij[d] < -half_box:
-                    rij[d] += box
+        # Mode 0: PBC (向後相容)；邊界模式在建構時固定，編譯期即決定是否套用，
+        # 非週期邊界下整段不會出現在 kernel 裡
+        if ti.static(self.params.use_pbc or self.boundary_mode == 0):
+            # 無分支的最近映像：各軸減去 box × round(rij / box)
+            box, inv_box = self.p[8], self.p[18]
+            rij -= box * ti.round(rij * inv_box)
 
         return rij
 
@@ -176,23 +179,42 @@ class Flocking3D:
         """生成 [0, 1) 均勻分布隨機數"""
         return ti.cast(state, ti.f32) / 4294967296.0  # 2^32
 
+    @ti.func
+    def gen3_uniform(self, state: ti.template()) -> ti.math.vec3:
+        """
+        連續推進 3 次 XorShift32，回傳 3 個 [0, 1) 均勻亂數
+
+        state 為呼叫端的區域變數（ti.template 以參考傳入），整段序列都在暫存器內完成，
+        結果與依序呼叫 3 次 xorshift32 + rand_uniform 相同。
+        """
+        s1 = self.xorshift32(state)
+        s2 = self.xorshift32(s1)
+        s3 = self.xorshift32(s2)
+        state = s3
+        return ti.math.vec3(
+            self.rand_uniform(s1), self.rand_uniform(s2), self.rand_uniform(s3)
+        )
+
     @ti.kernel
     def compute_forces(self):
         """計算所有力（Morse + Alignment + Soft-sphere Repulsion）
 
         新增：軟球排斥力以維持最小距離
         """
+        self._compute_forces()
+
+    @ti.func
+    def _compute_forces(self):
+        """compute_forces 的本體（ti.func，供 step_n 融合成單一 kernel）"""
         # 清空
         for i in self.f:
             self.f[i] = ti.Vector([0.0, 0.0, 0.0])
 
         # 讀取參數（減少重複存取）
-        Ca, Cr = self.p[0], self.p[1]
-        la, lr = self.p[2], self.p[3]
-        rc, beta = self.p[4], self.p[7]
-
-        inv_la, inv_lr = 1.0 / la, 1.0 / lr
-        rc2 = rc * rc
+        beta = self.p[7]
+        inv_la, inv_lr = self.p[13], self.p[14]
+        rc2 = self.p[15]
+        Ca_inv_la, Cr_inv_lr = self.p[16], self.p[17]
 
         # 軟球排斥參數
         min_distance = 0.8  # 最小距離（agents 不會比這更靠近）
@@ -230,7 +252,7 @@ class Flocking3D:
                 if r2 <= rc2:
                     exp_a = ti.exp(-r * inv_la)
                     exp_r = ti.exp(-r * inv_lr)
-                    coeff = Ca * inv_la * exp_a - Cr * inv_lr * exp_r
+                    coeff = Ca_inv_la * exp_a - Cr_inv_lr * exp_r
                     force += coeff * rij * inv_r
 
                     # 收集鄰居速度
@@ -252,6 +274,11 @@ class Flocking3D:
 
         修正：使用 F = ma，考慮質量差異
         """
+        self._verlet_step1(dt)
+
+    @ti.func
+    def _verlet_step1(self, dt: ti.f32):
+        """verlet_step1 的本體（ti.func，供 step_n 融合成單一 kernel）"""
         box = self.p[8]
         half_box = box * 0.5
         boundary_mode = ti.cast(self.p[12], ti.i32)
@@ -303,6 +330,11 @@ class Flocking3D:
 
         修正：使用 F = ma，考慮質量差異
         """
+        self._verlet_step2(dt)
+
+    @ti.func
+    def _verlet_step2(self, dt: ti.f32):
+        """verlet_step2 的本體（ti.func，供 step_n 融合成單一 kernel）"""
         mass = self.p[9]
         alpha, v0 = self.p[5], self.p[6]
         eta = self.p[10]  # Vicsek noise 強度
@@ -322,20 +354,16 @@ class Flocking3D:
             if eta > 0.0:
                 speed = ti.sqrt(v_new.dot(v_new))
                 if speed > 1e-6:
-                    # 更新 RNG 狀態（生成 4 個隨機數）
+                    # 更新 RNG 狀態（一次產生 3 個隨機數）
                     state = self.rng_state[i]
+                    rand = self.gen3_uniform(state)
 
                     # Random 1: 旋轉角度 [-eta, +eta]
-                    state = self.xorshift32(state)
-                    rand1 = self.rand_uniform(state)
-                    noise_angle = (rand1 - 0.5) * 2.0 * eta
+                    noise_angle = (rand[0] - 0.5) * 2.0 * eta
 
                     # Random 2-3: 隨機旋轉軸（球面均勻分布）
                     # 使用 Marsaglia (1972) 方法生成均勻球面向量
-                    state = self.xorshift32(state)
-                    rand2 = self.rand_uniform(state)
-                    state = self.xorshift32(state)
-                    rand3 = self.rand_uniform(state)
+                    rand2, rand3 = rand[1], rand[2]
 
                     # 生成單位球內隨機點，投影到球面
                     u = rand2 * 2.0 - 1.0  # [-1, 1]
@@ -411,6 +439,31 @@ class Flocking3D:
         self.compute_forces()
         self.verlet_step2(dt)
 
+    def step_n(self, dt: float, n: int):
+        """
+        執行 n 個時間步（dashboard 每幀呼叫一次）
+
+        子類別未覆寫 step / 力 / 積分時，每步以單一融合 kernel 完成（4 次 launch → 1 次）；
+        否則逐步呼叫 step()。n 不在編譯期展開：每個不同的 n 都得重新編譯，
+        n=10 的冷編譯需十數秒，遠大於省下的 launch 開銷。
+        """
+        cls = type(self)
+        fusable = all(
+            getattr(cls, name) is getattr(Flocking3D, name)
+            for name in ("step", "compute_forces", "verlet_step1", "verlet_step2")
+        )
+        step = self._fused_step if fusable else self.step
+        for _ in range(n):
+            step(dt)
+
+    @ti.kernel
+    def _fused_step(self, dt: ti.f32):
+        """與 step() 相同的一個時間步，融合成單一 kernel（各頂層迴圈仍各自平行化）"""
+        self._compute_forces()
+        self._verlet_step1(dt)
+        self._compute_forces()
+        self._verlet_step2(dt)
+
     @ti.kernel
     def _accumulate_diag(self):
         """累加診斷量（第一次掃描）"""
@@ -12,6 +12,11 @@ import taichi as ti
 import numpy as np
 from dataclasses import dataclass
 
+# 27 個鄰近 cell 的位移（Python 常數，供 ti.static 完全展開）
+NEIGHBOR_SHIFTS = tuple(
+    (dx, dy, dz) for dx in range(-1, 2) for dy in range(-1, 2) for dz in range(-1, 2)
+)
+
 
 @dataclass
 class FlockingParams:
@@ -39,6 +44,27 @@ class FlockingParams:
     m: float = 1.0
 
 
+def diagnostics_from_state(x_np: np.ndarray, v_np: np.ndarray) -> dict:
+    """由 (N, 3) 位置與速度陣列計算診斷指標（Taichi / Numba 版共用）"""
+    N = x_np.shape[0]
+
+    speed_np = np.linalg.norm(v_np, axis=1)
+    sum_speed = speed_np.sum()
+    v_total_norm = np.linalg.norm(v_np.sum(axis=0))
+    x_cm = x_np.mean(axis=0)
+    sum_r2 = ((x_np - x_cm) ** 2).sum()
+
+    polarization = v_total_norm / (sum_speed + 1e-12)
+    rg = np.sqrt(sum_r2 / N)
+
+    return {
+        "mean_speed": float(sum_speed / N),
+        "std_speed": float(np.std(speed_np)),
+        "Rg": float(rg),
+        "polarization": float(polarization),
+    }
+
+
 @ti.data_oriented
 class CellListFlockingFixed:
     """
@@ -48,6 +74,8 @@ class CellListFlockingFixed:
         - 預分配 cell_particles[total_cells, max_per_cell]
         - 用 cell_count[total_cells] 記錄每個 cell 的實際粒子數
         - 使用 atomic_add 安全插入
+
+    CPU 版 CellListFlockingNumba 請透過 make_celllist_flocking(arch="numba") 建立。
     """
 
     def __init__(self, N: int, params: FlockingParams, arch=ti.metal):
@@ -64,10 +92,20 @@ class CellListFlockingFixed:
         self.v = ti.Vector.field(3, ti.f32, N)
         self.f = ti.Vector.field(3, ti.f32, N)
 
+        # 對齊力累加器（half-shell 遍歷時由 i、j 兩端以 atomic_add 寫入）
+        self.v_nb_sum = ti.Vector.field(3, ti.f32, N)
+        self.n_nb = ti.field(ti.i32, N)
+
         # === Cell List 參數 ===
-        self.cell_size = params.rc
-        self.grid_n = max(3, int(params.box_size / self.cell_size) + 1)
+        # cell 邊長取能整除 box 且不小於 rc 的值：週期邊界兩側的 cell 才是相鄰的
+        # （若 grid_n * cell_size > box，最後一個 cell 只有部分寬度，
+        # 跨週期邊界、相距 < rc 的 pair 會落在不相鄰的 cell 而漏算）
+        self.grid_n = max(3, int(params.box_size / params.rc))
+        self.cell_size = params.box_size / self.grid_n
         self.total_cells = self.grid_n**3
+        # 建構後即固定，kernel 內以 ti.static 當作編譯期常數折疊
+        self.grid_n2 = self.grid_n * self.grid_n
+        self.inv_cell_size = 1.0 / self.cell_size
 
         # 估計每個 cell 的平均粒子數
         avg_per_cell = N / self.total_cells
@@ -78,6 +116,30 @@ class CellListFlockingFixed:
         self.cell_particles = ti.field(
             ti.i32, shape=(self.total_cells, self.max_per_cell)
         )
+        # 按 cell 排列的 x/v 副本：27-cell 掃描時鄰居資料連續存放，
+        # 取代對 x[j]/v[j] 的隨機 gather（每次力計算前重新寫入）
+        self.cell_x = ti.Vector.field(
+            3, ti.f32, shape=(self.total_cells, self.max_per_cell)
+        )
+        self.cell_v = ti.Vector.field(
+            3, ti.f32, shape=(self.total_cells, self.max_per_cell)
+        )
+        # 粒子是否成功寫入 cell list（cell 溢出時為 0，鄰居掃描不到它）
+        self.in_cell_list = ti.field(ti.i32, N)
+        # 建表時每個粒子所在的 cell，用來判斷半步後能否沿用 cell list
+        self.last_cell = ti.field(ti.i32, N)
+        self.cells_changed = ti.field(ti.i32, ())
+
+        # 鄰近 cell 位移與週期包裹查找表
+        # cell_wrap[axis, c + 1] = (c mod grid_n) * stride[axis]，c ∈ [-1, grid_n]
+        # 將 27-cell 掃描中的三次取模與乘法折疊為三次查表
+        self.neighbor_shifts = NEIGHBOR_SHIFTS
+        self.cell_wrap = ti.field(ti.i32, shape=(3, self.grid_n + 2))
+        wrapped = np.arange(-1, self.grid_n + 1) % self.grid_n
+        strides = np.array([1, self.grid_n, self.grid_n2])
+        self.cell_wrap.from_numpy(
+            (strides[:, None] * wrapped[None, :]).astype(np.int32)
+        )
 
         # === 參數 field ===
         self.p_Ca = ti.field(ti.f32, ())
@@ -91,13 +153,25 @@ class CellListFlockingFixed:
         self.p_box = ti.field(ti.f32, ())
         self.p_m = ti.field(ti.f32, ())
 
+        # 導出參數（倒數與組合係數，避免在熱迴圈中做除法）
+        self.p_rc2 = ti.field(ti.f32, ())
+        self.p_inv_la = ti.field(ti.f32, ())
+        self.p_inv_lr = ti.field(ti.f32, ())
+        self.p_Ca_over_la = ti.field(ti.f32, ())
+        self.p_Cr_over_lr = ti.field(ti.f32, ())
+        self.p_inv_m = ti.field(ti.f32, ())
+        self.p_inv_box = ti.field(ti.f32, ())
+
         self._update_params()
 
-        # === GPU 診斷 ===
-        self.diag_sum_v = ti.Vector.field(3, dtype=ti.f32, shape=())
-        self.diag_sum_speed = ti.field(ti.f32, shape=())
-        self.diag_sum_x = ti.Vector.field(3, dtype=ti.f32, shape=())
-        self.diag_sum_r2 = ti.field(ti.f32, shape=())
+        # exp(-r/lr) = exp(-r/la)^(la/lr)：當 la/lr 為小整數時（預設 2.5/0.5 = 5），
+        # 排斥項可由吸引項的 exp 連乘得到，每對粒子省下一次 exp（編譯期決定）
+        ratio = params.la / params.lr
+        self.exp_power = (
+            int(round(ratio))
+            if abs(ratio - round(ratio)) < 1e-6 and 1 <= round(ratio) <= 8
+            else 0
+        )
 
         print(f"[INFO] CellListFlockingFixed initialized")
         print(f"[INFO] N={N}, Grid={self.grid_n}³={self.total_cells} cells")
@@ -116,6 +190,14 @@ class CellListFlockingFixed:
         self.p_box[None] = self.params.box_size
         self.p_m[None] = self.params.m
 
+        self.p_rc2[None] = self.params.rc * self.params.rc
+        self.p_inv_la[None] = 1.0 / self.params.la
+        self.p_inv_lr[None] = 1.0 / self.params.lr
+        self.p_Ca_over_la[None] = self.params.Ca / self.params.la
+        self.p_Cr_over_lr[None] = self.params.Cr / self.params.lr
+        self.p_inv_m[None] = 1.0 / self.params.m
+        self.p_inv_box[None] = 1.0 / self.params.box_size
+
     def initialize(
         self, box_size: float = None, v_init_scale: float = 0.1, seed: int = 0
     ):
@@ -136,14 +218,10 @@ class CellListFlockingFixed:
     def periodic_distance(self, xi: ti.template(), xj: ti.template()) -> ti.math.vec3:
         """計算週期性邊界下的最小距離向量"""
         rij = xi - xj
-        box = self.p_box[None]
 
-        if self.params.use_pbc:
-            for d in ti.static(range(3)):
-                if rij[d] > box * 0.5:
-                    rij[d] -= box
-                elif rij[d] < -box * 0.5:
-                    rij[d] += box
+        if ti.static(self.params.use_pbc):
+            # 無分支 minimum image：rij -= box * round(rij / box)
+            rij -= self.p_box[None] * ti.round(rij * self.p_inv_box[None])
 
         return rij
 
@@ -153,11 +231,10 @@ class CellListFlockingFixed:
         box = self.p_box[None]
         p = pos + box * 0.5
 
-        ix = ti.cast(p[0] / self.cell_size, ti.i32) % self.grid_n
-        iy = ti.cast(p[1] / self.cell_size, ti.i32) % self.grid_n
-        iz = ti.cast(p[2] / self.cell_size, ti.i32) % self.grid_n
+        grid_n = ti.static(self.grid_n)
+        idx = ti.cast(p * ti.static(self.inv_cell_size), ti.i32) % grid_n
 
-        return ix + iy * self.grid_n + iz * self.grid_n * self.grid_n
+        return idx[0] + idx[1] * grid_n + idx[2] * ti.static(self.grid_n2)
 
     @ti.kernel
     def build_cell_list(self):
@@ -173,177 +250,244 @@ class CellListFlockingFixed:
         # 將每個粒子插入對應 cell
         for i in self.x:
             cell_id = self.hash_coord(self.x[i])
+            self.last_cell[i] = cell_id
             # Atomic add 獲取插入位置
             offset = ti.atomic_add(self.cell_count[cell_id], 1)
 
             # 檢查是否超出容量
             if offset < self.max_per_cell:
                 self.cell_particles[cell_id, offset] = i
+                self.in_cell_list[i] = 1
+            else:
+                self.in_cell_list[i] = 0
 
     @ti.kernel
-    def compute_forces_celllist(self):
-        """使用 Cell List 計算力（O(N) 複雜度）"""
-        # 清空力
-        for i in self.f:
-            self.f[i] = ti.Vector([0.0, 0.0, 0.0])
-
-        # 遍歷所有粒子
+    def check_cells_changed(self) -> ti.i32:
+        """檢查自上次建表後是否有粒子跨越 cell 邊界（有則需要重建）"""
+        self.cells_changed[None] = 0
         for i in self.x:
-            xi = self.x[i]
-            vi = self.v[i]
-
-            cell_id = self.hash_coord(xi)
-            cx = cell_id % self.grid_n
-            cy = (cell_id // self.grid_n) % self.grid_n
-            cz = cell_id // (self.grid_n * self.grid_n)
-
-            force = ti.Vector([0.0, 0.0, 0.0])
-            v_neighbors_sum = ti.Vector([0.0, 0.0, 0.0])
-            n_neighbors = 0
-
-            # 檢查 27 個鄰近 cell
-            for dx in ti.static(range(-1, 2)):
-                for dy in ti.static(range(-1, 2)):
-                    for dz in ti.static(range(-1, 2)):
-                        ncx = (cx + dx) % self.grid_n
-                        ncy = (cy + dy) % self.grid_n
-                        ncz = (cz + dz) % self.grid_n
-                        neighbor_cell = (
-                            ncx + ncy * self.grid_n + ncz * self.grid_n * self.grid_n
-                        )
-
-                        # 遍歷該 cell 的粒子
-                        n_particles = self.cell_count[neighbor_cell]
-                        for k in range(n_particles):
-                            j = self.cell_particles[neighbor_cell, k]
-
-                            if i == j:
-                                continue
-
-                            rij_vec = self.periodic_distance(xi, self.x[j])
-                            r2 = rij_vec.dot(rij_vec)
-
-                            rc = self.p_rc[None]
-                            if r2 > rc * rc or r2 < 1e-6:
-                                continue
-
-                            r = ti.sqrt(r2)
-
-                            # Morse 力
-                            Ca = self.p_Ca[None]
-                            Cr = self.p_Cr[None]
-                            la = self.p_la[None]
-                            lr = self.p_lr[None]
-
-                            coeff = (Ca / la) * ti.exp(-r / la) - (Cr / lr) * ti.exp(
-                                -r / lr
-                            )
-                            force += coeff * (rij_vec / r)
-
-                            v_neighbors_sum += self.v[j]
-                            n_neighbors += 1
-
-            self.f[i] = force
-
-            # 對齊力
-            beta = self.p_beta[None]
-            if beta > 0.0 and n_neighbors > 0:
-                v_avg = v_neighbors_sum / ti.cast(n_neighbors, ti.f32)
-                self.f[i] += beta * (v_avg - vi)
+            if self.hash_coord(self.x[i]) != self.last_cell[i]:
+                ti.atomic_or(self.cells_changed[None], 1)
+        return self.cells_changed[None]
 
-    @ti.kernel
-    def integrate_verlet_step1(self, dt: ti.f32):
-        """Velocity Verlet 第一步"""
-        for i in self.x:
-            a = self.f[i] / self.p_m[None]
-            v_half = self.v[i] + 0.5 * dt * a
+    @ti.func
+    def cell_coords(self, cell_id: ti.i32) -> ti.math.ivec3:
+        """將 cell ID 還原為 (cx, cy, cz)"""
+        grid_n = ti.static(self.grid_n)
+        cyz = cell_id // grid_n
+        return ti.math.ivec3(cell_id % grid_n, cyz % grid_n, cyz // grid_n)
 
-            new_x = self.x[i] + dt * v_half
+    @ti.func
+    def accumulate_pair_forces(self, i: ti.i32, cc: ti.math.ivec3):
+        """
+        累加粒子 i 與其鄰居 j > i 的交互作用（27-cell 掃描，half-shell）
 
-            if self.params.use_pbc:
-                box = self.p_box[None]
-                for d in ti.static(range(3)):
-                    while new_x[d] > box * 0.5:
-                        new_x[d] -= box
-                    while new_x[d] < -box * 0.5:
-                        new_x[d] += box
+        每對粒子只計算一次：依牛頓第三定律把 +F 加到 i、-F 加到 j，
+        並把彼此的速度加進對方的對齊力累加器。
 
-            self.x[i] = new_x
-            self.v[i] = v_half
+        溢出 cell list 的粒子 i 無法被鄰居掃描到，此時由 i 端處理所有 pair。
 
-    @ti.kernel
-    def integrate_verlet_step2(self, dt: ti.f32):
-        """Velocity Verlet 第二步 + Rayleigh friction"""
-        for i in self.x:
-            a = self.f[i] / self.p_m[None]
-            v_new = self.v[i] + 0.5 * dt * a
+        Args:
+            i: 粒子索引
+            cc: 粒子 i 所在 cell 的座標（由呼叫端按 cell 計算一次）
+        """
+        # 導出參數每個粒子只讀取一次到暫存器
+        rc2 = self.p_rc2[None]
+        inv_la = self.p_inv_la[None]
+        inv_lr = self.p_inv_lr[None]
+        Ca_over_la = self.p_Ca_over_la[None]
+        Cr_over_lr = self.p_Cr_over_lr[None]
+
+        xi = self.x[i]
+        vi = self.v[i]
+        i_listed = self.in_cell_list[i]
+
+        force = ti.Vector([0.0, 0.0, 0.0])
+        v_neighbors_sum = ti.Vector([0.0, 0.0, 0.0])
+        n_neighbors = 0
+
+        # 檢查 27 個鄰近 cell（位移為編譯期常數，迴圈完全展開）
+        for n in ti.static(range(27)):
+            shift = ti.static(self.neighbor_shifts[n])
+            neighbor_cell = (
+                self.cell_wrap[0, cc[0] + shift[0] + 1]
+                + self.cell_wrap[1, cc[1] + shift[1] + 1]
+                + self.cell_wrap[2, cc[2] + shift[2] + 1]
+            )
+
+            # 遍歷該 cell 的粒子
+            # cell_count 可能超過容量，只讀取實際寫入的部分
+            n_particles = ti.min(self.cell_count[neighbor_cell], self.max_per_cell)
+            for k in range(n_particles):
+                j = self.cell_particles[neighbor_cell, k]
+
+                # 只處理 j > i（同時排除 i == j），每對粒子只計算一次
+                if j <= i and i_listed:
+                    continue
+
+                xj = self.cell_x[neighbor_cell, k]
+                rij_vec = self.periodic_distance(xi, xj)
+                r2 = rij_vec.dot(rij_vec)
+
+                if r2 > rc2 or r2 < 1e-6:
+                    continue
+
+                # 通過截斷檢查後才讀取 v[j]
+                vj = self.cell_v[neighbor_cell, k]
+                # 一次 rsqrt 取代 sqrt + 除法
+                inv_r = ti.rsqrt(r2)
+                r = r2 * inv_r
+
+                # Morse 力
+                exp_a = ti.exp(-r * inv_la)
+                exp_r = 0.0
+                if ti.static(self.exp_power > 0):
+                    exp_r = exp_a
+                    for _ in ti.static(range(self.exp_power - 1)):
+                        exp_r *= exp_a
+                else:
+                    exp_r = ti.exp(-r * inv_lr)
+                coeff = Ca_over_la * exp_a - Cr_over_lr * exp_r
+                f_ij = (coeff * inv_r) * rij_vec
+                force += f_ij
+                ti.atomic_add(self.f[j], -f_ij)
+
+                v_neighbors_sum += vj
+                n_neighbors += 1
+                ti.atomic_add(self.v_nb_sum[j], vi)
+                ti.atomic_add(self.n_nb[j], 1)
+
+        ti.atomic_add(self.f[i], force)
+        ti.atomic_add(self.v_nb_sum[i], v_neighbors_sum)
+        ti.atomic_add(self.n_nb[i], n_neighbors)
 
-            alpha = self.p_alpha[None]
-            v0 = self.p_v0[None]
-            v2 = v_new.dot(v_new)
-            a_rayleigh = alpha * (1.0 - v2 / (v0 * v0 + 1e-12)) * v_new
+    @ti.func
+    def apply_alignment(self, i: ti.i32):
+        """把對齊力加到 f[i]（需在所有 pair 累加完成後呼叫）"""
+        beta = self.p_beta[None]
+        n_neighbors = self.n_nb[i]
+        if beta > 0.0 and n_neighbors > 0:
+            v_avg = self.v_nb_sum[i] / ti.cast(n_neighbors, ti.f32)
+            self.f[i] += beta * (v_avg - self.v[i])
 
-            v_new += dt * a_rayleigh
+    @ti.func
+    def verlet_kick_drift(self, i: ti.i32, dt: ti.f32):
+        """Velocity Verlet 第一步（單一粒子）：半步速度 + 位置更新"""
+        a = self.f[i] * self.p_inv_m[None]
+        v_half = self.v[i] + 0.5 * dt * a
 
-            self.v[i] = v_new
+        new_x = self.x[i] + dt * v_half
 
-    def step(self, dt: float):
-        """執行一個完整時間步"""
-        self.build_cell_list()
-        self.compute_forces_celllist()
-        self.integrate_verlet_step1(dt)
+        if ti.static(self.params.use_pbc):
+            # 無分支週期包裹到 [-box/2, box/2)，可處理跨越多個週期的位移
+            box = self.p_box[None]
+            new_x -= box * ti.floor((new_x + box * 0.5) * self.p_inv_box[None])
 
-        self.build_cell_list()
-        self.compute_forces_celllist()
-        self.integrate_verlet_step2(dt)
+        self.x[i] = new_x
+        self.v[i] = v_half
 
-    @ti.kernel
-    def compute_diagnostics_gpu(self):
-        """GPU 診斷計算"""
-        self.diag_sum_v[None] = ti.Vector([0.0, 0.0, 0.0])
-        self.diag_sum_speed[None] = 0.0
-        self.diag_sum_x[None] = ti.Vector([0.0, 0.0, 0.0])
-        self.diag_sum_r2[None] = 0.0
+    @ti.func
+    def verlet_kick_friction(self, i: ti.i32, dt: ti.f32):
+        """Velocity Verlet 第二步（單一粒子）：半步速度 + Rayleigh friction"""
+        a = self.f[i] * self.p_inv_m[None]
+        v_new = self.v[i] + 0.5 * dt * a
 
-        for i in self.v:
-            v = self.v[i]
-            speed = v.norm()
+        alpha = self.p_alpha[None]
+        v0 = self.p_v0[None]
+        v2 = v_new.dot(v_new)
+        a_rayleigh = alpha * (1.0 - v2 / (v0 * v0 + 1e-12)) * v_new
 
-            ti.atomic_add(self.diag_sum_v[None], v)
-            ti.atomic_add(self.diag_sum_speed[None], speed)
-            ti.atomic_add(self.diag_sum_x[None], self.x[i])
+        v_new += dt * a_rayleigh
 
-        x_cm = self.diag_sum_x[None] / ti.cast(self.N, ti.f32)
+        self.v[i] = v_new
 
+    @ti.kernel
+    def compute_forces_celllist(self, dt: ti.f32, stage: ti.template()):
+        """
+        使用 Cell List 計算力（O(N) 複雜度），可選擇在同一個 kernel 內完成積分
+
+        Args:
+            dt: 時間步長（stage=0 時不使用）
+            stage: 編譯期常數
+                0 = 只計算力並寫入 f
+                1 = 計算力 + Verlet 第一步
+                2 = 計算力 + Verlet 第二步 + Rayleigh friction
+
+        Note:
+            pair 累加與積分分為不同的頂層迴圈（中間有隱含的同步點）：
+            對齊力讀取鄰居的 v[j]、Morse 力讀取 x[j]，
+            若在同一個迴圈內更新 x[i]/v[i] 會產生競爭。
+        """
         for i in self.x:
-            r2 = (self.x[i] - x_cm).norm_sqr()
-            ti.atomic_add(self.diag_sum_r2[None], r2)
+            self.f[i] = ti.Vector([0.0, 0.0, 0.0])
+            self.v_nb_sum[i] = ti.Vector([0.0, 0.0, 0.0])
+            self.n_nb[i] = 0
+
+        # 把目前的 x/v 依 cell list 順序寫入 cell_x/cell_v
+        # （cell list 可能沿用上一次建表，因此每次力計算都要重新寫入）
+        for c, k in self.cell_particles:
+            if k < self.cell_count[c]:
+                j = self.cell_particles[c, k]
+                self.cell_x[c, k] = self.x[j]
+                self.cell_v[c, k] = self.v[j]
+
+        # 外層按 cell 分塊：同一 cell 的粒子共享 27 個鄰近 cell，
+        # 連續處理時鄰居的 x/v 仍留在快取（GPU 上每個 block 處理一個 cell）
+        ti.loop_config(block_dim=64)
+        for c in range(self.total_cells):
+            # cell 座標對該 cell 內所有粒子都相同，只解碼一次
+            cc = self.cell_coords(c)
+            n_particles = ti.min(self.cell_count[c], self.max_per_cell)
+            for k in range(n_particles):
+                self.accumulate_pair_forces(self.cell_particles[c, k], cc)
+
+        # 溢出 cell list 的粒子不在上面的迴圈中，單獨補算
+        for i in self.x:
+            if not self.in_cell_list[i]:
+                self.accumulate_pair_forces(i, self.cell_coords(self.last_cell[i]))
 
-    def compute_diagnostics(self) -> dict:
-        """計算診斷指標"""
-        self.compute_diagnostics_gpu()
+        # 對齊力只讀寫粒子自身的資料，可與積分放在同一個迴圈
+        for i in self.x:
+            self.apply_alignment(i)
+            if ti.static(stage == 1):
+                self.verlet_kick_drift(i, dt)
+            elif ti.static(stage == 2):
+                self.verlet_kick_friction(i, dt)
 
-        v_total_vec = self.diag_sum_v[None]
-        sum_speed = self.diag_sum_speed[None]
-        sum_r2 = self.diag_sum_r2[None]
+    @ti.kernel
+    def integrate_verlet_step1(self, dt: ti.f32):
+        """Velocity Verlet 第一步"""
+        for i in self.x:
+            self.verlet_kick_drift(i, dt)
 
-        mean_speed = sum_speed / self.N
-        v_total_norm = np.sqrt(
-            v_total_vec[0] ** 2 + v_total_vec[1] ** 2 + v_total_vec[2] ** 2
-        )
-        polarization = v_total_norm / (sum_speed + 1e-12)
-        rg = np.sqrt(sum_r2 / self.N)
+    @ti.kernel
+    def integrate_verlet_step2(self, dt: ti.f32):
+        """Velocity Verlet 第二步 + Rayleigh friction"""
+        for i in self.x:
+            self.verlet_kick_friction(i, dt)
 
-        v_np = self.v.to_numpy()
-        speed_np = np.linalg.norm(v_np, axis=1)
-        std_speed = float(np.std(speed_np))
+    def step(self, dt: float):
+        """
+        執行一個完整時間步（力計算與積分融合）
+
+        半步位移通常遠小於 cell_size，若沒有粒子換 cell，
+        第二次力計算直接沿用同一份 cell list。
+        """
+        self.build_cell_list()
+        self.compute_forces_celllist(dt, 1)
 
-        return {
-            "mean_speed": float(mean_speed),
-            "std_speed": std_speed,
-            "Rg": float(rg),
-            "polarization": float(polarization),
-        }
+        if self.check_cells_changed():
+            self.build_cell_list()
+        self.compute_forces_celllist(dt, 2)
+
+    def compute_diagnostics(self) -> dict:
+        """
+        計算診斷指標
+
+        std_speed 本來就需要把 v 拷回主機，因此所有歸約都在 NumPy 端一次完成，
+        避免在單一 scalar field 上做 N 次 atomic_add 的競爭。
+        """
+        return diagnostics_from_state(self.x.to_numpy(), self.v.to_numpy())
 
     def get_state(self):
         """獲取當前狀態"""
@@ -362,3 +506,23 @@ class CellListFlockingFixed:
                     f"Rg={diag['Rg']:.3f}  "
                     f"P={diag['polarization']:.3f}"
                 )
+
+
+def make_celllist_flocking(N: int, params: FlockingParams, arch=ti.metal):
+    """
+    依 arch 建立 Cell List flocking 系統
+
+    Args:
+        N: 粒子數
+        params: 模擬參數
+        arch: Taichi 後端（ti.cpu / ti.gpu / ti.metal ...），
+              或字串 "numba" 建立 CPU 版 CellListFlockingNumba（需安裝 numba extra）
+
+    Returns:
+        CellListFlockingFixed 或 CellListFlockingNumba（介面相同）
+    """
+    if isinstance(arch, str) and arch == "numba":
+        from flocking_celllist_numba import CellListFlockingNumba
+
+        return CellListFlockingNumba(N, params)
+    return CellListFlockingFixed(N, params, arch=arch)
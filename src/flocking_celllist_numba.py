@@ -0,0 +1,334 @@
+"""
+CPU 版 Cell List：以 Numba @njit(parallel=True) 編譯整條力 + 積分管線
+
+Why：
+    Taichi 版每個時間步需要 4 次 kernel launch，小 N（< 5 萬粒子）時
+    Python 端的 launch 開銷（每次 ~50-200 µs）會主導總時間。
+    這裡把 cell list、力計算與 Velocity Verlet 都編譯成原生函數，
+    step() 只剩少數幾次 Numba 呼叫，且沒有 GPU 同步成本。
+
+物理模型與 CellListFlockingFixed 相同（Morse + 對齊 + Rayleigh friction）。
+使用方式：make_celllist_flocking(N, params, arch="numba")
+（numba 為選用相依套件：pip install "alife-flocking[numba]"）
+"""
+
+import numpy as np
+from numba import njit, prange
+
+from flocking_celllist import FlockingParams, diagnostics_from_state
+
+# params 陣列索引
+P_CA_OVER_LA = 0
+P_CR_OVER_LR = 1
+P_INV_LA = 2
+P_INV_LR = 3
+P_RC2 = 4
+P_BETA = 5
+P_ALPHA = 6
+P_V0 = 7
+P_BOX = 8
+P_INV_BOX = 9
+P_INV_M = 10
+N_PARAMS = 11
+
+
+@njit(cache=True)
+def hash_coord_nb(xi, box, cell_size, grid_n):
+    """將 3D 座標映射到 cell ID（與 Taichi 版 hash_coord 相同）"""
+    ix = int((xi[0] + box * 0.5) / cell_size) % grid_n
+    iy = int((xi[1] + box * 0.5) / cell_size) % grid_n
+    iz = int((xi[2] + box * 0.5) / cell_size) % grid_n
+    return ix + iy * grid_n + iz * grid_n * grid_n
+
+
+@njit(cache=True)
+def build_cell_list_nb(
+    x, cell_of, cell_count, cell_offset, sorted_particles, box, cell_size, grid_n
+):
+    """
+    以 counting sort 建立 Cell List（O(N)，無容量上限）
+
+    cell c 的粒子為 sorted_particles[cell_offset[c]:cell_offset[c + 1]]
+    """
+    N = x.shape[0]
+    cell_count[:] = 0
+    for i in range(N):
+        c = hash_coord_nb(x[i], box, cell_size, grid_n)
+        cell_of[i] = c
+        cell_count[c] += 1
+
+    cell_offset[0] = 0
+    for c in range(cell_count.shape[0]):
+        cell_offset[c + 1] = cell_offset[c] + cell_count[c]
+
+    # cell_count 重用為寫入游標
+    cell_count[:] = 0
+    for i in range(N):
+        c = cell_of[i]
+        sorted_particles[cell_offset[c] + cell_count[c]] = i
+        cell_count[c] += 1
+
+
+@njit(parallel=True, cache=True)
+def count_cells_changed_nb(x, cell_of, box, cell_size, grid_n):
+    """換 cell 的粒子數（與 Taichi 版 check_cells_changed 相同）"""
+    changed = 0
+    for i in prange(x.shape[0]):
+        if hash_coord_nb(x[i], box, cell_size, grid_n) != cell_of[i]:
+            changed += 1
+    return changed
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def compute_forces_nb(
+    x, v, f, cell_of, cell_offset, sorted_particles, params, grid_n, use_pbc
+):
+    """
+    計算 Morse + 對齊力（27-cell 掃描）
+
+    每個粒子只寫入自己的 f[i]，prange 之間沒有資料競爭，
+    因此使用完整 27-cell 掃描而不是 Taichi 版的 half-shell + atomic。
+    """
+    rc2 = params[P_RC2]
+    inv_la = params[P_INV_LA]
+    inv_lr = params[P_INV_LR]
+    Ca_over_la = params[P_CA_OVER_LA]
+    Cr_over_lr = params[P_CR_OVER_LR]
+    beta = params[P_BETA]
+    box = params[P_BOX]
+    inv_box = params[P_INV_BOX]
+
+    for i in prange(x.shape[0]):
+        c = cell_of[i]
+        cx = c % grid_n
+        cy = (c // grid_n) % grid_n
+        cz = c // (grid_n * grid_n)
+
+        fx = 0.0
+        fy = 0.0
+        fz = 0.0
+        vsx = 0.0
+        vsy = 0.0
+        vsz = 0.0
+        n_neighbors = 0
+
+        for dz in range(-1, 2):
+            nz = (cz + dz) % grid_n
+            for dy in range(-1, 2):
+                ny = (cy + dy) % grid_n
+                for dx in range(-1, 2):
+                    nx = (cx + dx) % grid_n
+                    nc = nx + ny * grid_n + nz * grid_n * grid_n
+
+                    for k in range(cell_offset[nc], cell_offset[nc + 1]):
+                        j = sorted_particles[k]
+                        if i == j:
+                            continue
+
+                        rx = x[i, 0] - x[j, 0]
+                        ry = x[i, 1] - x[j, 1]
+                        rz = x[i, 2] - x[j, 2]
+                        if use_pbc:
+                            rx -= box * np.rint(rx * inv_box)
+                            ry -= box * np.rint(ry * inv_box)
+                            rz -= box * np.rint(rz * inv_box)
+                        r2 = rx * rx + ry * ry + rz * rz
+
+                        if r2 > rc2 or r2 < 1e-6:
+                            continue
+
+                        r = np.sqrt(r2)
+                        inv_r = 1.0 / r
+                        coeff = Ca_over_la * np.exp(-r * inv_la) - Cr_over_lr * np.exp(
+                            -r * inv_lr
+                        )
+                        fx += coeff * inv_r * rx
+                        fy += coeff * inv_r * ry
+                        fz += coeff * inv_r * rz
+
+                        vsx += v[j, 0]
+                        vsy += v[j, 1]
+                        vsz += v[j, 2]
+                        n_neighbors += 1
+
+        # 對齊力
+        if beta > 0.0 and n_neighbors > 0:
+            inv_n = 1.0 / n_neighbors
+            fx += beta * (vsx * inv_n - v[i, 0])
+            fy += beta * (vsy * inv_n - v[i, 1])
+            fz += beta * (vsz * inv_n - v[i, 2])
+
+        f[i, 0] = fx
+        f[i, 1] = fy
+        f[i, 2] = fz
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def verlet_kick_drift_nb(x, v, f, dt, params, use_pbc):
+    """Velocity Verlet 第一步：半步速度 + 位置更新"""
+    inv_m = params[P_INV_M]
+    box = params[P_BOX]
+    inv_box = params[P_INV_BOX]
+
+    for i in prange(x.shape[0]):
+        for d in range(3):
+            v_half = v[i, d] + 0.5 * dt * f[i, d] * inv_m
+            new_x = x[i, d] + dt * v_half
+            if use_pbc:
+                new_x -= box * np.floor((new_x + box * 0.5) * inv_box)
+            x[i, d] = new_x
+            v[i, d] = v_half
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def verlet_kick_friction_nb(v, f, dt, params):
+    """Velocity Verlet 第二步：半步速度 + Rayleigh friction"""
+    inv_m = params[P_INV_M]
+    alpha = params[P_ALPHA]
+    v0 = params[P_V0]
+
+    for i in prange(v.shape[0]):
+        vx = v[i, 0] + 0.5 * dt * f[i, 0] * inv_m
+        vy = v[i, 1] + 0.5 * dt * f[i, 1] * inv_m
+        vz = v[i, 2] + 0.5 * dt * f[i, 2] * inv_m
+
+        v2 = vx * vx + vy * vy + vz * vz
+        g = 1.0 + dt * alpha * (1.0 - v2 / (v0 * v0 + 1e-12))
+
+        v[i, 0] = vx * g
+        v[i, 1] = vy * g
+        v[i, 2] = vz * g
+
+
+class CellListFlockingNumba:
+    """
+    CellListFlockingFixed 的 CPU / Numba 實作（介面相同）
+
+    Key Idea:
+        - 粒子資料為 NumPy 陣列，直接交給 @njit 函數
+        - Cell List 使用 counting sort（cell_offset + sorted_particles），沒有容量上限
+        - 外層 prange 遍歷粒子，fastmath 允許向量化 exp/sqrt
+    """
+
+    def __init__(self, N: int, params: FlockingParams):
+        self.N = N
+        self.params = params
+
+        # === 粒子資料 ===
+        self.x = np.zeros((N, 3), dtype=np.float32)
+        self.v = np.zeros((N, 3), dtype=np.float32)
+        self.f = np.zeros((N, 3), dtype=np.float32)
+
+        # === Cell List ===
+        # 與 Taichi 版相同：cell 剛好鋪滿 box 且邊長 ≥ rc
+        self.grid_n = max(3, int(params.box_size / params.rc))
+        self.cell_size = params.box_size / self.grid_n
+        self.total_cells = self.grid_n**3
+
+        self.cell_of = np.zeros(N, dtype=np.int32)
+        self.cell_count = np.zeros(self.total_cells, dtype=np.int32)
+        self.cell_offset = np.zeros(self.total_cells + 1, dtype=np.int32)
+        self.sorted_particles = np.zeros(N, dtype=np.int32)
+
+        self.p = np.zeros(N_PARAMS, dtype=np.float32)
+        self._update_params()
+
+        print("[INFO] CellListFlockingNumba initialized")
+        print(f"[INFO] N={N}, Grid={self.grid_n}³={self.total_cells} cells")
+
+    def _update_params(self):
+        """將參數（含導出的倒數與組合係數）寫入 params 陣列"""
+        p = self.params
+        self.p[P_CA_OVER_LA] = p.Ca / p.la
+        self.p[P_CR_OVER_LR] = p.Cr / p.lr
+        self.p[P_INV_LA] = 1.0 / p.la
+        self.p[P_INV_LR] = 1.0 / p.lr
+        self.p[P_RC2] = p.rc * p.rc
+        self.p[P_BETA] = p.beta
+        self.p[P_ALPHA] = p.alpha
+        self.p[P_V0] = p.v0
+        self.p[P_BOX] = p.box_size
+        self.p[P_INV_BOX] = 1.0 / p.box_size
+        self.p[P_INV_M] = 1.0 / p.m
+
+    def initialize(
+        self, box_size: float = None, v_init_scale: float = 0.1, seed: int = 0
+    ):
+        """初始化粒子"""
+        if box_size is None:
+            box_size = self.params.box_size * 0.3
+
+        rng = np.random.default_rng(seed)
+        self.x[:] = rng.uniform(-box_size, box_size, size=(self.N, 3))
+        self.v[:] = rng.uniform(-v_init_scale, v_init_scale, size=(self.N, 3))
+
+    def build_cell_list(self):
+        """建立 Cell List"""
+        build_cell_list_nb(
+            self.x,
+            self.cell_of,
+            self.cell_count,
+            self.cell_offset,
+            self.sorted_particles,
+            self.params.box_size,
+            self.cell_size,
+            self.grid_n,
+        )
+
+    def compute_forces(self):
+        """計算力並寫入 f"""
+        compute_forces_nb(
+            self.x,
+            self.v,
+            self.f,
+            self.cell_of,
+            self.cell_offset,
+            self.sorted_particles,
+            self.p,
+            self.grid_n,
+            self.params.use_pbc,
+        )
+
+    def check_cells_changed(self) -> int:
+        """回傳位置更新後換 cell 的粒子數"""
+        return count_cells_changed_nb(
+            self.x, self.cell_of, self.params.box_size, self.cell_size, self.grid_n
+        )
+
+    def step(self, dt: float):
+        """
+        執行一個完整時間步
+
+        與 Taichi 版相同：半步位移後若沒有粒子換 cell，
+        第二次力計算直接沿用同一份 cell list
+        """
+        self.build_cell_list()
+        self.compute_forces()
+        verlet_kick_drift_nb(self.x, self.v, self.f, dt, self.p, self.params.use_pbc)
+
+        if self.check_cells_changed():
+            self.build_cell_list()
+        self.compute_forces()
+        verlet_kick_friction_nb(self.v, self.f, dt, self.p)
+
+    def compute_diagnostics(self) -> dict:
+        """計算診斷指標"""
+        return diagnostics_from_state(self.x, self.v)
+
+    def get_state(self):
+        """獲取當前狀態"""
+        return self.x.copy(), self.v.copy()
+
+    def run(self, steps: int, dt: float, log_every: int = 0):
+        """無視覺化運行"""
+        for n in range(steps):
+            self.step(dt)
+
+            if log_every > 0 and (n % log_every) == 0:
+                diag = self.compute_diagnostics()
+                print(
+                    f"step {n:5d} | "
+                    f"<|v|>={diag['mean_speed']:.3f} ± {diag['std_speed']:.3f}  "
+                    f"Rg={diag['Rg']:.3f}  "
+                    f"P={diag['polarization']:.3f}"
+                )
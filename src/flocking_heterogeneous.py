@@ -40,7 +40,17 @@ from obstacles import ObstacleSystem, ObstacleConfig
 from resources import ResourceSystem, ResourceConfig
 
 # 匯入 Agent 類型定義（Phase 1 重構）
-from agents.types import AgentType, AgentTypeProfile, DEFAULT_PROFILES
+from agents.types import (
+    AgentType,
+    AgentTypeProfile,
+    DEFAULT_PROFILES,
+    TRAIT_BETA,
+    TRAIT_ETA,
+    TRAIT_V0,
+    TRAIT_MASS,
+    STATUS_ALIVE_BIT,
+    STATUS_TYPE_MASK,
+)
 
 # 匯入 Spatial Grid 與 Group Detection（Phase 2-3 重構）
 from spatial.grid import SpatialGridMixin
@@ -142,36 +152,59 @@ class HeterogeneousFlocking3D(
         # 類型 profiles（使用預設或自訂）
         self.type_profiles = type_profiles if type_profiles else DEFAULT_PROFILES
 
-        # 個體參數 fields（使用 max_agents 作為容量）
-        self.beta_individual = ti.field(ti.f32, max_agents)
-        self.eta_individual = ti.field(ti.f32, max_agents)
-        self.v0_individual = ti.field(ti.f32, max_agents)
-        self.v0_base = ti.field(ti.f32, max_agents)  # 基礎速度（不受健康狀態影響）
-        self.mass_individual = ti.field(ti.f32, max_agents)
+        # 個體參數（使用 max_agents 作為容量）
+        # traits 各分量 = (beta, eta, v0, mass)，力計算與積分時一次讀入
+        # 以 f16 儲存（約 3 位有效數字，對這些係數已足夠），讀取時轉回 f32 計算
+        # v0 分量會被健康狀態懲罰改寫，v0_base（f32）保存不受影響的基礎速度；
+        # 每次改寫都由 v0_base × 係數重新算出再捨入成 f16，誤差不會逐次累積
+        # （與 v0_base 的相對誤差恆 ≤ 2^-11 ≈ 0.05%）
+        self.traits = ti.Vector.field(4, ti.f16, max_agents)
+        self.v0_base = ti.field(ti.f32, max_agents)
         self.agent_type_field = ti.field(ti.i32, max_agents)  # 重命名避免衝突
 
-        # Agent 類型 numpy array（用於繁殖時複製）
+        # Agent 類型的 host 端鏡像（繁殖複製、統計與序列化都讀這份，不必 to_numpy）
+        # 類型只在 _init_agent_types 與繁殖時改變，兩處都會同時寫入 agent_type_field
         self.agent_types_np = np.zeros(max_agents, dtype=np.int32)
 
+        # 存活 + 類型打包成 1 byte（bit 7 = 存活，bits 0–3 = 類型）
+        # agent_alive / agent_type_field 仍是唯一的寫入來源；assign_agents_to_grid
+        # 每次重新打包，之後的力計算、積分與群組檢測熱迴圈只讀這 1 byte
+        self.agent_status = ti.field(ti.u8, max_agents)
+
         # 障礙物系統
-        self.obstacles = ObstacleSystem(max_obstacles=max_obstacles)
+        # 障礙物系統（以 box_size 建立障礙物網格，每個 agent 只測試附近的障礙物）
+        self.obstacles = ObstacleSystem(
+            max_obstacles=max_obstacles, domain_size=params.box_size
+        )
 
         # ===== Spatial Grid & Group Detection =====
         # 初始化空間網格（使用 SpatialGridMixin）
+        # cell 邊長至少為 Morse 截斷半徑 rc，compute_forces 的 27-cell 走訪才不會漏掉鄰居；
+        # 也涵蓋群組檢測的 r_cluster=5.0
         self.init_spatial_grid(
-            N=N,
+            N=max_agents,
             box_size=params.box_size,
-            cell_size=5.0,  # 預設值，與 r_cluster 一致
-            max_agents_per_cell=32,
+            cell_size=max(params.rc, 5.0),
+            periodic=params.use_pbc or self.boundary_mode == 0,
         )
 
         # 初始化群組檢測系統（使用 GroupDetectionMixin）
-        self.init_group_detection(N=N, max_groups=max_groups)
+        self.init_group_detection(N=max_agents, max_groups=max_groups)
 
         # 群組檢測頻率控制
         self.group_detection_interval = 5  # 每 5 步檢測一次
         self.step_counter = 0  # 步數計數器
 
+        # f 是否對應目前的狀態（Velocity Verlet 沿用上一步第二次計算的力）
+        # 會改變力的操作（目標、障礙物、資源、死亡 / 繁殖）都會設回 False；
+        # 從外部直接寫入 x / v 之後也必須設為 False
+        self.forces_valid = False
+
+        # initialize() 的 host 端暫存陣列（重複初始化時重用，避免每次重新配置）
+        self._x_stage = np.zeros((max_agents, 3), dtype=np.float32)
+        self._v_stage = np.zeros((max_agents, 3), dtype=np.float32)
+        self._rng_stage = np.zeros(max_agents, dtype=np.uint32)
+
         # ===== Foraging & Predation & Reproduction Behaviors =====
         # 初始化覓食行為（使用 ForagingBehaviorMixin）
         self.init_foraging(
@@ -222,40 +255,43 @@ class HeterogeneousFlocking3D(
         """初始化 agent 類型與個體參數"""
         assert len(agent_types) == self.N, "agent_types 長度必須等於 N"
 
-        # 轉換為 numpy arrays（大小 = max_agents，支援 pre-allocated pool）
-        beta_arr = np.zeros(self.max_agents, dtype=np.float32)
-        eta_arr = np.zeros(self.max_agents, dtype=np.float32)
-        v0_arr = np.zeros(self.max_agents, dtype=np.float32)
-        mass_arr = np.ones(self.max_agents, dtype=np.float32)  # 預設質量 = 1.0
-        goal_strength_arr = np.zeros(self.max_agents, dtype=np.float32)
-        hunt_range_arr = np.zeros(self.max_agents, dtype=np.float32)
-        attack_range_arr = np.zeros(self.max_agents, dtype=np.float32)
-        type_arr = np.zeros(self.max_agents, dtype=np.int32)  # 預設 type = 0 (FOLLOWER)
-
-        # 只填充前 N 個 agents 的數據
-        for i, atype in enumerate(agent_types):
-            profile = self.type_profiles[atype]
-            beta_arr[i] = profile.beta
-            eta_arr[i] = profile.eta
-            v0_arr[i] = profile.v0
-            mass_arr[i] = profile.mass
-            goal_strength_arr[i] = profile.goal_strength
-            hunt_range_arr[i] = profile.hunt_range
-            attack_range_arr[i] = profile.attack_range
-            type_arr[i] = atype
+        # 類型 → 參數表：每個出現的類型只查一次 profile，再以 fancy indexing 展開
+        # 欄位 = (beta, eta, v0, mass, goal_strength, hunt_range, attack_range)
+        types = np.asarray(agent_types, dtype=np.int32)
+        unique_types, rows = np.unique(types, return_inverse=True)
+        profiles = [self.type_profiles[int(t)] for t in unique_types]
+        trait_table = np.array(
+            [
+                (p.beta, p.eta, p.v0, p.mass)
+                + (p.goal_strength, p.hunt_range, p.attack_range)
+                for p in profiles
+            ],
+            dtype=np.float32,
+        ).reshape(-1, 7)
+
+        # 大小 = max_agents（支援 pre-allocated pool），只填充前 N 個 agents
+        # 其餘 slot：參數為 0、質量 = 1.0、type = 0 (FOLLOWER)
+        trait_block = np.zeros((self.max_agents, 7), dtype=np.float32)
+        trait_block[:, TRAIT_MASS] = 1.0
+        trait_block[: self.N] = trait_table[rows]
+        type_arr = np.zeros(self.max_agents, dtype=np.int32)
+        type_arr[: self.N] = types
+
+        traits_arr = np.ascontiguousarray(trait_block[:, :4])
+        goal_strength_arr = np.ascontiguousarray(trait_block[:, 4])
+        hunt_range_arr = np.ascontiguousarray(trait_block[:, 5])
+        attack_range_arr = np.ascontiguousarray(trait_block[:, 6])
 
         # 上傳到 GPU
-        self.beta_individual.from_numpy(beta_arr)
-        self.eta_individual.from_numpy(eta_arr)
-        self.v0_individual.from_numpy(v0_arr)
-        self.v0_base.from_numpy(v0_arr.copy())  # 保存基礎速度
-        self.mass_individual.from_numpy(mass_arr)
-        self.goal_strength.from_numpy(goal_strength_arr)
+        self.traits.from_numpy(traits_arr.astype(np.float16))
+        self.v0_base.from_numpy(traits_arr[:, TRAIT_V0].copy())  # 保存基礎速度
+        self.goal_strength.from_numpy(goal_strength_arr.astype(np.float16))
+        self._goal_strength_np = goal_strength_arr  # NavigationMixin 的 host 端鏡像
         self.predator_hunt_range.from_numpy(hunt_range_arr)
         self.predator_attack_range.from_numpy(attack_range_arr)
         self.agent_type_field.from_numpy(type_arr)  # 使用 agent_type_field
 
-        # 保留 NumPy 陣列供序列化器使用
+        # 保留 host 端鏡像（供統計、繁殖與序列化器使用）
         self.agent_types_np = type_arr
 
         # 預設無目標
@@ -278,172 +314,271 @@ class HeterogeneousFlocking3D(
 
         rng = np.random.default_rng(seed)
 
-        # 創建大小為 max_agents 的陣列，只填充前 N 個
-        x_init = np.zeros((self.max_agents, 3), dtype=np.float32)
-        v_init = np.zeros((self.max_agents, 3), dtype=np.float32)
-        rng_states = np.zeros(self.max_agents, dtype=np.uint32)
+        # 重用 __init__ 配置的暫存陣列，只填充前 N 個
+        x_init, v_init, rng_states = self._x_stage, self._v_stage, self._rng_stage
+        x_init[self.N :] = 0.0
+        v_init[self.N :] = 0.0
+        rng_states[self.N :] = 0
 
         # 只初始化前 N 個 agents
-        x_init[: self.N] = rng.uniform(-box_size, box_size, (self.N, 3)).astype(
-            np.float32
-        )
-        v_init[: self.N] = rng.uniform(-v_scale, v_scale, (self.N, 3)).astype(
-            np.float32
-        )
+        x_init[: self.N] = rng.uniform(-box_size, box_size, (self.N, 3))
+        v_init[: self.N] = rng.uniform(-v_scale, v_scale, (self.N, 3))
         rng_states[: self.N] = rng.integers(0, 2**32, size=self.N, dtype=np.uint32)
 
         self.x.from_numpy(x_init)
         self.v.from_numpy(v_init)
         self.rng_state.from_numpy(rng_states)
+        self.forces_valid = False
 
     def _count_types(self) -> Dict[int, int]:
         """統計各類型數量（只統計前 N 個活躍 agents）"""
-        type_arr = self.agent_type_field.to_numpy()[: self.N]  # 只取前 N 個
+        type_arr = self.agent_types_np[: self.N]  # 只取前 N 個
         unique, counts = np.unique(type_arr, return_counts=True)
         return dict(zip(unique, counts))
 
     # Note: set_goals() 和 goal_seeking_force() 現在從 NavigationMixin 繼承
 
-    @ti.kernel
     def compute_forces(self):
         """
         計算所有力（使用個體參數 + FOV + 目標導向）
 
+        先重建 spatial grid 與掠食者列表（皆為 O(N)，後者來自 PredationBehaviorMixin），
+        再由 _compute_forces_grid 以 27-cell 走訪取代 O(N²) 鄰居搜尋。
+        """
+        # 族群裡沒有掠食者時（host 鏡像判斷，不觸發同步），
+        # 編譯不含掠食者列表與逃跑力的特化版本，也不必重建列表
+        has_predators = bool(np.any(self.agent_types_np == 3))
+
+        self.assign_agents_to_grid()
+        if has_predators:
+            self.build_predator_index()
+        self._compute_forces_grid(has_predators)
+
+    @ti.func
+    def is_alive(self, i: ti.i32) -> ti.i32:
+        """agent_status 的存活位元（需先執行 assign_agents_to_grid）"""
+        return ti.cast((self.agent_status[i] & STATUS_ALIVE_BIT) != 0, ti.i32)
+
+    @ti.func
+    def get_type(self, i: ti.i32) -> ti.i32:
+        """agent_status 的類型位元（需先執行 assign_agents_to_grid）"""
+        return ti.cast(self.agent_status[i] & STATUS_TYPE_MASK, ti.i32)
+
+    @ti.func
+    def joins_groups(self, i: ti.i32) -> ti.i32:
+        """Override: 掠食者（type=3）不參與群組檢測（讀 agent_status）"""
+        return ti.cast(self.get_type(i) != 3, ti.i32)
+
+    @ti.func
+    def accumulate_neighbor(
+        self,
+        vi: ti.template(),
+        vj: ti.template(),
+        rij: ti.template(),
+        r2: ti.f32,
+        vi_norm2: ti.f32,
+        beta_i: ti.f32,
+        force: ti.template(),
+        v_sum: ti.template(),
+        n_neighbors: ti.template(),
+    ):
+        """
+        累加鄰居 j 的 Morse 力與對齊速度
+
+        rij = x_j - x_i，r2 = |rij|²，vi_norm2 = |vi|²（由呼叫端在鄰居迴圈外算好）
+        """
+        # 導出常數由 _sync_params 預先算好（1/la, 1/lr, rc², Ca/la, Cr/lr）
+        inv_la, inv_lr = self.p[13], self.p[14]
+        rc2 = self.p[15]
+        Ca_inv_la, Cr_inv_lr = self.p[16], self.p[17]
+
+        if r2 >= 1e-6 and r2 <= rc2:
+            r = ti.sqrt(r2)
+            inv_r = 1.0 / r
+
+            # Morse force（無 FOV 限制，保持物理一致性）
+            exp_a = ti.exp(-r * inv_la)
+            exp_r = ti.exp(-r * inv_lr)
+            coeff = Ca_inv_la * exp_a - Cr_inv_lr * exp_r
+            force += coeff * rij * inv_r
+
+            # Alignment force（受 FOV 限制）
+            if beta_i > 0.0:
+                if self.is_in_fov_sq(vi, rij, vi_norm2, r2):
+                    v_sum += vj
+                    n_neighbors += 1
+
+    @ti.kernel
+    def _compute_forces_grid(self, has_predators: ti.template()):
+        """
+        計算所有力（需先呼叫 assign_agents_to_grid 與 build_predator_index）
+
+        has_predators 為編譯期常數，Taichi 依其值各快取一個 kernel 實例
+
         修改：
-            • 使用 beta_individual[i] 取代全域 beta
+            • 使用 traits[i] 的 beta 取代全域 beta
             • 加入 FOV 檢查
             • 加入 goal seeking force
+            • 非掠食者鄰居由 spatial grid 的 27-cell 走訪取得
+            • 掠食者（不在 grid 中）走訪短列表，同一趟完成 Morse、對齊與獵物逃跑
+            • 獵物與掠食者分兩個迴圈，各自編譯不含對方分支的版本
         """
         # 清空
         for i in self.f:
             self.f[i] = ti.Vector([0.0, 0.0, 0.0])
 
-        # 讀取參數
-        Ca, Cr = self.p[0], self.p[1]
-        la, lr = self.p[2], self.p[3]
-        rc = self.p[4]
-
-        inv_la, inv_lr = 1.0 / la, 1.0 / lr
-        rc2 = rc * rc
-
-        # 主循環
+        # 獵物（存活的非掠食者）
         for i in self.x:
-            # 只處理存活的 agents
-            if self.agent_alive[i] == 0:
+            if self.is_alive(i) == 0:
                 continue
+            if ti.static(has_predators):
+                if self.get_type(i) == 3:
+                    continue
+            self.compute_agent_forces(i, False, has_predators)
 
-            xi, vi = self.x[i], self.v[i]
-            force = ti.Vector([0.0, 0.0, 0.0])
-            v_sum = ti.Vector([0.0, 0.0, 0.0])
-            n_neighbors = 0
+        # 掠食者：只走訪存活掠食者列表
+        if ti.static(has_predators):
+            for k in range(self.n_predators[None]):
+                self.compute_agent_forces(self.predator_indices[k], True, True)
 
-            # 個體參數
-            beta_i = self.beta_individual[i]
+    @ti.func
+    def compute_agent_forces(
+        self, i: ti.i32, is_predator: ti.template(), has_predators: ti.template()
+    ):
+        """
+        計算單一存活 agent 的合力並寫入 f[i]
 
-            for j in range(self.N):
+        is_predator 為編譯期常數：掠食者版本不含逃跑力，獵物版本不含追捕力
+        has_predators 為編譯期常數：False 時整段掠食者鄰居迴圈不會被編譯
+        """
+        xi, vi = self.x[i], self.v[i]
+        vi_norm2 = vi.dot(vi)  # FOV 檢查用，整個鄰居迴圈共用
+        force = ti.Vector([0.0, 0.0, 0.0])
+        v_sum = ti.Vector([0.0, 0.0, 0.0])
+        n_neighbors = 0
+
+        # 個體參數
+        beta_i = ti.cast(self.traits[i][TRAIT_BETA], ti.f32)
+
+        # 1. 非掠食者鄰居：27-cell 走訪（掠食者不在 grid 中，由位置計算 cell）
+        cell_id = 0
+        if ti.static(is_predator):
+            cell_id = self.get_cell_id(xi)
+        else:
+            cell_id = self.agent_cell_id[i]
+        idx = self.get_cell_index(cell_id)
+
+        for dz in ti.static(self.grid_axis_shifts):
+            for dy in ti.static(self.grid_axis_shifts):
+                for dx in ti.static(self.grid_axis_shifts):
+                    nc = self.get_shifted_cell(idx, dx, dy, dz)
+                    if nc >= 0:
+                        for k in range(self.cell_start(nc), self.cell_start(nc + 1)):
+                            j = self.cell_agent(k)
+                            if i == j:
+                                continue
+
+                            rij = self.pbc_dist(xi, self.x[j])
+                            self.accumulate_neighbor(
+                                vi,
+                                self.v[j],
+                                rij,
+                                rij.dot(rij),
+                                vi_norm2,
+                                beta_i,
+                                force,
+                                v_sum,
+                                n_neighbors,
+                            )
+
+        # 2. 掠食者鄰居：Morse + 對齊 + 獵物逃跑（Prey escape force）
+        escape_force = ti.Vector([0.0, 0.0, 0.0])
+        escape_range = 15.0  # 逃跑感知範圍
+
+        if ti.static(has_predators):
+            for k in range(self.n_predators[None]):
+                j = self.predator_indices[k]
                 if i == j:
                     continue
 
                 rij = self.pbc_dist(xi, self.x[j])
                 r2 = rij.dot(rij)
+                self.accumulate_neighbor(
+                    vi, self.v[j], rij, r2, vi_norm2, beta_i, force, v_sum, n_neighbors
+                )
+
+                if ti.static(not is_predator):
+                    # 計算距離
+                    dx = ti.Vector([0.0, 0.0, 0.0])
+                    if ti.static(self.boundary_mode == 0):  # PBC
+                        dx = rij
+                    else:
+                        dx = self.x[j] - xi
 
-                if r2 < 1e-6 or r2 > rc2:
-                    continue
+                    dist = dx.norm()
 
-                r = ti.sqrt(r2)
-                inv_r = 1.0 / r
-
-                # Morse force（無 FOV 限制，保持物理一致性）
-                exp_a = ti.exp(-r * inv_la)
-                exp_r = ti.exp(-r * inv_lr)
-                coeff = Ca * inv_la * exp_a - Cr * inv_lr * exp_r
-                force += coeff * rij * inv_r
-
-                # Alignment force（受 FOV 限制）
-                if beta_i > 0.0:
-                    # FOV 檢查
-                    if self.is_in_fov(vi, rij):
-                        v_sum += self.v[j]
-                        n_neighbors += 1
-
-            # 儲存 Morse 力
-            self.f[i] = force
-
-            # Alignment force
-            if beta_i > 0.0 and n_neighbors > 0:
-                v_avg = v_sum / ti.cast(n_neighbors, ti.f32)
-                self.f[i] += beta_i * (v_avg - vi)
-
-            # Goal seeking force
-            self.f[i] += self.goal_seeking_force(i)
-
-            # Resource-seeking force
-            target_res = self.agent_target_resource[i]
-            if target_res >= 0:
-                if self.resources.resource_active[target_res] == 1:
-                    res_pos = self.resources.resource_pos[target_res]
-
-                    # 計算方向（考慮 PBC）
-                    direction = ti.Vector([0.0, 0.0, 0.0])
-                    if self.params.boundary_mode == 0:  # PBC
-                        direction = self.pbc_dist(xi, res_pos)
-                    else:
-                        direction = res_pos - xi
-
-                    dist = direction.norm()
-
-                    if dist > 1e-6:
-                        # 施加吸引力（類似 goal force）
-                        foraging_strength = 3.0  # 可調整
-                        self.f[i] += foraging_strength * (direction / dist)
-
-            # Predator hunting force (掠食者追捕)
-            if self.agent_type_field[i] == 3 and self.agent_alive[i] == 1:  # PREDATOR
-                target_prey = self.agent_target_prey[i]
-                if target_prey >= 0 and self.agent_alive[target_prey] == 1:
-                    # 計算方向（考慮 PBC）
-                    direction = ti.Vector([0.0, 0.0, 0.0])
-                    if self.params.boundary_mode == 0:  # PBC
-                        direction = self.pbc_dist(xi, self.x[target_prey])
-                    else:
-                        direction = self.x[target_prey] - xi
-
-                    dist = direction.norm()
-
-                    if dist > 1e-6:
-                        # 強力追捕（比覓食更強）
-                        hunt_strength = 5.0
-                        self.f[i] += hunt_strength * (direction / dist)
-
-            # Prey escape force (獵物逃跑)
-            if self.agent_type_field[i] != 3 and self.agent_alive[i] == 1:  # 非掠食者
-                # 檢查附近是否有掠食者
-                escape_force = ti.Vector([0.0, 0.0, 0.0])
-                escape_range = 15.0  # 逃跑感知範圍
-
-                for j in range(self.N):
-                    if (
-                        self.agent_type_field[j] == 3 and self.agent_alive[j] == 1
-                    ):  # 是掠食者
-                        # 計算距離
-                        dx = ti.Vector([0.0, 0.0, 0.0])
-                        if self.params.boundary_mode == 0:  # PBC
-                            dx = self.pbc_dist(xi, self.x[j])
-                        else:
-                            dx = self.x[j] - xi
+                    if dist < escape_range and dist > 1e-6:
+                        # 逃跑力與距離成反比（越近越強）
+                        escape_strength = 8.0 / (dist + 1.0)
+                        escape_force -= escape_strength * (dx / dist)
+
+        # 所有外力先累加在區域變數 f_i，最後只寫回 self.f[i] 一次
+        # （Morse → 對齊 → 目標 → 覓食 → 追捕 → 逃跑 → 障礙物）
+        f_i = force
+
+        # Alignment force
+        if beta_i > 0.0 and n_neighbors > 0:
+            v_avg = v_sum / ti.cast(n_neighbors, ti.f32)
+            f_i += beta_i * (v_avg - vi)
 
-                        dist = dx.norm()
+        # Goal seeking force
+        f_i += self.goal_seeking_force(i)
 
-                        if dist < escape_range and dist > 1e-6:
-                            # 逃跑力與距離成反比（越近越強）
-                            escape_strength = 8.0 / (dist + 1.0)
-                            escape_force -= escape_strength * (dx / dist)
+        # Resource-seeking force
+        target_res = self.agent_target_resource[i]
+        if target_res >= 0:
+            if self.resources.resource_active[target_res] == 1:
+                res_pos = self.resources.resource_pos[target_res]
 
-                self.f[i] += escape_force
+                # 計算方向（考慮 PBC）
+                direction = ti.Vector([0.0, 0.0, 0.0])
+                if ti.static(self.boundary_mode == 0):  # PBC
+                    direction = self.pbc_dist(xi, res_pos)
+                else:
+                    direction = res_pos - xi
 
-            # Obstacle avoidance force
-            for obs_id in range(self.obstacles.n_obstacles):
-                self.f[i] += self.obstacles.compute_obstacle_force(xi, obs_id)
+                dist = direction.norm()
+
+                if dist > 1e-6:
+                    # 施加吸引力（類似 goal force）
+                    foraging_strength = 3.0  # 可調整
+                    f_i += foraging_strength * (direction / dist)
+
+        # Predator hunting force (掠食者追捕)
+        if ti.static(is_predator):
+            target_prey = self.agent_target_prey[i]
+            if target_prey >= 0 and self.is_alive(target_prey) == 1:
+                # 計算方向（考慮 PBC）
+                direction = ti.Vector([0.0, 0.0, 0.0])
+                if ti.static(self.boundary_mode == 0):  # PBC
+                    direction = self.pbc_dist(xi, self.x[target_prey])
+                else:
+                    direction = self.x[target_prey] - xi
+
+                dist = direction.norm()
+
+                if dist > 1e-6:
+                    # 強力追捕（比覓食更強）
+                    hunt_strength = 5.0
+                    f_i += hunt_strength * (direction / dist)
+
+        # Prey escape force（已在掠食者列表走訪中累加）
+        f_i += escape_force
+
+        # Obstacle avoidance force
+        f_i += self.obstacles.compute_total_obstacle_force(xi)
+
+        self.f[i] = f_i
 
     @ti.kernel
     def verlet_step2(self, dt: ti.f32):
@@ -451,19 +586,20 @@ class HeterogeneousFlocking3D(
         Verlet 第二步：使用個體參數
 
         修改：
-            • 使用 mass_individual[i], v0_individual[i], eta_individual[i]
+            • 使用 traits[i] 的 mass、v0、eta
         """
         alpha = self.p[5]
 
         for i in self.v:
-            # 只處理存活的 agents
-            if self.agent_alive[i] == 0:
+            # 只處理存活的 agents（agent_status 由同一步的 compute_forces 打包）
+            if self.is_alive(i) == 0:
                 continue
 
             # 個體參數
-            mass_i = self.mass_individual[i]
-            v0_i = self.v0_individual[i]
-            eta_i = self.eta_individual[i]
+            t = ti.cast(self.traits[i], ti.f32)
+            mass_i = t[TRAIT_MASS]
+            v0_i = t[TRAIT_V0]
+            eta_i = t[TRAIT_ETA]
 
             # 保守力的第二個半步
             a = self.f[i] / mass_i
@@ -479,19 +615,15 @@ class HeterogeneousFlocking3D(
             if eta_i > 0.0:
                 speed = ti.sqrt(v_new.dot(v_new))
                 if speed > 1e-6:
-                    # 更新 RNG 狀態
+                    # 更新 RNG 狀態（一次產生 3 個隨機數）
                     state = self.rng_state[i]
+                    rand = self.gen3_uniform(state)
 
                     # Random 1: 旋轉角度
-                    state = self.xorshift32(state)
-                    rand1 = self.rand_uniform(state)
-                    noise_angle = (rand1 - 0.5) * 2.0 * eta_i
+                    noise_angle = (rand[0] - 0.5) * 2.0 * eta_i
 
                     # Random 2-3: 隨機旋轉軸
-                    state = self.xorshift32(state)
-                    rand2 = self.rand_uniform(state)
-                    state = self.xorshift32(state)
-                    rand3 = self.rand_uniform(state)
+                    rand2, rand3 = rand[1], rand[2]
 
                     u = rand2 * 2.0 - 1.0
                     v = rand3 * 2.0 - 1.0
@@ -567,15 +699,23 @@ class HeterogeneousFlocking3D(
         Returns:
             障礙物 ID
         """
+        self.forces_valid = False
         return self.obstacles.add_obstacle(config)
 
     def remove_obstacle(self, obs_id: int):
         """移除障礙物"""
         self.obstacles.remove_obstacle(obs_id)
+        self.forces_valid = False
 
     def update_obstacle_position(self, obs_id: int, new_pos: np.ndarray):
         """更新障礙物位置（支援動態障礙物）"""
         self.obstacles.update_obstacle_position(obs_id, new_pos)
+        self.forces_valid = False
+
+    def update_obstacle_positions(self, obs_ids: np.ndarray, new_pos: np.ndarray):
+        """批次更新多個障礙物位置（單一 kernel launch）"""
+        self.obstacles.update_obstacle_positions(obs_ids, new_pos)
+        self.forces_valid = False
 
     def get_obstacle_info(self, obs_id: int) -> dict:
         """獲取障礙物資訊"""
@@ -589,66 +729,75 @@ class HeterogeneousFlocking3D(
     # Spatial Grid Methods (overrides from SpatialGridMixin)
     # ========================================================================
     @ti.kernel
-    def assign_agents_to_grid(self):
+    def _assign_agents_to_grid(self, init_groups: ti.template()):
         """
         將所有 agent 分配到對應的 spatial grid cell
         時間複雜度：O(N)
 
         Override: 排除掠食者（type=3）不參與 Grid
+
+        Args:
+            init_groups: 編譯期旗標；True 時同時寫入初始 group_id
         """
-        # 重置 cell_count
         for c in self.cell_count:
             self.cell_count[c] = 0
 
         # 分配 agents 到 Grid（排除掠食者）
         for i in self.x:
+            # 順便打包 agent_status，供之後的熱迴圈只讀 1 byte
+            alive = self.agent_alive[i]
+            agent_type = self.agent_type_field[i]
+            self.agent_status[i] = ti.cast(
+                (alive << 7) | (agent_type & STATUS_TYPE_MASK), ti.u8
+            )
+            if ti.static(init_groups):
+                self.group_id[i] = i if self.joins_groups(i) else -1
+
             # 只處理存活的 agents
-            if self.agent_alive[i] == 0:
+            if alive == 0:
                 self.agent_cell_id[i] = -1
                 continue
 
             # 排除掠食者
-            if self.agent_type_field[i] == 3:
+            if agent_type == 3:
                 self.agent_cell_id[i] = -1
                 continue
 
             cell_id = self.get_cell_id(self.x[i])
             self.agent_cell_id[i] = cell_id
+            ti.atomic_add(self.cell_count[cell_id], 1)
 
-            # 原子操作：計數該 cell 的 agent 數量
-            old_count = ti.atomic_add(self.cell_count[cell_id], 1)
-
-            # 將 agent 加入該 cell（如果未滿）
-            if old_count < self.max_agents_per_cell:
-                self.cell_agents[cell_id, old_count] = i
+        # counting sort：prefix sum → 依 cell 散佈到 sorted_agents
+        self.scan_cell_counts()
+        self.scatter_agents_to_cells()
 
     # ========================================================================
     # Group Detection Methods (Override GroupDetectionMixin)
     # ========================================================================
     @ti.kernel
-    def detect_groups_iteration(self, r_cluster: ti.f32, theta_cluster: ti.f32):
+    def detect_groups_iteration(self, r_cluster: ti.f32, cos_theta_cluster: ti.f32):
         """
         Override: 排除掠食者（type=3）不參與群組檢測
 
         執行單次群組偵測迭代（label propagation 的一輪）
         使用 Spatial Grid 加速鄰居搜尋：O(N) 取代 O(N²)
         """
-        for i in self.x:
-            # 只處理存活的 agents
-            if self.agent_alive[i] == 0:
-                self.group_id[i] = -1
-                continue
+        self.labels_changed[None] = 0
+        r_cluster_sq = r_cluster * r_cluster
 
-            # 排除掠食者（type=3）不參與群組檢測
-            if self.agent_type_field[i] == 3:
-                self.group_id[i] = -1
+        for i in self.x:
+            # 死亡 agent 與掠食者（type=3）不參與群組檢測
+            if self.is_alive(i) == 0 or self.get_type(i) == 3:
+                if self.group_id[i] != -1:
+                    self.labels_changed[None] += 1
+                    self.group_id[i] = -1
                 continue
 
             xi = self.x[i]
             vi = self.v[i]
-            vi_norm = vi.norm()
+            vi2 = vi.dot(vi)  # 整個鄰居迴圈共用
 
-            if vi_norm < 1e-6:
+            if vi2 < 1e-12:
                 continue
 
             current_group = self.group_id[i]
@@ -661,10 +810,8 @@ class HeterogeneousFlocking3D(
 
             # 解析 cell_id 為 3D index
             res = self.grid_resolution
-            iz = cell_id // (res * res)
-            remainder = cell_id % (res * res)
-            iy = remainder // res
-            ix = remainder % res
+            idx = self.get_cell_index(cell_id)
+            ix, iy, iz = idx[0], idx[1], idx[2]
 
             # 檢查 3×3×3=27 個相鄰 cell
             for dz in ti.static(range(-1, 2)):
@@ -682,44 +829,40 @@ class HeterogeneousFlocking3D(
                             and nz >= 0
                             and nz < res
                         ):
-                            neighbor_cell = nx + ny * res + nz * res * res
-
-                            n_agents_in_cell = self.cell_count[neighbor_cell]
-                            for local_idx in range(n_agents_in_cell):
-                                if local_idx >= self.max_agents_per_cell:
-                                    break
+                            neighbor_cell = self.encode_cell(nx, ny, nz)
 
-                                j = self.cell_agents[neighbor_cell, local_idx]
+                            # 檢查該 cell 中的所有 agents
+                            start = self.cell_start(neighbor_cell)
+                            end = self.cell_start(neighbor_cell + 1)
+                            for k in range(start, end):
+                                j = self.cell_agent(k)
                                 if i == j:
                                     continue
 
                                 # 排除掠食者
-                                if self.agent_type_field[j] == 3:
+                                if self.get_type(j) == 3:
                                     continue
 
                                 xj = self.x[j]
                                 vj = self.v[j]
-                                vj_norm = vj.norm()
+                                vj2 = vj.dot(vj)
 
-                                if vj_norm < 1e-6:
+                                if vj2 < 1e-12:
                                     continue
 
-                                # 計算距離（考慮 PBC）
-                                distance = 0.0
-                                if self.params.boundary_mode == 0:
-                                    distance = self.pbc_dist(xi, xj).norm()
-                                else:
-                                    distance = (xj - xi).norm()
+                                # 計算距離平方（考慮 PBC）
+                                rij = xj - xi
+                                if ti.static(self.boundary_mode == 0):
+                                    rij = self.pbc_dist(xi, xj)
 
-                                if distance > r_cluster:
+                                if rij.dot(rij) > r_cluster_sq:
                                     continue
 
                                 # 檢查速度夾角
-                                cos_angle = (vi.dot(vj)) / (vi_norm * vj_norm)
-                                cos_angle = ti.max(-1.0, ti.min(1.0, cos_angle))
-                                angle = ti.acos(cos_angle)
-
-                                if angle > theta_cluster:
+                                # 夾角 > θ ⇔ cos 夾角 < cos θ（以平方形式比較，免開根號）
+                                if not self.velocities_aligned(
+                                    vi.dot(vj), vi2, vj2, cos_theta_cluster
+                                ):
                                     continue
 
                                 # 取較小的 group_id
@@ -727,40 +870,38 @@ class HeterogeneousFlocking3D(
                                 if neighbor_group < min_group:
                                     min_group = neighbor_group
 
-            self.group_id[i] = min_group
+            if min_group != current_group:
+                self.labels_changed[None] += 1
+                self.group_id[i] = min_group
 
     @ti.kernel
-    def compute_group_statistics(self):
+    def update_targets(self) -> ti.i32:
         """
-        Override: 排除掠食者不參與群組統計
+        一次走訪同時更新資源目標與獵物目標
+
+        等同依序呼叫 find_nearest_resources() 與 find_nearest_prey()：
+        每個 agent 只寫入自己的目標，兩者之間沒有相依，因此合併成單一 kernel。
+
+        Returns:
+            目標有變動的 agent 數（> 0 時上一步留下的 f 已不適用）
         """
-        # 重置統計資訊
-        for g in range(self.max_groups):
-            self.group_size[g] = 0
-            self.group_centroid[g] = ti.Vector([0.0, 0.0, 0.0])
-            self.group_velocity[g] = ti.Vector([0.0, 0.0, 0.0])
-            self.group_active[g] = 0
-
-        # 計算群組總和（排除掠食者）
+        n_changed = 0
         for i in self.x:
-            if self.agent_type_field[i] == 3:
+            if self.agent_alive[i] == 0:
                 continue
 
-            gid = self.group_id[i]
-            if gid >= 0 and gid < self.max_groups:
-                ti.atomic_add(self.group_size[gid], 1)
-                for d in ti.static(range(3)):
-                    ti.atomic_add(self.group_centroid[gid][d], self.x[i][d])
-                    ti.atomic_add(self.group_velocity[gid][d], self.v[i][d])
-
-        # 計算平均值
-        for g in range(self.max_groups):
-            size = self.group_size[g]
-            if size > 0:
-                self.group_active[g] = 1
-                for d in ti.static(range(3)):
-                    self.group_centroid[g][d] /= ti.cast(size, ti.f32)
-                    self.group_velocity[g][d] /= ti.cast(size, ti.f32)
+            old_res = self.agent_target_resource[i]
+            old_prey = self.agent_target_prey[i]
+            self.update_resource_target(i)
+            if self.agent_type_field[i] == 3:
+                self.update_prey_target(i)
+
+            if (
+                self.agent_target_resource[i] != old_res
+                or self.agent_target_prey[i] != old_prey
+            ):
+                n_changed += 1
+        return n_changed
 
     def step(self, dt: float):
         """
@@ -768,21 +909,30 @@ class HeterogeneousFlocking3D(
 
         整合順序：
             1. 更新資源與獵物目標
-            2. 計算力（包含捕食/逃脫力）
+            2. 計算力（包含捕食/逃脫力，每步一次）
             3. Verlet 積分器
             4. 資源消耗與捕食攻擊
             5. 資源再生
             6. 群組檢測（每 N 步執行一次）
         """
-        # 1. 更新目標
-        self.find_nearest_resources()  # 低能量 agent 尋找資源
-        self.find_nearest_prey()  # 捕食者鎖定獵物
+        # 是否執行群組檢測在 kernel 佇列之前決定，step_counter 於最後更新
+        # 第一步（step_counter=0）強制執行一次，確保有初始群組資料
+        detect_groups = (
+            self.step_counter == 0 or self.step_counter >= self.group_detection_interval
+        )
+
+        # 1. 更新目標（低能量 agent 尋找資源、捕食者鎖定獵物）
+        if self.update_targets() > 0:
+            self.forces_valid = False
 
         # 2-3. 物理更新（Velocity Verlet）
-        self.compute_forces()  # 計算所有力（含捕食/逃脫）
+        # 第一個半步沿用上一步結尾的 f = F(t)，每步只需計算一次力
+        if not self.forces_valid:
+            self.compute_forces()  # 計算所有力（含捕食/逃脫）
         self.verlet_step1(dt)
         self.compute_forces()
         self.verlet_step2(dt)
+        self.forces_valid = True
 
         # 4. 生態互動
         # 4.1 資源消耗（含速度相關能量消耗與資源競爭）
@@ -802,13 +952,12 @@ class HeterogeneousFlocking3D(
         self.resources.replenish_resources()  # 資源再生
 
         # 6. 群組檢測（每 N 步執行一次以減少計算負擔）
-        # 第一步（step_counter=0）強制執行一次，確保有初始群組資料
         # 降低迭代次數：5 → 3（Label Propagation 收斂很快）
-        if self.step_counter == 0 or self.step_counter >= self.group_detection_interval:
+        if detect_groups:
             self.update_groups(r_cluster=5.0, theta_cluster=30.0, n_iterations=3)
-            self.step_counter = 1  # 重置為 1（下次在 interval 時執行）
-        else:
-            self.step_counter += 1
+
+        # 重置為 1（下次在 interval 時執行）
+        self.step_counter = 1 if detect_groups else self.step_counter + 1
 
     # ========================================================================
     # Query API (for testing and monitoring)
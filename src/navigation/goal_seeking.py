@@ -29,12 +29,13 @@ class NavigationMixin:
     Fields (動態建立):
         goal: ti.Vector.field(3, ti.f32, N) - 每個 agent 的目標位置
         has_goal: ti.field(ti.i32, N) - 是否有目標（0/1）
-        goal_strength: ti.field(ti.f32, N) - 目標導向力強度
+        goal_strength: ti.field(ti.f16, N) - 目標導向力強度（f16 儲存，f32 計算）
 
     Methods:
         init_navigation(N): 初始化導航系統
         set_goals(goals, agent_indices): 設定 agent 的目標位置
         clear_goals(agent_indices): 清除 agent 的目標
+        invalidate_goal_strength_cache(): 直接寫入 goal_strength 後丟棄 host 端鏡像
         goal_seeking_force(i): 計算目標導向力（Taichi function）
 
     Usage:
@@ -50,12 +51,14 @@ class NavigationMixin:
                     self.f[i] += self.goal_seeking_force(i)
     """
 
-    def init_navigation(self, N: int):
+    def init_navigation(self, N: int, verbose: bool = False):
         """
         初始化導航系統
 
         Args:
             N: Agent 數量
+            verbose: set_goals / clear_goals 每次呼叫是否印出訊息
+                     （每幀更新目標時應保持 False）
 
         Side Effects:
             建立以下 Taichi fields:
@@ -69,12 +72,19 @@ class NavigationMixin:
         """
         self.goal = ti.Vector.field(3, ti.f32, N)
         self.has_goal = ti.field(ti.i32, N)
-        self.goal_strength = ti.field(ti.f32, N)
+        # 強度為使用者常數，f16 儲存即足夠；kernel 內轉回 f32 計算
+        self.goal_strength = ti.field(ti.f16, N)
 
         # 預設值：無目標
         self.has_goal.fill(0)
         self.goal_strength.fill(0.0)
 
+        # goal_strength 的 host 端鏡像（供 set_goals 自動選擇使用）；
+        # None 表示尚未建立，第一次需要時才 to_numpy 一次
+        self._goal_strength_np = None
+
+        self._nav_verbose = verbose
+
         print(f"[NavigationMixin] Initialized for N={N} agents")
 
     def set_goals(self, goals: np.ndarray, agent_indices: Optional[np.ndarray] = None):
@@ -101,23 +111,42 @@ class NavigationMixin:
             goals = np.array([[10, 10, 10]])
             system.set_goals(goals)  # 選擇第一個 goal_strength > 0 的 agent
         """
-        goals = np.atleast_2d(goals).astype(np.float32)
+        # 已是 C-contiguous float32 時不複製；單一目標 (3,) 直接 reshape 成 view
+        goals = np.ascontiguousarray(goals, dtype=np.float32)
+        if goals.ndim == 1:
+            goals = goals.reshape(1, 3)
 
         if agent_indices is None:
-            # 自動選擇：goal_strength > 0 的 agent
-            goal_strength_arr = self.goal_strength.to_numpy()
-            agent_indices = np.where(goal_strength_arr > 0)[0]
+            # 自動選擇：goal_strength > 0 的 agent（讀 host 端鏡像，不必每次 to_numpy）
+            if self._goal_strength_np is None:
+                self._goal_strength_np = self.goal_strength.to_numpy()
+            agent_indices = np.where(self._goal_strength_np > 0)[0]
 
         assert len(goals) == len(agent_indices), (
             f"goals 數量 ({len(goals)}) 必須與 agent_indices 數量 ({len(agent_indices)}) 相同"
         )
 
-        # 設定目標
-        for i, idx in enumerate(agent_indices):
-            self.goal[idx] = goals[i]
-            self.has_goal[idx] = 1
+        # 設定目標：在 NumPy 端 scatter 後整批寫回，避免逐筆 Python→Taichi 寫入
+        agent_indices = np.asarray(agent_indices, dtype=np.int64)
+        goal_arr = self.goal.to_numpy()
+        has_goal_arr = self.has_goal.to_numpy()
+        goal_arr[agent_indices] = goals
+        has_goal_arr[agent_indices] = 1
+        self.goal.from_numpy(goal_arr)
+        self.has_goal.from_numpy(has_goal_arr)
+        self.forces_valid = False  # 沿用的 f 不含新目標的導向力
+
+        if self._nav_verbose:
+            print(f"[NavigationMixin] Set goals for {len(agent_indices)} agents")
+
+    def invalidate_goal_strength_cache(self):
+        """
+        丟棄 goal_strength 的 host 端鏡像
 
-        print(f"[NavigationMixin] Set goals for {len(agent_indices)} agents")
+        直接寫入 self.goal_strength 後呼叫，下次 set_goals 自動選擇時會重新讀取
+        """
+        self._goal_strength_np = None
+        self.forces_valid = False
 
     def clear_goals(self, agent_indices: Optional[np.ndarray] = None):
         """
@@ -134,15 +163,21 @@ class NavigationMixin:
             # 清除所有目標
             system.clear_goals()
         """
+        self.forces_valid = False
         if agent_indices is None:
             # 清除所有目標
             self.has_goal.fill(0)
-            print("[NavigationMixin] Cleared all goals")
+            if self._nav_verbose:
+                print("[NavigationMixin] Cleared all goals")
         else:
-            # 清除特定 agent 的目標
-            for idx in agent_indices:
-                self.has_goal[idx] = 0
-            print(f"[NavigationMixin] Cleared goals for {len(agent_indices)} agents")
+            # 清除特定 agent 的目標（整批寫回）
+            has_goal_arr = self.has_goal.to_numpy()
+            has_goal_arr[np.asarray(agent_indices, dtype=np.int64)] = 0
+            self.has_goal.from_numpy(has_goal_arr)
+            if self._nav_verbose:
+                print(
+                    f"[NavigationMixin] Cleared goals for {len(agent_indices)} agents"
+                )
 
     @ti.func
     def goal_seeking_force(self, i: ti.i32) -> ti.math.vec3:
@@ -159,14 +194,15 @@ class NavigationMixin:
               F = goal_strength * direction / distance
 
         Algorithm:
-            1. 檢查 has_goal[i] == 1
-            2. 使用 pbc_dist() 計算最短路徑方向
-            3. 標準化方向 × goal_strength
+            1. 使用 pbc_dist() 計算最短路徑方向
+            2. 標準化方向 × goal_strength
+            3. 乘上 has_goal[i]（0/1）作為遮罩，無目標時歸零
 
         Notes:
             • 這是 @ti.func，只能在 @ti.kernel 中呼叫
             • 使用 pbc_dist() 確保 PBC 下正確導向
-            • distance < 1e-6 時避免除以零
+            • |direction|² 下限取 1e-12 避免除以零（此時 direction 亦趨近零）
+            • 不以 if 分支跳過無目標的 agent，避免 GPU warp divergence
 
         Example:
             @ti.kernel
@@ -174,18 +210,16 @@ class NavigationMixin:
                 for i in self.x:
                     self.f[i] += self.goal_seeking_force(i)
         """
-        force = ti.Vector([0.0, 0.0, 0.0])
-
-        if self.has_goal[i] == 1:
-            # 使用 PBC-aware 距離計算
-            direction = self.pbc_dist(self.x[i], self.goal[i])
-            distance = direction.norm()
-
-            if distance > 1e-6:
-                # 標準化方向 × 強度
-                force = self.goal_strength[i] * direction / distance
+        # 無分支寫法：一律計算，再乘上 has_goal（0/1）轉成的 f32 遮罩
+        # 使用 PBC-aware 距離計算
+        direction = self.pbc_dist(self.x[i], self.goal[i])
+        # 以 rsqrt 一次得到 1/|direction|（取代 sqrt + 除法）；下限 1e-12 即距離 1e-6
+        inv_dist = ti.rsqrt(ti.max(direction.dot(direction), 1e-12))
 
-        return force
+        # 標準化方向 × 強度
+        active = ti.cast(self.has_goal[i], ti.f32)
+        strength = ti.cast(self.goal_strength[i], ti.f32)
+        return active * (strength * direction * inv_dist)
 
 
 # ============================================================================
@@ -212,7 +246,10 @@ def set_leader_goals(
         system = HeterogeneousFlocking3D(...)
         set_leader_goals(system, goal_position=[25.0, 25.0, 25.0])
     """
-    agent_types = system.agent_type.to_numpy()
+    # 優先讀 host 端類型鏡像（HeterogeneousFlocking3D.agent_types_np），避免每次 to_numpy
+    agent_types = getattr(system, "agent_types_np", None)
+    if agent_types is None:
+        agent_types = system.agent_type_field.to_numpy()
     leader_indices = np.where(agent_types == leader_type)[0]
 
     if len(leader_indices) == 0:
@@ -221,4 +258,5 @@ def set_leader_goals(
 
     goals = np.tile(goal_position, (len(leader_indices), 1))
     system.set_goals(goals, leader_indices)
-    print(f"[set_leader_goals] Set goal for {len(leader_indices)} LEADERs")
+    if system._nav_verbose:
+        print(f"[set_leader_goals] Set goal for {len(leader_indices)} LEADERs")
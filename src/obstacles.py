@@ -21,6 +21,10 @@ from typing import List, Optional, Tuple
 import numpy as np
 import taichi as ti
 
+# 障礙物網格每軸最多的 cell 數：記憶體為 G³ × max_obstacles 個 i32，
+# 32³ × 32 ≈ 4 MB；box 再大時 cell 邊長跟著放大，不再增加 cell 數
+OBSTACLE_GRID_MAX_RES = 32
+
 
 class ObstacleType(IntEnum):
     """障礙物類型"""
@@ -52,28 +56,81 @@ class ObstacleSystem:
         • 管理多個障礙物
         • 計算 agent-obstacle 排斥力
         • 支援動態更新障礙物位置
+        • 可選的障礙物均勻網格：每個點只測試所在 cell 內的障礙物
     """
 
-    def __init__(self, max_obstacles: int = 32):
+    def __init__(
+        self,
+        max_obstacles: int = 32,
+        use_fast_decay: bool = False,
+        domain_size: Optional[float] = None,
+        grid_cell_size: float = 6.0,
+    ):
         """
         初始化障礙物系統
 
         Args:
             max_obstacles: 最大障礙物數量
+            use_fast_decay: 以多項式 fast_decay 取代 exp 衰減（編譯期切換）
+            domain_size: 模擬區域邊長（以原點為中心）；給定時建立障礙物網格，
+                         None 則逐一測試所有障礙物
+            grid_cell_size: 障礙物網格的 cell 最小邊長（預設 = 預設 decay 的截斷距離 3*2.0）；
+                            每軸 cell 數上限為 OBSTACLE_GRID_MAX_RES
         """
         self.max_obstacles = max_obstacles
+        self.use_fast_decay = use_fast_decay
         self.n_obstacles = 0
 
-        # Taichi fields
-        self.obstacle_type = ti.field(ti.i32, max_obstacles)
-        self.obstacle_pos = ti.Vector.field(3, ti.f32, max_obstacles)
-        self.obstacle_params = ti.Vector.field(4, ti.f32, max_obstacles)
-        self.obstacle_strength = ti.field(ti.f32, max_obstacles)
-        self.obstacle_decay = ti.field(ti.f32, max_obstacles)
-        self.obstacle_active = ti.field(ti.i32, max_obstacles)  # 0/1
+        # Taichi fields：每個障礙物的所有屬性打包在同一個 struct（AoS），
+        # 力計算迴圈讀一個障礙物只碰到連續的一小段記憶體
+        #   type: ObstacleType, pos: 中心, params: 形狀參數,
+        #   strength / decay: 排斥力強度與衰減長度, active: 0/1
+        #   inv_decay / cutoff: 1/decay 與 3*decay，新增時預先算好，力迴圈內免除法
+        # strength / decay / inv_decay 是使用者給的常數（只需約 3 位有效數字），
+        # 以 f16 儲存、讀取時轉回 f32 計算；位置、形狀參數與 cutoff 屬於距離，維持 f32
+        self.obstacle_data = ti.Struct.field(
+            {
+                "type": ti.i32,
+                "pos": ti.math.vec3,
+                "params": ti.math.vec4,
+                "strength": ti.f16,
+                "decay": ti.f16,
+                "active": ti.i32,
+                "inv_decay": ti.f16,
+                "cutoff": ti.f32,
+            },
+            shape=max_obstacles,
+        )
+        # n_obstacles 的 device 端副本：kernel 內的 Python 屬性在編譯時就被固定，
+        # 第一次編譯後才新增的障礙物必須透過 field 才讀得到
+        self.obstacle_count = ti.field(ti.i32, ())
 
         # 初始化為 inactive
-        self.obstacle_active.fill(0)
+        self.obstacle_data.active.fill(0)
+
+        # 障礙物網格（broad phase）：每個障礙物登錄到「包圍球半徑 + cutoff」
+        # 的 AABB 所覆蓋的所有 cell，查詢時只需看點所在的單一 cell
+        # 每個 cell 容量 = max_obstacles，不會溢位
+        self.use_grid = domain_size is not None
+        if self.use_grid:
+            self.grid_n = int(np.ceil(domain_size / grid_cell_size))
+            self.grid_n = min(max(self.grid_n, 1), OBSTACLE_GRID_MAX_RES)
+            self.grid_cell_size = domain_size / self.grid_n
+            self.grid_origin = -0.5 * domain_size
+            total_cells = self.grid_n**3
+            self.obstacle_cell_count = ti.field(ti.i32, total_cells)
+            self.obstacle_cell_list = ti.field(ti.i32, (total_cells, max_obstacles))
+
+            # host 端鏡像：網格內容與每個障礙物登錄的 cell，
+            # 新增/移除/移動時只改動並上傳受影響的 cell
+            self._host_cell_count = np.zeros(total_cells, dtype=np.int32)
+            self._host_cell_list = np.zeros(
+                (total_cells, max_obstacles), dtype=np.int32
+            )
+            self._host_obstacle_cells = [
+                np.zeros(0, dtype=np.int64) for _ in range(max_obstacles)
+            ]
+            self._host_reach = np.zeros(max_obstacles, dtype=np.float32)
 
     def add_obstacle(self, config: ObstacleConfig) -> int:
         """
@@ -95,32 +152,152 @@ class ObstacleSystem:
         self.n_obstacles += 1
 
         # 寫入資料
-        obstacle_type_np = np.array([config.obstacle_type], dtype=np.int32)
-        obstacle_pos_np = config.position.astype(np.float32)
-        obstacle_params_np = config.params.astype(np.float32)
-        obstacle_strength_np = np.array([config.strength], dtype=np.float32)
-        obstacle_decay_np = np.array([config.decay_length], dtype=np.float32)
-        obstacle_active_np = np.array([1], dtype=np.int32)
-
-        # 使用 from_numpy 寫入單個元素
-        self.obstacle_type[obs_id] = obstacle_type_np[0]
-        self.obstacle_pos[obs_id] = obstacle_pos_np
-        self.obstacle_params[obs_id] = obstacle_params_np
-        self.obstacle_strength[obs_id] = obstacle_strength_np[0]
-        self.obstacle_decay[obs_id] = obstacle_decay_np[0]
-        self.obstacle_active[obs_id] = obstacle_active_np[0]
+        data = self.obstacle_data
+        data.type[obs_id] = int(config.obstacle_type)
+        data.pos[obs_id] = config.position.astype(np.float32)
+        data.params[obs_id] = config.params.astype(np.float32)
+        data.strength[obs_id] = config.strength
+        data.decay[obs_id] = config.decay_length
+        data.inv_decay[obs_id] = 1.0 / config.decay_length
+        data.cutoff[obs_id] = 3.0 * config.decay_length
+        data.active[obs_id] = 1
+        self.obstacle_count[None] = self.n_obstacles
+
+        if self.use_grid:
+            self._host_reach[obs_id] = (
+                _bounding_radius(config) + 3.0 * config.decay_length
+            )
+            self._upload_cells(self._move_in_grid(obs_id, config.position))
 
         return obs_id
 
     def remove_obstacle(self, obs_id: int):
         """移除障礙物（標記為 inactive）"""
         if 0 <= obs_id < self.n_obstacles:
-            self.obstacle_active[obs_id] = 0
+            self.obstacle_data.active[obs_id] = 0
+            if self.use_grid:
+                self._upload_cells(self._move_in_grid(obs_id, None))
 
     def update_obstacle_position(self, obs_id: int, new_pos: np.ndarray):
         """更新障礙物位置（支援動態障礙物）"""
         if 0 <= obs_id < self.n_obstacles:
-            self.obstacle_pos[obs_id] = new_pos.astype(np.float32)
+            self.obstacle_data.pos[obs_id] = new_pos.astype(np.float32)
+            if self.use_grid and self._host_obstacle_cells[obs_id].size > 0:
+                self._upload_cells(self._move_in_grid(obs_id, new_pos))
+
+    def update_obstacle_positions(self, obs_ids: np.ndarray, new_pos: np.ndarray):
+        """
+        批次更新多個障礙物位置（每幀移動多個障礙物時使用）
+
+        邊界檢查以 NumPy 一次完成，位置以單一 kernel 寫入，受影響的 cell 一次上傳；
+        不合法的 ID 直接略過（與 update_obstacle_position 相同）
+
+        Args:
+            obs_ids: 障礙物 ID (M,)
+            new_pos: 新位置 (M, 3)
+        """
+        obs_ids = np.asarray(obs_ids, dtype=np.int32)
+        new_pos = np.ascontiguousarray(new_pos, dtype=np.float32).reshape(-1, 3)
+        valid = (obs_ids >= 0) & (obs_ids < self.n_obstacles)
+        if not valid.all():
+            obs_ids, new_pos = obs_ids[valid], new_pos[valid]
+        if len(obs_ids) == 0:
+            return
+
+        self._scatter_positions(obs_ids, new_pos)
+        if self.use_grid:
+            changed = [
+                self._move_in_grid(obs_id, pos)
+                for obs_id, pos in zip(obs_ids, new_pos)
+                if self._host_obstacle_cells[obs_id].size > 0
+            ]
+            if changed:
+                self._upload_cells(np.unique(np.concatenate(changed)))
+
+    @ti.kernel
+    def _scatter_positions(self, idx: ti.types.ndarray(), pos: ti.types.ndarray()):
+        """將 pos[k] 寫入 obstacle_data[idx[k]].pos"""
+        for k in range(idx.shape[0]):
+            self.obstacle_data[idx[k]].pos = ti.Vector(
+                [pos[k, 0], pos[k, 1], pos[k, 2]]
+            )
+
+    def _move_in_grid(self, obs_id: int, pos: Optional[np.ndarray]) -> np.ndarray:
+        """
+        在 host 端鏡像把障礙物從舊登錄的 cell 移到 pos 的 AABB 覆蓋的 cell
+
+        pos = None 表示移除。舊 cell 以「與最後一筆交換」刪除，新 cell 附加在尾端；
+        超出區域的 AABB 夾到邊界 cell，區域外的查詢點同樣夾到邊界 cell，仍保守正確
+
+        Returns:
+            內容有變動的 cell ID（尚未上傳）
+        """
+        G = self.grid_n
+        counts, cells = self._host_cell_count, self._host_cell_list
+
+        old = self._host_obstacle_cells[obs_id]
+        if old.size > 0:
+            slot = np.argmax(cells[old] == obs_id, axis=1)
+            last = counts[old] - 1
+            cells[old, slot] = cells[old, last]
+            cells[old, last] = 0
+            counts[old] -= 1
+
+        new = np.zeros(0, dtype=np.int64)
+        if pos is not None:
+            reach = self._host_reach[obs_id]
+            lo = self._cell_coord_np(pos - reach)
+            hi = self._cell_coord_np(pos + reach)
+            ix, iy, iz = np.meshgrid(
+                np.arange(lo[0], hi[0] + 1),
+                np.arange(lo[1], hi[1] + 1),
+                np.arange(lo[2], hi[2] + 1),
+                indexing="ij",
+            )
+            new = (ix + iy * G + iz * G * G).ravel()
+            cells[new, counts[new]] = obs_id
+            counts[new] += 1
+        self._host_obstacle_cells[obs_id] = new
+
+        return np.union1d(old, new)
+
+    def _upload_cells(self, cell_ids: np.ndarray):
+        """將 host 端鏡像中 cell_ids 的內容寫回 device（單一 kernel，只傳受影響的 cell）"""
+        if len(cell_ids) == 0:
+            return
+        cell_ids = np.ascontiguousarray(cell_ids, dtype=np.int32)
+        self._scatter_cells(
+            cell_ids,
+            self._host_cell_count[cell_ids],
+            np.ascontiguousarray(self._host_cell_list[cell_ids]),
+        )
+
+    @ti.kernel
+    def _scatter_cells(
+        self,
+        cell_ids: ti.types.ndarray(),
+        counts: ti.types.ndarray(),
+        rows: ti.types.ndarray(),
+    ):
+        """obstacle_cell_count / obstacle_cell_list 的第 cell_ids[k] 列改為 counts[k] / rows[k]"""
+        for k in range(cell_ids.shape[0]):
+            c = cell_ids[k]
+            self.obstacle_cell_count[c] = counts[k]
+            for j in range(rows.shape[1]):
+                self.obstacle_cell_list[c, j] = rows[k, j]
+
+    def _cell_coord_np(self, p: np.ndarray) -> np.ndarray:
+        """座標 → 夾在網格範圍內的 cell 座標（host 端）"""
+        c = np.floor((p - self.grid_origin) / self.grid_cell_size).astype(np.int64)
+        return np.clip(c, 0, self.grid_n - 1)
+
+    @ti.func
+    def get_obstacle_cell(self, p: ti.math.vec3) -> ti.i32:
+        """座標 → 障礙物網格 cell ID（夾在網格範圍內）"""
+        G = self.grid_n
+        c = ti.floor((p - self.grid_origin) / self.grid_cell_size, ti.i32)
+        c = ti.math.clamp(c, 0, G - 1)
+        return c[0] + c[1] * G + c[2] * G * G
 
     @ti.func
     def sdf_sphere(
@@ -160,6 +337,90 @@ class ObstacleSystem:
 
         return outside_dist + inside_dist
 
+    # ------------------------------------------------------------------------
+    # SDF + 解析法向量：回傳 vec4 = (距離, 單位法向量 xyz)
+    # 法向量即 SDF 梯度，指向遠離障礙物；退化點（如球心）回傳零向量
+    # ------------------------------------------------------------------------
+    @ti.func
+    def sdf_sphere_grad(
+        self, p: ti.math.vec3, center: ti.math.vec3, radius: ti.f32
+    ) -> ti.math.vec4:
+        """球體的 SDF 與法向量：n = (p - c) / |p - c|"""
+        r = p - center
+        r_norm = r.norm()
+        normal = ti.Vector([0.0, 0.0, 0.0])
+        if r_norm > 1e-6:
+            normal = r / r_norm
+        return ti.Vector([r_norm - radius, normal.x, normal.y, normal.z])
+
+    @ti.func
+    def sdf_box_grad(
+        self, p: ti.math.vec3, center: ti.math.vec3, half_extents: ti.math.vec3
+    ) -> ti.math.vec4:
+        """
+        長方體的 SDF 與法向量（軸對齊）
+
+        外部：sign(p - c) ⊙ max(q, 0) / |max(q, 0)|（最近的面、邊或角）
+        內部：沿最靠近的面（q 最大的軸）向外
+        """
+        r = p - center
+        s = ti.select(r >= 0.0, 1.0, -1.0)
+        q = ti.abs(r) - half_extents
+        q_out = ti.max(q, 0.0)
+        outside_dist = q_out.norm()
+        q_max = ti.max(q.x, ti.max(q.y, q.z))
+
+        distance = outside_dist + ti.min(q_max, 0.0)
+        normal = ti.Vector([0.0, 0.0, 0.0])
+        if outside_dist > 1e-6:
+            normal = s * q_out / outside_dist
+        elif q.x >= q.y and q.x >= q.z:
+            normal = ti.Vector([s.x, 0.0, 0.0])
+        elif q.y >= q.z:
+            normal = ti.Vector([0.0, s.y, 0.0])
+        else:
+            normal = ti.Vector([0.0, 0.0, s.z])
+        return ti.Vector([distance, normal.x, normal.y, normal.z])
+
+    @ti.func
+    def sdf_cylinder_grad(
+        self,
+        p: ti.math.vec3,
+        center: ti.math.vec3,
+        radius: ti.f32,
+        half_height: ti.f32,
+    ) -> ti.math.vec4:
+        """
+        圓柱體的 SDF 與法向量（沿 z 軸）
+
+        法向量由 xy 徑向分量與 z 軸向分量組成，權重同 SDF 的外部 / 內部分解
+        """
+        p_rel = p - center
+        rho = ti.sqrt(p_rel.x * p_rel.x + p_rel.y * p_rel.y)
+        d_xy = rho - radius
+        d_z = ti.abs(p_rel.z) - half_height
+
+        radial = ti.Vector([0.0, 0.0])
+        if rho > 1e-6:
+            radial = ti.Vector([p_rel.x, p_rel.y]) / rho
+        s_z = 1.0 if p_rel.z >= 0.0 else -1.0
+
+        w_xy = ti.max(d_xy, 0.0)
+        w_z = ti.max(d_z, 0.0)
+        outside_dist = ti.sqrt(w_xy * w_xy + w_z * w_z)
+
+        distance = outside_dist + ti.min(ti.max(d_xy, d_z), 0.0)
+        normal = ti.Vector([0.0, 0.0, 0.0])
+        if outside_dist > 1e-6:
+            normal = (
+                ti.Vector([w_xy * radial.x, w_xy * radial.y, w_z * s_z]) / outside_dist
+            )
+        elif d_xy > d_z:
+            normal = ti.Vector([radial.x, radial.y, 0.0])
+        else:
+            normal = ti.Vector([0.0, 0.0, s_z])
+        return ti.Vector([distance, normal.x, normal.y, normal.z])
+
     @ti.func
     def compute_obstacle_distance(self, p: ti.math.vec3, obs_id: ti.i32) -> ti.f32:
         """
@@ -168,9 +429,8 @@ class ObstacleSystem:
         Returns:
             距離（正數 = 在外部，負數 = 在內部）
         """
-        obs_type = self.obstacle_type[obs_id]
-        center = self.obstacle_pos[obs_id]
-        params = self.obstacle_params[obs_id]
+        obs = self.obstacle_data[obs_id]
+        obs_type, center, params = obs.type, obs.pos, obs.params
 
         distance = 0.0
 
@@ -187,6 +447,53 @@ class ObstacleSystem:
 
         return distance
 
+    @ti.func
+    def compute_obstacle_sdf_normal(
+        self, p: ti.math.vec3, obs_id: ti.i32
+    ) -> ti.math.vec4:
+        """
+        一次求出點 p 到障礙物的距離與單位法向量
+
+        Returns:
+            vec4 = (距離, 法向量 xyz)；未知類型回傳極大距離（不施力）
+        """
+        obs = self.obstacle_data[obs_id]
+        return self.sdf_normal_dispatch(p, obs.type, obs.pos, obs.params)
+
+    @ti.func
+    def sdf_normal_dispatch(
+        self,
+        p: ti.math.vec3,
+        obs_type: ti.i32,
+        center: ti.math.vec3,
+        params: ti.math.vec4,
+    ) -> ti.math.vec4:
+        """
+        依類型分派到解析 SDF + 法向量；障礙物屬性由呼叫端一次載入後傳值
+        """
+        result = ti.Vector([1e10, 0.0, 0.0, 0.0])
+
+        if obs_type == 0:  # SPHERE
+            result = self.sdf_sphere_grad(p, center, params[0])
+        elif obs_type == 1:  # BOX
+            half_extents = ti.Vector([params[0], params[1], params[2]])
+            result = self.sdf_box_grad(p, center, half_extents)
+        elif obs_type == 2:  # CYLINDER
+            result = self.sdf_cylinder_grad(p, center, params[0], params[1] * 0.5)
+
+        return result
+
+    @ti.func
+    def fast_decay(self, x: ti.f32) -> ti.f32:
+        """
+        exp(-x) 的廉價近似：(1 - x/3)^3，x = d/decay
+
+        x = 0 時為 1，x = 3（截斷距離）時平滑降到 0；只需數個 FMA，
+        不用超越函數。x < 0（點在障礙物內部）時隨深度三次方增長
+        """
+        t = ti.max(1.0 - x * (1.0 / 3.0), 0.0)
+        return t * t * t
+
     @ti.func
     def compute_obstacle_force(self, p: ti.math.vec3, obs_id: ti.i32) -> ti.math.vec3:
         """
@@ -194,65 +501,68 @@ class ObstacleSystem:
 
         機制：
             F = -k * exp(-d/d0) * n
-            其中 d = 距離，n = 法向量（指向遠離障礙物）
+            其中 d = 距離，n = 法向量（指向遠離障礙物，取 SDF 的解析梯度）
+            use_fast_decay 時 exp(-d/d0) 改用 fast_decay 近似
 
         Returns:
             排斥力向量
         """
-        force = ti.Vector([0.0, 0.0, 0.0])
-
-        if self.obstacle_active[obs_id] == 1:
-            center = self.obstacle_pos[obs_id]
-            strength = self.obstacle_strength[obs_id]
-            decay = self.obstacle_decay[obs_id]
-
-            # 計算距離（使用數值梯度近似法向量）
-            eps = 1e-3
-            d0 = self.compute_obstacle_distance(p, obs_id)
-
-            # 只在接近障礙物時施加力（d < 3 * decay）
-            if d0 < 3.0 * decay:
-                # 計算梯度（法向量）
-                dx = (
-                    self.compute_obstacle_distance(
-                        p + ti.Vector([eps, 0.0, 0.0]), obs_id
-                    )
-                    - d0
-                )
-                dy = (
-                    self.compute_obstacle_distance(
-                        p + ti.Vector([0.0, eps, 0.0]), obs_id
-                    )
-                    - d0
-                )
-                dz = (
-                    self.compute_obstacle_distance(
-                        p + ti.Vector([0.0, 0.0, eps]), obs_id
-                    )
-                    - d0
-                )
+        obs = self.obstacle_data[obs_id]
+        strength = ti.cast(obs.strength, ti.f32)
+        inv_decay = ti.cast(obs.inv_decay, ti.f32)
+
+        sdf = self.sdf_normal_dispatch(p, obs.type, obs.pos, obs.params)
+        d0 = sdf[0]
+        normal = ti.Vector([sdf[1], sdf[2], sdf[3]])
+
+        # 無分支遮罩：inactive 或距離過遠（d >= 3 * decay）時乘 0，
+        # 避免同一 warp 內的 agent 走不同分支
+        in_range = ti.select(d0 < obs.cutoff, 1.0, 0.0)
+        mask = ti.cast(obs.active, ti.f32) * in_range
+
+        # 指數衰減排斥力（退化點的法向量為零，不施力）；
+        # 指數上限避免深入 inactive 障礙物時 inf * 0 產生 NaN
+        x = d0 * inv_decay
+        decay_factor = 0.0
+        if ti.static(self.use_fast_decay):
+            decay_factor = self.fast_decay(x)
+        else:
+            decay_factor = ti.exp(ti.min(-x, 80.0))
+        magnitude = strength * decay_factor
+        return (mask * magnitude) * normal
 
-                normal = ti.Vector([dx, dy, dz]) / eps
-                norm = normal.norm()
-
-                if norm > 1e-6:
-                    normal = normal / norm
-                    # 指數衰減排斥力
-                    magnitude = strength * ti.exp(-d0 / decay)
-                    force = magnitude * normal
+    @ti.func
+    def compute_total_obstacle_force(self, p: ti.math.vec3) -> ti.math.vec3:
+        """
+        所有障礙物對點 p 的排斥力總和
 
+        有網格時只測試 p 所在 cell 登錄的障礙物（O(1) 個）；
+        否則迴圈上限讀自 obstacle_count（執行期數值），模擬開始後新增的障礙物也會生效，
+        inactive 的 slot 由 compute_obstacle_force 自行略過
+        """
+        force = ti.Vector([0.0, 0.0, 0.0])
+        if ti.static(self.use_grid):
+            cell = self.get_obstacle_cell(p)
+            for k in range(self.obstacle_cell_count[cell]):
+                force += self.compute_obstacle_force(
+                    p, self.obstacle_cell_list[cell, k]
+                )
+        else:
+            for obs_id in range(self.obstacle_count[None]):
+                force += self.compute_obstacle_force(p, obs_id)
         return force
 
     def get_obstacle_info(self, obs_id: int) -> dict:
         """獲取障礙物資訊"""
         if 0 <= obs_id < self.n_obstacles:
+            data = self.obstacle_data
             return {
-                "type": ObstacleType(self.obstacle_type[obs_id]),
-                "position": self.obstacle_pos[obs_id].to_numpy(),
-                "params": self.obstacle_params[obs_id].to_numpy(),
-                "strength": self.obstacle_strength[obs_id],
-                "decay": self.obstacle_decay[obs_id],
-                "active": bool(self.obstacle_active[obs_id]),
+                "type": ObstacleType(data.type[obs_id]),
+                "position": data.pos[obs_id].to_numpy(),
+                "params": data.params[obs_id].to_numpy(),
+                "strength": data.strength[obs_id],
+                "decay": data.decay[obs_id],
+                "active": bool(data.active[obs_id]),
             }
         return None
 
@@ -277,32 +587,40 @@ class ObstacleSystem:
         Returns:
             距離
         """
-        obs_type = self.obstacle_type[obs_id]
-        center = self.obstacle_pos[obs_id]
-        params = self.obstacle_params[obs_id]
+        return self.compute_obstacle_distance(p, obs_id)
 
-        distance = 0.0
+    @ti.kernel
+    def compute_all_distances_kernel(
+        self, pos: ti.types.ndarray(), out: ti.types.ndarray()
+    ):
+        """
+        [Python-callable] 一次計算所有點到所有障礙物的距離
 
-        if obs_type == 0:  # SPHERE
-            radius = params[0]
-            distance = (p - center).norm() - radius
-        elif obs_type == 1:  # BOX
-            half_extents = ti.Vector([params[0], params[1], params[2]])
-            q = ti.abs(p - center) - half_extents
-            outside_dist = ti.max(q, 0.0).norm()
-            inside_dist = ti.min(ti.max(q.x, ti.max(q.y, q.z)), 0.0)
-            distance = outside_dist + inside_dist
-        elif obs_type == 2:  # CYLINDER
-            radius = params[0]
-            half_height = params[1] * 0.5
-            p_rel = p - center
-            d_xy = ti.sqrt(p_rel.x * p_rel.x + p_rel.y * p_rel.y) - radius
-            d_z = ti.abs(p_rel.z) - half_height
-            outside_dist = ti.sqrt(ti.max(d_xy, 0.0) ** 2 + ti.max(d_z, 0.0) ** 2)
-            inside_dist = ti.min(ti.max(d_xy, d_z), 0.0)
-            distance = outside_dist + inside_dist
+        在 (點, 障礙物) 的 2D 範圍上平行化，單一 kernel launch
 
-        return distance
+        Args:
+            pos: 點位置 (M, 3)
+            out: 輸出距離 (M, K)，K = 已新增的障礙物數量
+        """
+        for i, k in ti.ndrange(pos.shape[0], out.shape[1]):
+            p = ti.Vector([pos[i, 0], pos[i, 1], pos[i, 2]])
+            out[i, k] = self.compute_obstacle_distance(p, k)
+
+    def compute_all_distances(self, positions: np.ndarray) -> np.ndarray:
+        """
+        [Python-callable wrapper] 所有點到所有障礙物的 SDF 距離（供診斷與分析）
+
+        Args:
+            positions: 點位置 (M, 3)
+
+        Returns:
+            距離矩陣 (M, n_obstacles)；已移除的障礙物仍會回傳其幾何距離
+        """
+        positions = np.ascontiguousarray(positions, dtype=np.float32).reshape(-1, 3)
+        out = np.zeros((len(positions), self.n_obstacles), dtype=np.float32)
+        if out.size > 0:
+            self.compute_all_distances_kernel(positions, out)
+        return out
 
     @ti.kernel
     def compute_obstacle_force_test_kernel(
@@ -311,134 +629,15 @@ class ObstacleSystem:
         """
         [Python-callable] 計算障礙物力（結果寫入 ndarray）
 
-        注意：這是測試用 kernel，不要與 @ti.func 版本混淆
-        從 flocking kernel 內部呼叫時會使用 @ti.func 版本（Line 190-244）
+        注意：這是測試用 kernel，內部呼叫與 flocking kernel 相同的
+        compute_obstacle_force（@ti.func），兩者結果一致
 
         Args:
             p: 測試點位置
             obs_id: 障礙物 ID
             result: 輸出陣列 (3,)
         """
-        force = ti.Vector([0.0, 0.0, 0.0])
-
-        if self.obstacle_active[obs_id] == 1:
-            center = self.obstacle_pos[obs_id]
-            strength = self.obstacle_strength[obs_id]
-            decay = self.obstacle_decay[obs_id]
-
-            # 計算距離（直接複製 SDF 邏輯，避免呼叫其他 kernel）
-            obs_type = self.obstacle_type[obs_id]
-            params = self.obstacle_params[obs_id]
-            eps = 1e-3
-
-            # 先宣告 d0（Taichi 要求）
-            d0 = 0.0
-
-            # 計算 d0
-            if obs_type == 0:  # SPHERE
-                radius = params[0]
-                d0 = (p - center).norm() - radius
-            elif obs_type == 1:  # BOX
-                half_extents = ti.Vector([params[0], params[1], params[2]])
-                q = ti.abs(p - center) - half_extents
-                outside_dist = ti.max(q, 0.0).norm()
-                inside_dist = ti.min(ti.max(q.x, ti.max(q.y, q.z)), 0.0)
-                d0 = outside_dist + inside_dist
-            elif obs_type == 2:  # CYLINDER
-                radius = params[0]
-                half_height = params[1] * 0.5
-                p_rel = p - center
-                d_xy = ti.sqrt(p_rel.x * p_rel.x + p_rel.y * p_rel.y) - radius
-                d_z = ti.abs(p_rel.z) - half_height
-                outside_dist = ti.sqrt(ti.max(d_xy, 0.0) ** 2 + ti.max(d_z, 0.0) ** 2)
-                inside_dist = ti.min(ti.max(d_xy, d_z), 0.0)
-                d0 = outside_dist + inside_dist
-            else:
-                d0 = 999.0
-
-            if d0 < 3.0 * decay:
-                # 計算梯度（法向量） - 使用相同的內聯邏輯
-                # dx
-                p_dx = p + ti.Vector([eps, 0.0, 0.0])
-                if obs_type == 0:
-                    radius = params[0]
-                    d_dx = (p_dx - center).norm() - radius
-                elif obs_type == 1:
-                    half_extents = ti.Vector([params[0], params[1], params[2]])
-                    q = ti.abs(p_dx - center) - half_extents
-                    d_dx = ti.max(q, 0.0).norm() + ti.min(
-                        ti.max(q.x, ti.max(q.y, q.z)), 0.0
-                    )
-                elif obs_type == 2:
-                    radius = params[0]
-                    half_height = params[1] * 0.5
-                    p_rel = p_dx - center
-                    d_xy = ti.sqrt(p_rel.x * p_rel.x + p_rel.y * p_rel.y) - radius
-                    d_z = ti.abs(p_rel.z) - half_height
-                    d_dx = ti.sqrt(
-                        ti.max(d_xy, 0.0) ** 2 + ti.max(d_z, 0.0) ** 2
-                    ) + ti.min(ti.max(d_xy, d_z), 0.0)
-                else:
-                    d_dx = d0
-
-                # dy
-                p_dy = p + ti.Vector([0.0, eps, 0.0])
-                if obs_type == 0:
-                    radius = params[0]
-                    d_dy = (p_dy - center).norm() - radius
-                elif obs_type == 1:
-                    half_extents = ti.Vector([params[0], params[1], params[2]])
-                    q = ti.abs(p_dy - center) - half_extents
-                    d_dy = ti.max(q, 0.0).norm() + ti.min(
-                        ti.max(q.x, ti.max(q.y, q.z)), 0.0
-                    )
-                elif obs_type == 2:
-                    radius = params[0]
-                    half_height = params[1] * 0.5
-                    p_rel = p_dy - center
-                    d_xy = ti.sqrt(p_rel.x * p_rel.x + p_rel.y * p_rel.y) - radius
-                    d_z = ti.abs(p_rel.z) - half_height
-                    d_dy = ti.sqrt(
-                        ti.max(d_xy, 0.0) ** 2 + ti.max(d_z, 0.0) ** 2
-                    ) + ti.min(ti.max(d_xy, d_z), 0.0)
-                else:
-                    d_dy = d0
-
-                # dz
-                p_dz = p + ti.Vector([0.0, 0.0, eps])
-                if obs_type == 0:
-                    radius = params[0]
-                    d_dz = (p_dz - center).norm() - radius
-                elif obs_type == 1:
-                    half_extents = ti.Vector([params[0], params[1], params[2]])
-                    q = ti.abs(p_dz - center) - half_extents
-                    d_dz = ti.max(q, 0.0).norm() + ti.min(
-                        ti.max(q.x, ti.max(q.y, q.z)), 0.0
-                    )
-                elif obs_type == 2:
-                    radius = params[0]
-                    half_height = params[1] * 0.5
-                    p_rel = p_dz - center
-                    d_xy = ti.sqrt(p_rel.x * p_rel.x + p_rel.y * p_rel.y) - radius
-                    d_z = ti.abs(p_rel.z) - half_height
-                    d_dz = ti.sqrt(
-                        ti.max(d_xy, 0.0) ** 2 + ti.max(d_z, 0.0) ** 2
-                    ) + ti.min(ti.max(d_xy, d_z), 0.0)
-                else:
-                    d_dz = d0
-
-                dx = d_dx - d0
-                dy = d_dy - d0
-                dz = d_dz - d0
-
-                normal = ti.Vector([dx, dy, dz]) / eps
-                norm = normal.norm()
-
-                if norm > 1e-6:
-                    normal = normal / norm
-                    magnitude = strength * ti.exp(-d0 / decay)
-                    force = magnitude * normal
-
+        force = self.compute_obstacle_force(p, obs_id)
         result[0] = force.x
         result[1] = force.y
         result[2] = force.z
@@ -465,6 +664,17 @@ class ObstacleSystem:
 # ============================================================================
 # Helper Functions
 # ============================================================================
+def _bounding_radius(config: ObstacleConfig) -> float:
+    """障礙物中心到其表面最遠點的距離（包圍球半徑）"""
+    params = config.params
+    if config.obstacle_type == ObstacleType.SPHERE:
+        return float(params[0])
+    if config.obstacle_type == ObstacleType.BOX:
+        return float(np.linalg.norm(params[:3]))
+    # CYLINDER：半徑 r、高 h
+    return float(np.hypot(params[0], 0.5 * params[1]))
+
+
 def create_sphere_obstacle(
     center: Tuple[float, float, float], radius: float, strength: float = 10.0
 ) -> ObstacleConfig:
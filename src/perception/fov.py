@@ -29,10 +29,12 @@ class PerceptionMixin:
     Fields:
         enable_fov: 是否啟用 FOV 限制
         fov_cos_angle: FOV 半角的 cos 值（用於快速計算）
+        fov_cos_angle_sq: fov_cos_angle 的平方（免開根號的比較用）
 
     Methods:
         init_perception: 初始化感知系統
         is_in_fov: 檢查目標是否在視野內（@ti.func）
+        is_in_fov_sq: 以平方長度檢查視野（@ti.func，無 sqrt / 除法）
     """
 
     def init_perception(
@@ -56,7 +58,8 @@ class PerceptionMixin:
         # 計算 FOV 半角的 cos 值（用於快速比較）
         # cos(angle) 單調遞減，所以 cos(60°) > cos(90°) > cos(120°)
         half_angle_rad = np.radians(fov_angle / 2.0)
-        self.fov_cos_angle = np.cos(half_angle_rad)
+        self.fov_cos_angle = float(np.cos(half_angle_rad))
+        self.fov_cos_angle_sq = self.fov_cos_angle * self.fov_cos_angle
 
         print(f"[PerceptionMixin] Initialized:")
         print(f"  FOV enabled: {enable_fov}")
@@ -90,13 +93,13 @@ class PerceptionMixin:
 
         # 使用 ti.static 在編譯時決定是否檢查 FOV
         if ti.static(self.enable_fov):
-            v_norm = vi.norm()
-            r_norm = rij.norm()
+            v2 = vi.dot(vi)
+            r2 = rij.dot(rij)
 
-            # 檢查向量長度是否有效
-            if v_norm > 1e-6 and r_norm > 1e-6:
-                # 計算 cos(angle) = (vi · rij) / (|vi| * |rij|)
-                cos_angle = vi.dot(rij) / (v_norm * r_norm)
+            # 檢查向量長度是否有效（|v|, |r| > 1e-6，以平方比較免開根號）
+            if v2 > 1e-12 and r2 > 1e-12:
+                # 計算 cos(angle) = (vi · rij) / (|vi| * |rij|)，以 rsqrt 取代 sqrt + 除法
+                cos_angle = vi.dot(rij) * ti.rsqrt(v2 * r2)
 
                 # 在視野內當 cos(angle) >= cos(fov_half_angle)
                 # 因為 cos 單調遞減，夾角越小 cos 越大
@@ -108,6 +111,41 @@ class PerceptionMixin:
 
         return in_fov
 
+    @ti.func
+    def is_in_fov_sq(
+        self, vi: ti.math.vec3, rij: ti.math.vec3, vi_norm2: ti.f32, r2: ti.f32
+    ) -> ti.i32:
+        """
+        is_in_fov 的平方版本（結果相同，供內層迴圈使用）
+
+        Args:
+            vi: 觀察者的速度向量（視線方向）
+            rij: 觀察者到目標的位移向量
+            vi_norm2: |vi|²（呼叫端可在鄰居迴圈外先算好）
+            r2: |rij|²（力計算時已算好）
+
+        Algorithm:
+            cos(angle) >= c 等價於 d >= c·|vi|·|rij|（d = vi · rij），
+            依 c 的正負兩邊平方：
+                c >= 0: d >= 0 且 d² >= c²·|vi|²·|rij|²
+                c <  0: d >= 0 或 d² <= c²·|vi|²·|rij|²
+        """
+        in_fov = 1
+
+        if ti.static(self.enable_fov):
+            # 與 is_in_fov 相同：|vi| 或 |rij| <= 1e-6 視為可見
+            if vi_norm2 > 1e-12 and r2 > 1e-12:
+                d = vi.dot(rij)
+                bound = self.fov_cos_angle_sq * vi_norm2 * r2
+                if ti.static(self.fov_cos_angle >= 0.0):
+                    if d < 0.0 or d * d < bound:
+                        in_fov = 0
+                else:
+                    if d < 0.0 and d * d > bound:
+                        in_fov = 0
+
+        return in_fov
+
     @ti.func
     def is_in_fov_indexed(self, i: ti.i32, j: ti.i32, rij: ti.math.vec3) -> ti.i32:
         """
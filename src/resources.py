@@ -14,7 +14,7 @@ Resource System for Foraging Behavior
 """
 
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import taichi as ti
@@ -31,6 +31,12 @@ class ResourceConfig:
     max_amount: float = 100.0  # 最大數量（用於再生資源）
 
 
+@ti.func
+def _direct_disp(p, q):
+    """不考慮 PBC 的位移 q - p"""
+    return q - p
+
+
 @ti.data_oriented
 class ResourceSystem:
     """
@@ -145,27 +151,81 @@ class ResourceSystem:
         Returns:
             1 = 在範圍內，0 = 不在
         """
-        if self.resource_active[res_id] == 0:
-            return 0
+        return self.is_in_range_sq(p, res_id)
 
-        distance = self.compute_distance_to_resource(p, res_id, pbc_func)
+    @ti.func
+    def is_in_range_sq(self, p: ti.math.vec3, res_id: ti.i32) -> ti.i32:
+        """
+        is_in_range 的平方版本：|p - res_pos|² < radius²，不呼叫 norm()
+
+        Returns:
+            1 = 在範圍內（且資源 active），0 = 不在
+        """
+        d = p - self.resource_pos[res_id]
         radius = self.resource_radius[res_id]
+        in_range = 0
+        if self.resource_active[res_id] == 1 and d.dot(d) < radius * radius:
+            in_range = 1
+        return in_range
 
-        if distance < radius:
-            return 1
-        return 0
+    @ti.func
+    def nearest_resource(self, p: ti.math.vec3, disp_func: ti.template()) -> ti.i32:
+        """
+        離 p 最近、active 且仍有存量的資源 ID（沒有則返回 -1）
+
+        Args:
+            p: 查詢位置
+            disp_func: 位移函式 disp_func(p, res_pos)（呼叫端決定是否套用 PBC）
+
+        Note:
+            以 ti.static 展開全部 max_resources 個槽位，未使用與 inactive 的槽位以遮罩略過；
+            迴圈長度與 n_resources（Python int，編譯時固定）無關
+        """
+        best_res = -1
+        min_dist2 = 1e20  # 以距離平方比較，免開根號
+        for res_id in ti.static(range(self.max_resources)):
+            d = disp_func(p, self.resource_pos[res_id])
+            dist2 = d.dot(d)
+            if (
+                self.resource_active[res_id] == 1
+                and self.resource_amount[res_id] > 0.0
+                and dist2 < min_dist2
+            ):
+                min_dist2 = dist2
+                best_res = res_id
+        return best_res
 
     @ti.kernel
-    def consume_resource(self, res_id: ti.i32, amount: ti.f32) -> ti.f32:
+    def find_nearest_resource(
+        self,
+        agent_pos: ti.types.ndarray(),
+        out_ids: ti.types.ndarray(),
+        out_dists: ti.types.ndarray(),
+    ):
         """
-        消耗資源（從 Python 呼叫）
+        一次 kernel launch 為整批位置找最近的有效資源（不考慮 PBC）
 
         Args:
-            res_id: 資源 ID
-            amount: 要消耗的數量
+            agent_pos: (K, 3) float32 位置
+            out_ids: (K,) int32 輸出最近資源 ID（沒有則 -1）
+            out_dists: (K,) float32 輸出距離平方（沒有則 inf）
+        """
+        for k in range(agent_pos.shape[0]):
+            p = ti.math.vec3(agent_pos[k, 0], agent_pos[k, 1], agent_pos[k, 2])
+            best_res = self.nearest_resource(p, _direct_disp)
+            dist2 = ti.math.inf
+            if best_res >= 0:
+                d = self.resource_pos[best_res] - p
+                dist2 = d.dot(d)
+            out_ids[k] = best_res
+            out_dists[k] = dist2
 
-        Returns:
-            實際消耗的數量（可能小於請求）
+    @ti.func
+    def consume(self, res_id: ti.i32, amount: ti.f32) -> ti.f32:
+        """
+        從資源 res_id 扣除最多 amount，返回實際消耗量
+
+        資源耗盡且不會補充時標記為 inactive
         """
         consumed = 0.0
 
@@ -183,26 +243,86 @@ class ResourceSystem:
 
         return consumed
 
+    @ti.kernel
+    def consume_resource(self, res_id: ti.i32, amount: ti.f32) -> ti.f32:
+        """
+        消耗資源（從 Python 呼叫）
+
+        Args:
+            res_id: 資源 ID
+            amount: 要消耗的數量
+
+        Returns:
+            實際消耗的數量（可能小於請求）
+        """
+        return self.consume(res_id, amount)
+
+    @ti.kernel
+    def consume_resources_batch(
+        self,
+        res_ids: ti.types.ndarray(),
+        amounts: ti.types.ndarray(),
+        consumed_out: ti.types.ndarray(),
+    ):
+        """
+        一次 kernel launch 處理整批消耗事件
+
+        Args:
+            res_ids: (K,) int32 資源 ID
+            amounts: (K,) float32 各事件請求的數量
+            consumed_out: (K,) float32 輸出各事件實際消耗的數量
+
+        Note:
+            事件依陣列順序處理（等同逐一呼叫 consume_resource），
+            同一資源的多個事件由排在前面者優先取得（FIFO 分配依此保證近者先得）
+        """
+        ti.loop_config(serialize=True)
+        for k in range(res_ids.shape[0]):
+            consumed_out[k] = self.consume(res_ids[k], amounts[k])
+
+    def snapshot_resources(self) -> Dict[str, np.ndarray]:
+        """
+        一次取回所有資源欄位（每個 field 一次 to_numpy）
+
+        Returns:
+            {"position", "amount", "radius", "replenish_rate", "max_amount",
+             "active"} → 長度 n_resources 的 numpy 陣列
+        """
+        n = self.n_resources
+        return {
+            "position": self.resource_pos.to_numpy()[:n],
+            "amount": self.resource_amount.to_numpy()[:n],
+            "radius": self.resource_radius.to_numpy()[:n],
+            "replenish_rate": self.resource_replenish_rate.to_numpy()[:n],
+            "max_amount": self.resource_max_amount.to_numpy()[:n],
+            "active": self.resource_active.to_numpy()[:n],
+        }
+
+    @staticmethod
+    def _resource_info_from_snapshot(snap: Dict[str, np.ndarray], res_id: int) -> dict:
+        """由 snapshot 的第 res_id 列組出資源資訊字典"""
+        return {
+            "res_id": res_id,
+            "position": snap["position"][res_id],
+            "amount": float(snap["amount"][res_id]),
+            "radius": float(snap["radius"][res_id]),
+            "replenish_rate": float(snap["replenish_rate"][res_id]),
+            "max_amount": float(snap["max_amount"][res_id]),
+            "active": bool(snap["active"][res_id]),
+        }
+
     def get_resource_info(self, res_id: int) -> Optional[dict]:
         """獲取資源資訊"""
         if 0 <= res_id < self.n_resources:
-            return {
-                "res_id": res_id,
-                "position": self.resource_pos[res_id].to_numpy(),
-                "amount": self.resource_amount[res_id],
-                "radius": self.resource_radius[res_id],
-                "replenish_rate": self.resource_replenish_rate[res_id],
-                "max_amount": self.resource_max_amount[res_id],
-                "active": bool(self.resource_active[res_id]),
-            }
+            return self._resource_info_from_snapshot(self.snapshot_resources(), res_id)
         return None
 
     def get_all_resources(self) -> List[dict]:
         """獲取所有資源資訊"""
+        snap = self.snapshot_resources()
         return [
-            self.get_resource_info(i)
-            for i in range(self.n_resources)
-            if self.resource_active[i] == 1
+            self._resource_info_from_snapshot(snap, i)
+            for i in np.flatnonzero(snap["active"] == 1).tolist()
         ]
 
 
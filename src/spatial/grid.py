@@ -6,6 +6,7 @@ Spatial Grid Mixin - 空間網格加速結構
 設計理念：
     • 將3D空間劃分為均勻網格（Grid）
     • 每個 agent 被分配到對應的 cell
+    • cell ID 為 cell 在 Morton（Z-order）順序中的稠密名次，相鄰 cell 在記憶體中也相近
     • 查詢鄰居時只檢查 3×3×3 = 27 個鄰居 cell
 
 效能：
@@ -20,10 +21,44 @@ Spatial Grid Mixin - 空間網格加速結構
             self.init_spatial_grid(N, box_size=50.0, cell_size=5.0)
 """
 
+import math
+
 import taichi as ti
 import numpy as np
 
 
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """將每個整數的 bit 間隔兩個 0：b2 b1 b0 → b2 0 0 b1 0 0 b0（int64，每軸最多 21 bits）"""
+    v = v.astype(np.int64)
+    out = np.zeros_like(v)
+    for b in range(max(int(v.max()).bit_length(), 1)):
+        out |= ((v >> b) & 1) << (3 * b)
+    return out
+
+
+def morton_rank(res: int) -> np.ndarray:
+    """
+    res³ 個 cell 依 Morton（Z-order）排序後的名次
+
+    Returns:
+        rank[ix + res * (iy + res * iz)] = 該 cell 在 Morton 順序中的位置（0..res³-1）
+
+    名次是稠密的：cell ID 範圍剛好是 res³，不會補到 2 的冪次，
+    但相鄰 cell 在記憶體中仍然相近
+    """
+    iz, iy, ix = np.meshgrid(
+        np.arange(res), np.arange(res), np.arange(res), indexing="ij"
+    )
+    code = (
+        _spread_bits(ix.ravel())
+        | (_spread_bits(iy.ravel()) << 1)
+        | (_spread_bits(iz.ravel()) << 2)
+    )
+    rank = np.empty(res**3, dtype=np.int32)
+    rank[np.argsort(code, kind="stable")] = np.arange(res**3, dtype=np.int32)
+    return rank
+
+
 @ti.data_oriented
 class SpatialGridMixin:
     """
@@ -41,7 +76,7 @@ class SpatialGridMixin:
         N: int,
         box_size: float = 50.0,
         cell_size: float = 5.0,
-        max_agents_per_cell: int = 32,
+        periodic: bool = False,
     ):
         """
         初始化 Spatial Grid 資料結構
@@ -49,29 +84,94 @@ class SpatialGridMixin:
         Args:
             N: Agent 數量
             box_size: 模擬空間大小
-            cell_size: Grid cell 的邊長（建議設為群組檢測的 r_cluster）
-            max_agents_per_cell: 每個 cell 最多容納的 agent 數量
+            cell_size: Grid cell 的最小邊長（建議設為鄰居查詢的最大半徑）
+            periodic: 是否為週期邊界（鄰居 cell 跨邊界環繞）
         """
-        self.grid_cell_size = cell_size
-        self.grid_resolution = max(int(box_size / cell_size) + 1, 4)  # 至少 4×4×4
-        self.max_agents_per_cell = max_agents_per_cell
-
-        # Grid 資料結構
-        total_cells = self.grid_resolution**3
+        self.grid_periodic = periodic
+        self._set_grid_layout(box_size, cell_size)
+
+        # Grid 資料結構：counting sort（無容量上限，記憶體 = N + cells）
+        # cell c 的 agents 為 sorted_agents[cell_offset[c]:cell_offset[c + 1]]
+        # 鄰居走訪只讀這兩個 field，兩者的值都 ≤ N：N 放得進 i16 時用 i16，
+        # 每個 cache line 可放兩倍的索引
+        self.grid_index_dtype = ti.i16 if N < 2**15 else ti.i32
+        total_cells = self.grid_total_cells
         self.agent_cell_id = ti.field(ti.i32, N)  # 每個 agent 所在的 cell ID
-        self.cell_count = ti.field(ti.i32, total_cells)  # 每個 cell 中的 agent 數量
-        self.cell_agents = ti.field(
-            ti.i32, (total_cells, max_agents_per_cell)
-        )  # cell → agents 映射
+        # 依 cell 排序的 agent ID
+        self.sorted_agents = ti.field(self.grid_index_dtype, N)
+        self._grid_cell_tree = None
+        self._allocate_cell_fields(total_cells)
 
         # 初始化
         self.agent_cell_id.fill(-1)
-        self.cell_count.fill(0)
 
         print(
             f"[SpatialGrid] Initialized {self.grid_resolution}³ grid "
-            f"(cell_size={cell_size:.2f}, total_cells={total_cells})"
+            f"(cell_size={self.grid_cell_size:.2f}, total_cells={total_cells})"
+        )
+
+    def _allocate_cell_fields(self, total_cells: int):
+        """
+        配置每個 cell 的 fields（cell_count / cell_offset / cell_block_sum）
+        與 Morton 名次查表（cell_rank / cell_coord）
+
+        全部放在獨立的 SNode tree，解析度改變時先 destroy 舊 tree 再重建，
+        舊的 fields 不會留在記憶體裡
+        """
+        if self._grid_cell_tree is not None:
+            self._grid_cell_tree.destroy()
+
+        # prefix sum 分塊：區塊大小 ≈ √cells，區塊內與區塊間的序列段都是 O(√cells)
+        self.grid_scan_block = math.isqrt(max(total_cells - 1, 0)) + 1
+        n_blocks = -(-total_cells // self.grid_scan_block)
+
+        fb = ti.FieldsBuilder()
+        self.cell_count = ti.field(ti.i32)  # 每個 cell 中的 agent 數量
+        self.cell_offset = ti.field(self.grid_index_dtype)  # cell 起始位置
+        self.cell_block_sum = ti.field(ti.i32)  # 每個區塊的 agent 數（scan 暫存）
+        fb.dense(ti.i, total_cells).place(self.cell_count)
+        fb.dense(ti.i, total_cells + 1).place(self.cell_offset)
+        fb.dense(ti.i, n_blocks).place(self.cell_block_sum)
+        # (ix, iy, iz) 的線性索引 → cell ID，以及反向的 cell ID → (ix, iy, iz)
+        self.cell_rank = ti.field(ti.i32)
+        self.cell_coord = ti.Vector.field(3, ti.i32)
+        fb.dense(ti.i, total_cells).place(self.cell_rank)
+        fb.dense(ti.i, total_cells).place(self.cell_coord)
+        self._grid_cell_tree = fb.finalize()
+
+        res = self.grid_resolution
+        rank = morton_rank(res)
+        linear = np.arange(total_cells)
+        coord = np.empty((total_cells, 3), dtype=np.int32)
+        coord[rank] = np.stack(
+            [linear % res, (linear // res) % res, linear // res**2], 1
         )
+        self.cell_rank.from_numpy(rank)
+        self.cell_coord.from_numpy(coord)
+
+        self.cell_count.fill(0)
+        self.cell_offset.fill(0)
+
+    def _set_grid_layout(self, box_size: float, cell_size: float):
+        """
+        計算 grid 解析度與每軸的鄰居位移
+
+        週期邊界下 cell 必須剛好鋪滿 box（cell 邊長 = box / res ≥ cell_size），
+        跨邊界環繞的相鄰 cell 才真的相鄰；res < 3 時環繞後的位移會重複，需去重。
+        """
+        if self.grid_periodic:
+            self.grid_resolution = max(int(box_size / cell_size), 1)
+            self.grid_cell_size = box_size / self.grid_resolution
+            self.grid_axis_shifts = tuple(
+                sorted({d % self.grid_resolution for d in (-1, 0, 1)})
+            )
+        else:
+            self.grid_resolution = max(int(box_size / cell_size) + 1, 4)  # 至少 4×4×4
+            self.grid_cell_size = cell_size
+            self.grid_axis_shifts = (-1, 0, 1)
+
+        # cell ID 是 Morton 順序的稠密名次（見 morton_rank），總數剛好 res³
+        self.grid_total_cells = self.grid_resolution**3
 
     @ti.func
     def get_cell_id(self, pos: ti.template()) -> ti.i32:
@@ -82,7 +182,7 @@ class SpatialGridMixin:
             pos: 3D 位置向量
 
         Returns:
-            cell_id: 一維 cell index
+            cell_id: cell 在 Morton 順序中的名次
         """
         # 將位置從 [-box_size/2, box_size/2] 映射到 [0, grid_resolution]
         half_box = self.params.box_size / 2.0
@@ -96,89 +196,141 @@ class SpatialGridMixin:
         iy = ti.max(0, ti.min(iy, self.grid_resolution - 1))
         iz = ti.max(0, ti.min(iz, self.grid_resolution - 1))
 
-        # 一維化：cell_id = ix + iy * res + iz * res²
-        cell_id = (
-            ix
-            + iy * self.grid_resolution
-            + iz * self.grid_resolution * self.grid_resolution
-        )
+        return self.encode_cell(ix, iy, iz)
 
-        return cell_id
+    @ti.func
+    def get_cell_index(self, cell_id: ti.i32) -> ti.math.ivec3:
+        """將 cell ID 解析為 (ix, iy, iz)"""
+        return self.cell_coord[cell_id]
+
+    @ti.func
+    def encode_cell(self, ix: ti.i32, iy: ti.i32, iz: ti.i32) -> ti.i32:
+        """(ix, iy, iz) → cell ID（座標須在 [0, grid_resolution) 內）"""
+        res = self.grid_resolution
+        return self.cell_rank[ix + res * (iy + res * iz)]
+
+    @ti.func
+    def get_shifted_cell(
+        self,
+        idx: ti.math.ivec3,
+        dx: ti.template(),
+        dy: ti.template(),
+        dz: ti.template(),
+    ) -> ti.i32:
+        """
+        回傳 idx 位移 (dx, dy, dz) 後的 cell ID
+
+        位移取自 grid_axis_shifts；週期 grid 會環繞，非週期 grid 超出範圍時回傳 -1。
+        """
+        res = self.grid_resolution
+        nx, ny, nz = idx[0] + dx, idx[1] + dy, idx[2] + dz
+        cell = -1
+        if ti.static(self.grid_periodic):
+            cell = self.encode_cell(nx % res, ny % res, nz % res)
+        elif nx >= 0 and nx < res and ny >= 0 and ny < res and nz >= 0 and nz < res:
+            cell = self.encode_cell(nx, ny, nz)
+        return cell
 
-    @ti.kernel
     def assign_agents_to_grid(self):
+        """將所有 agent 分配到對應的 spatial grid cell（O(N)）"""
+        self._assign_agents_to_grid(False)
+
+    def assign_agents_and_init_groups(self):
+        """
+        分配 grid 並同時初始化 group_id（需搭配 GroupDetectionMixin）
+
+        group_id[i] = i（joins_groups(i) 為真）或 -1，與 cell 分配在同一個迴圈完成，
+        只走訪一次 x
+        """
+        self._assign_agents_to_grid(True)
+
+    @ti.kernel
+    def _assign_agents_to_grid(self, init_groups: ti.template()):
         """
         將所有 agent 分配到對應的 spatial grid cell
         時間複雜度：O(N)
 
+        Args:
+            init_groups: 編譯期旗標；True 時在同一個迴圈寫入 label propagation 的
+                         初始 group_id（參與者 = 自身索引，其餘 = -1）
+
         Note:
-            • 掠食者（type=3）會被跳過（不參與群組檢測）
+            • counting sort：計數 → prefix sum → 散佈，沒有每個 cell 的容量上限
             • 使用原子操作避免競爭條件
         """
-        # 重置 cell_count
         for c in self.cell_count:
             self.cell_count[c] = 0
 
-        # 第一遍：計算每個 agent 的 cell_id
+        # 第一遍：計算每個 agent 的 cell_id 並計數
         for i in self.x:
+            if ti.static(init_groups):
+                self.group_id[i] = i if self.joins_groups(i) else -1
+
             cell_id = self.get_cell_id(self.x[i])
             self.agent_cell_id[i] = cell_id
+            ti.atomic_add(self.cell_count[cell_id], 1)
 
-            # 原子操作：計數該 cell 的 agent 數量
-            old_count = ti.atomic_add(self.cell_count[cell_id], 1)
-
-            # 將 agent 加入該 cell（如果未滿）
-            if old_count < self.max_agents_per_cell:
-                self.cell_agents[cell_id, old_count] = i
+        self.scan_cell_counts()
+        self.scatter_agents_to_cells()
 
     @ti.func
-    def get_neighbor_cells(self, cell_id: ti.i32) -> ti.types.vector(27, ti.i32):
+    def scan_cell_counts(self):
         """
-        獲取指定 cell 的所有鄰居 cell（包含自己）
+        exclusive prefix sum：cell_offset[c + 1] = cell_offset[c] + cell_count[c]
 
-        Args:
-            cell_id: 中心 cell 的 ID
+        分塊平行掃描（三個頂層迴圈，之間有隱含的同步）：
+            1. 各區塊平行加總 → cell_block_sum
+            2. 單一執行緒對 cell_block_sum 做 exclusive scan（只有 √cells 個區塊）
+            3. 各區塊平行從自己的起點往後掃
+        掃描同時把 cell_count 歸零，供 scatter_agents_to_cells 當寫入游標
+        """
+        n_cells = self.cell_count.shape[0]
+        block = ti.static(self.grid_scan_block)
+
+        for b in self.cell_block_sum:
+            total = 0
+            for c in range(b * block, ti.min((b + 1) * block, n_cells)):
+                total += self.cell_count[c]
+            self.cell_block_sum[b] = total
+
+        for _ in range(1):
+            running = 0
+            for b in range(self.cell_block_sum.shape[0]):
+                total = self.cell_block_sum[b]
+                self.cell_block_sum[b] = running
+                running += total
+
+        for b in self.cell_block_sum:
+            offset = self.cell_block_sum[b]
+            for c in range(b * block, ti.min((b + 1) * block, n_cells)):
+                offset += self.cell_count[c]
+                self.cell_offset[c + 1] = ti.cast(offset, self.grid_index_dtype)
+                self.cell_count[c] = 0
 
-        Returns:
-            neighbor_cells: 最多 27 個鄰居 cell 的 ID（3×3×3）
-                           無效的位置填 -1
+    @ti.func
+    def cell_start(self, c: ti.i32) -> ti.i32:
+        """cell c 在 sorted_agents 中的起始位置（c = total_cells 時為結尾）"""
+        return ti.cast(self.cell_offset[c], ti.i32)
+
+    @ti.func
+    def cell_agent(self, k: ti.i32) -> ti.i32:
+        """sorted_agents[k]，以 i32 返回（field 可能是 i16）"""
+        return ti.cast(self.sorted_agents[k], ti.i32)
+
+    @ti.func
+    def scatter_agents_to_cells(self):
         """
-        # 解析 cell_id 為 (ix, iy, iz)
-        res = self.grid_resolution
-        iz = cell_id // (res * res)
-        remainder = cell_id % (res * res)
-        iy = remainder // res
-        ix = remainder % res
-
-        # 遍歷 3×3×3 的鄰居 cell
-        neighbors = ti.Vector([0] * 27, dt=ti.i32)
-        count = 0
-
-        for dz in ti.static(range(-1, 2)):
-            for dy in ti.static(range(-1, 2)):
-                for dx in ti.static(range(-1, 2)):
-                    nx = ix + dx
-                    ny = iy + dy
-                    nz = iz + dz
-
-                    # 邊界檢查
-                    if (
-                        nx >= 0
-                        and nx < res
-                        and ny >= 0
-                        and ny < res
-                        and nz >= 0
-                        and nz < res
-                    ):
-                        neighbor_cell = nx + ny * res + nz * res * res
-                        neighbors[count] = neighbor_cell
-                        count += 1
-
-        # 剩餘位置填 -1（無效）
-        for k in range(count, 27):
-            neighbors[k] = -1
-
-        return neighbors
+        依 agent_cell_id 將 agent 寫入 sorted_agents（agent_cell_id = -1 者略過）
+
+        結束後 cell_count 恢復為每個 cell 的 agent 數
+        """
+        for i in self.agent_cell_id:
+            cell_id = self.agent_cell_id[i]
+            if cell_id >= 0:
+                k = ti.atomic_add(self.cell_count[cell_id], 1)
+                self.sorted_agents[self.cell_start(cell_id) + k] = ti.cast(
+                    i, self.grid_index_dtype
+                )
 
     def update_grid_resolution(self, new_cell_size: float):
         """
@@ -190,17 +342,16 @@ class SpatialGridMixin:
         Note:
             這會觸發重新分配記憶體，成本較高，建議在初始化時設定正確的值
         """
-        self.grid_cell_size = new_cell_size
-        new_resolution = max(int(self.params.box_size / new_cell_size) + 1, 4)
+        old_resolution = self.grid_resolution
+        self._set_grid_layout(self.params.box_size, new_cell_size)
+        new_resolution = self.grid_resolution
 
-        if new_resolution != self.grid_resolution:
+        if new_resolution != old_resolution:
             print(
-                f"[SpatialGrid] Resolution changed: {self.grid_resolution} → {new_resolution}"
+                f"[SpatialGrid] Resolution changed: {old_resolution} → {new_resolution}"
             )
-            self.grid_resolution = new_resolution
 
-            # 重新分配 fields（警告：這會觸發 Taichi 重新編譯）
-            total_cells = new_resolution**3
-            self.cell_count = ti.field(ti.i32, total_cells)
-            self.cell_agents = ti.field(ti.i32, (total_cells, self.max_agents_per_cell))
-            self.cell_count.fill(0)
+            # 重新分配 fields（釋放舊的 SNode tree；警告：這會觸發 Taichi 重新編譯）
+            self._allocate_cell_fields(self.grid_total_cells)
+            # 舊 cell ID 在新解析度下無效
+            self.agent_cell_id.fill(-1)
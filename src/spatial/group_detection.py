@@ -26,7 +26,7 @@ Group Detection Mixin - 群組檢測演算法
 
 import taichi as ti
 import numpy as np
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 
 @ti.data_oriented
@@ -39,7 +39,7 @@ class GroupDetectionMixin:
         • self.x: agent 位置 field
         • self.v: agent 速度 field
         • self.agent_type: agent 類型 field (可選)
-        • self.params.boundary_mode: 邊界模式
+        • self.boundary_mode: 邊界模式（Python int，0 = PBC；kernel 內以 ti.static 展開）
         • self.pbc_dist: PBC 距離計算函數
     """
 
@@ -56,11 +56,23 @@ class GroupDetectionMixin:
         # 群組 ID 與狀態
         self.group_id = ti.field(ti.i32, N)  # 每個 agent 的群組 ID（-1 = 無群組）
         self.group_active = ti.field(ti.i32, max_groups)  # 群組是否有效（0/1）
+        # 上一輪迭代中 group_id 有改變的 agent 數（0 = 已收斂）
+        self.labels_changed = ti.field(ti.i32, ())
 
-        # 群組統計資訊
+        # 群組統計資訊（質心 / 速度以 SoA 配置，x、y、z 各自連續）
         self.group_size = ti.field(ti.i32, max_groups)  # 每個群組的大小
-        self.group_centroid = ti.Vector.field(3, ti.f32, max_groups)  # 群組質心
-        self.group_velocity = ti.Vector.field(3, ti.f32, max_groups)  # 群組平均速度
+        self.group_centroid = ti.Vector.field(
+            3, ti.f32, max_groups, layout=ti.Layout.SOA
+        )  # 群組質心
+        self.group_velocity = ti.Vector.field(
+            3, ti.f32, max_groups, layout=ti.Layout.SOA
+        )  # 群組平均速度
+
+        # 依 group_id 的 counting sort：群組 g 的成員為
+        # agents_by_group[group_offset[g]:group_offset[g + 1]]，統計時不需浮點 atomic
+        self.group_offset = ti.field(ti.i32, max_groups + 1)
+        self.agents_by_group = ti.field(ti.i32, N)
+        self.group_offset.fill(0)
 
         # 初始化
         self.group_id.fill(-1)
@@ -73,7 +85,7 @@ class GroupDetectionMixin:
         print(f"[GroupDetection] Initialized with max_groups={max_groups}")
 
     @ti.kernel
-    def detect_groups_iteration(self, r_cluster: ti.f32, theta_cluster: ti.f32):
+    def detect_groups_iteration(self, r_cluster: ti.f32, cos_theta_cluster: ti.f32):
         """
         執行單次群組偵測迭代（label propagation 的一輪）
         使用 Spatial Grid 加速鄰居搜尋：O(N × k) 取代 O(N²)
@@ -84,17 +96,20 @@ class GroupDetectionMixin:
 
         Args:
             r_cluster: 聚類距離閾值
-            theta_cluster: 速度夾角閾值（弧度）
+            cos_theta_cluster: 速度夾角閾值的餘弦值 cos(θ)
 
         Note:
             掠食者排除邏輯需要在子類別中 override 這個方法
         """
+        self.labels_changed[None] = 0
+        r_cluster_sq = r_cluster * r_cluster
+
         for i in self.x:
             xi = self.x[i]
             vi = self.v[i]
-            vi_norm = vi.norm()
+            vi2 = vi.dot(vi)  # 整個鄰居迴圈共用
 
-            if vi_norm < 1e-6:
+            if vi2 < 1e-12:
                 continue
 
             current_group = self.group_id[i]
@@ -107,10 +122,8 @@ class GroupDetectionMixin:
 
             # 解析 cell_id 為 3D index (ix, iy, iz)
             res = self.grid_resolution
-            iz = cell_id // (res * res)
-            remainder = cell_id % (res * res)
-            iy = remainder // res
-            ix = remainder % res
+            idx = self.get_cell_index(cell_id)
+            ix, iy, iz = idx[0], idx[1], idx[2]
 
             # 只檢查 3×3×3=27 個相鄰 cell 中的 agents（取代原本的 O(N) 全局搜尋）
             for dz in ti.static(range(-1, 2)):
@@ -129,43 +142,37 @@ class GroupDetectionMixin:
                             and nz >= 0
                             and nz < res
                         ):
-                            neighbor_cell = nx + ny * res + nz * res * res
+                            neighbor_cell = self.encode_cell(nx, ny, nz)
 
                             # 檢查該 cell 中的所有 agents
-                            n_agents_in_cell = self.cell_count[neighbor_cell]
-                            for local_idx in range(n_agents_in_cell):
-                                if local_idx >= self.max_agents_per_cell:
-                                    break
-
-                                j = self.cell_agents[neighbor_cell, local_idx]
+                            start = self.cell_start(neighbor_cell)
+                            end = self.cell_start(neighbor_cell + 1)
+                            for k in range(start, end):
+                                j = self.cell_agent(k)
                                 if i == j:
                                     continue
 
                                 xj = self.x[j]
                                 vj = self.v[j]
-                                vj_norm = vj.norm()
+                                vj2 = vj.dot(vj)
 
-                                if vj_norm < 1e-6:
+                                if vj2 < 1e-12:
                                     continue
 
-                                # 計算距離（考慮 PBC）
-                                distance = 0.0
-                                if self.params.boundary_mode == 0:  # PBC
-                                    distance = self.pbc_dist(xi, xj).norm()
-                                else:
-                                    distance = (xj - xi).norm()
+                                # 計算距離平方（考慮 PBC）
+                                rij = xj - xi
+                                if ti.static(self.boundary_mode == 0):  # PBC
+                                    rij = self.pbc_dist(xi, xj)
 
                                 # 檢查空間接近度
-                                if distance > r_cluster:
+                                if rij.dot(rij) > r_cluster_sq:
                                     continue
 
                                 # 檢查速度夾角
-                                cos_angle = (vi.dot(vj)) / (vi_norm * vj_norm)
-                                # 處理數值誤差
-                                cos_angle = ti.max(-1.0, ti.min(1.0, cos_angle))
-                                angle = ti.acos(cos_angle)
-
-                                if angle > theta_cluster:
+                                # 夾角 > θ ⇔ cos 夾角 < cos θ（以平方形式比較，免開根號）
+                                if not self.velocities_aligned(
+                                    vi.dot(vj), vi2, vj2, cos_theta_cluster
+                                ):
                                     continue
 
                                 # 滿足條件：取較小的 group_id
@@ -173,8 +180,32 @@ class GroupDetectionMixin:
                                 if neighbor_group < min_group:
                                     min_group = neighbor_group
 
-            # 更新 group_id
-            self.group_id[i] = min_group
+            # 更新 group_id（記錄有改變的 agent 數，供 update_groups 判斷收斂）
+            if min_group != current_group:
+                self.labels_changed[None] += 1
+                self.group_id[i] = min_group
+
+    @ti.func
+    def velocities_aligned(
+        self, d: ti.f32, vi2: ti.f32, vj2: ti.f32, cos_theta: ti.f32
+    ) -> ti.i32:
+        """
+        夾角 <= θ 的判斷，等價於 d >= cos θ·|vi|·|vj|（d = vi · vj）
+
+        依 cos θ 的正負兩邊平方，不需開根號與除法：
+            cos θ >= 0: d >= 0 且 d² >= cos²θ·|vi|²·|vj|²
+            cos θ <  0: d >= 0 或 d² <= cos²θ·|vi|²·|vj|²
+        cos θ 在整個 kernel 內相同，分支不會造成 divergence
+        """
+        aligned = 1
+        bound = cos_theta * cos_theta * vi2 * vj2
+        if cos_theta >= 0.0:
+            if d < 0.0 or d * d < bound:
+                aligned = 0
+        else:
+            if d < 0.0 and d * d > bound:
+                aligned = 0
+        return aligned
 
     @ti.kernel
     def compute_group_statistics(self):
@@ -185,33 +216,61 @@ class GroupDetectionMixin:
             • group_size: 群組大小
             • group_centroid: 質心位置
             • group_velocity: 平均速度
+
+        Note:
+            先依 group_id 做 counting sort（計數 → prefix sum → 散佈），
+            再由每個群組走訪自己連續的成員求和；浮點累加不需要 atomic
         """
-        # 重置統計資訊
-        for g in range(self.max_groups):
+        for g in self.group_size:
             self.group_size[g] = 0
-            self.group_centroid[g] = ti.Vector([0.0, 0.0, 0.0])
-            self.group_velocity[g] = ti.Vector([0.0, 0.0, 0.0])
-            self.group_active[g] = 0
 
-        # 第一輪：計算每個群組的總和
-        for i in self.x:
+        # 第一輪：計數（只統計 joins_groups 的 agents）
+        for i in self.group_id:
             gid = self.group_id[i]
-            if gid >= 0 and gid < self.max_groups:
-                # 使用 atomic add 避免 race condition
+            if self.joins_groups(i) and gid >= 0 and gid < self.max_groups:
                 ti.atomic_add(self.group_size[gid], 1)
-                for d in ti.static(range(3)):
-                    ti.atomic_add(self.group_centroid[gid][d], self.x[i][d])
-                    ti.atomic_add(self.group_velocity[gid][d], self.v[i][d])
 
-        # 第二輪：計算平均值並標記有效群組
+        # exclusive prefix sum；group_size 歸零後作為散佈的寫入游標
+        for _ in range(1):
+            for g in range(self.max_groups):
+                self.group_offset[g + 1] = self.group_offset[g] + self.group_size[g]
+                self.group_size[g] = 0
+
+        # 第二輪：散佈到 agents_by_group（結束後 group_size 恢復為群組大小）
+        for i in self.group_id:
+            gid = self.group_id[i]
+            if self.joins_groups(i) and gid >= 0 and gid < self.max_groups:
+                k = ti.atomic_add(self.group_size[gid], 1)
+                self.agents_by_group[self.group_offset[gid] + k] = i
+
+        # 第三輪：每個群組走訪連續成員，計算平均值並標記有效群組
         for g in range(self.max_groups):
+            x_sum = ti.Vector([0.0, 0.0, 0.0])
+            v_sum = ti.Vector([0.0, 0.0, 0.0])
+            for k in range(self.group_offset[g], self.group_offset[g + 1]):
+                i = self.agents_by_group[k]
+                x_sum += self.x[i]
+                v_sum += self.v[i]
+
             size = self.group_size[g]
+            self.group_active[g] = 0
+            self.group_centroid[g] = x_sum
+            self.group_velocity[g] = v_sum
             if size > 0:
                 self.group_active[g] = 1
-                # 計算平均值
-                for d in ti.static(range(3)):
-                    self.group_centroid[g][d] /= ti.cast(size, ti.f32)
-                    self.group_velocity[g][d] /= ti.cast(size, ti.f32)
+                inv_size = 1.0 / ti.cast(size, ti.f32)
+                self.group_centroid[g] = x_sum * inv_size
+                self.group_velocity[g] = v_sum * inv_size
+
+    @ti.func
+    def joins_groups(self, i: ti.i32) -> ti.i32:
+        """
+        agent i 是否參與群組檢測（預設全部參與）
+
+        assign_agents_and_init_groups 依此寫入初始 group_id，compute_group_statistics
+        依此過濾成員；子類別可 override，例如排除掠食者
+        """
+        return 1
 
     def update_groups(
         self, r_cluster: float = 5.0, theta_cluster: float = 30.0, n_iterations: int = 5
@@ -225,35 +284,51 @@ class GroupDetectionMixin:
             theta_cluster: 速度夾角閾值（度數）
             n_iterations: 迭代次數（通常 3-5 次收斂）
         """
-        theta_rad = np.radians(theta_cluster)
+        cos_theta = float(np.cos(np.radians(theta_cluster)))
 
-        # 動態更新 grid_cell_size（確保 cell_size = r_cluster）
-        self.grid_cell_size = r_cluster
-        self.grid_resolution = max(
-            int(self.params.box_size / r_cluster) + 1, 4
-        )  # 最小 4×4×4
+        # Grid 的 fields 在建構時依 cell 邊長配置，這裡不能只改解析度；
+        # cell 邊長 ≥ r_cluster 時 27-cell 走訪已涵蓋所有候選鄰居，不需要重建
+        if r_cluster > self.grid_cell_size:
+            self.update_grid_resolution(r_cluster)
 
-        # Step 1: 將 agents 分配到 spatial grid（O(N)）
-        self.assign_agents_to_grid()
-
-        # Step 2: 初始化：每個 agent 自己是一個群組
-        self.group_id.fill(-1)
-        N = len(self.x.to_numpy())
-        for i in range(N):
-            # 掠食者不參與群組（需要檢查 agent_types_np 是否存在）
-            if hasattr(self, "agent_types_np") and self.agent_types_np[i] != 3:
-                self.group_id[i] = i
-            elif not hasattr(self, "agent_types_np"):
-                # 沒有類型系統，所有 agent 參與
-                self.group_id[i] = i
+        # Step 1 + 2: 將 agents 分配到 spatial grid，同一個迴圈裡初始化 group_id
+        # （每個參與者自己是一個群組；O(N)，只走訪一次 x）
+        self.assign_agents_and_init_groups()
 
         # Step 3: 執行多輪迭代（使用 Grid 加速的鄰居搜尋）
         for iteration in range(n_iterations):
-            self.detect_groups_iteration(r_cluster, theta_rad)
+            self.detect_groups_iteration(r_cluster, cos_theta)
+            # 整輪沒有任何標籤改變 → 已是固定點，後續迭代結果相同
+            if self.labels_changed[None] == 0:
+                break
 
         # Step 4: 計算群組統計
         self.compute_group_statistics()
 
+    def snapshot_groups(self) -> Dict[str, np.ndarray]:
+        """
+        一次取回所有群組欄位（每個 field 一次 to_numpy）
+
+        Returns:
+            {"active", "size", "centroid", "velocity"} → 長度 max_groups 的 numpy 陣列
+        """
+        return {
+            "active": self.group_active.to_numpy(),
+            "size": self.group_size.to_numpy(),
+            "centroid": self.group_centroid.to_numpy(),
+            "velocity": self.group_velocity.to_numpy(),
+        }
+
+    @staticmethod
+    def _group_info_from_snapshot(snap: Dict[str, np.ndarray], group_id: int) -> dict:
+        """由 snapshot 的第 group_id 列組出群組資訊字典"""
+        return {
+            "group_id": group_id,
+            "size": int(snap["size"][group_id]),
+            "centroid": snap["centroid"][group_id],
+            "velocity": snap["velocity"][group_id],
+        }
+
     def get_group_info(self, group_id: int) -> Optional[dict]:
         """
         獲取群組資訊
@@ -279,13 +354,12 @@ class GroupDetectionMixin:
 
     def get_all_groups(self) -> List[dict]:
         """獲取所有有效群組的資訊"""
-        groups = []
-        for g in range(self.max_groups):
-            info = self.get_group_info(g)
-            if info is not None:
-                groups.append(info)
-        return groups
+        snap = self.snapshot_groups()
+        return [
+            self._group_info_from_snapshot(snap, g)
+            for g in np.flatnonzero(snap["active"] != 0).tolist()
+        ]
 
     def get_agent_groups(self) -> np.ndarray:
-        """獲取每個 agent 的群組 ID（返回 numpy 陣列）"""
-        return self.group_id.to_numpy()
+        """獲取每個 agent 的群組 ID（返回 numpy 陣列，長度 N）"""
+        return self.group_id.to_numpy()[: self.N]
@@ -13,14 +13,20 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
+import collections
+import dataclasses
+import functools
+import itertools
+import json
+import os
 import time
 from typing import Optional, Dict, Any
 
 import numpy as np
 import streamlit as st
+import plotly.colors
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import taichi as ti
 
 from flocking_2d import Flocking2D
 from flocking_3d import Flocking3D, FlockingParams
@@ -43,6 +49,15 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# 執行中 fragment 的重跑間隔（秒）
+FRAME_INTERVAL = 0.01
+
+# 設定環境變數 PLOTLY_VALIDATE=1 時才讓 plotly 逐欄位驗證 traces / layout（除錯用）
+PLOTLY_VALIDATE = bool(os.environ.get("PLOTLY_VALIDATE"))
+
+# 圖表最多繪製的 agent 數（超過時固定抽樣，統計仍使用全部 agents）
+MAX_RENDER_POINTS = 1000
+
 # ============================================================================
 # Session State Initialization
 # ============================================================================
@@ -57,13 +72,9 @@ def init_session_state():
     if "step_count" not in st.session_state:
         st.session_state.step_count = 0
     if "fps_history" not in st.session_state:
-        st.session_state.fps_history = []
+        st.session_state.fps_history = collections.deque(maxlen=50)
     if "last_params" not in st.session_state:
         st.session_state.last_params = None
-    if "ti_initialized" not in st.session_state:
-        # 初始化 Taichi（只執行一次）
-        ti.init(arch=ti.gpu, random_seed=42)
-        st.session_state.ti_initialized = True
 
 
 # ============================================================================
@@ -71,6 +82,34 @@ def init_session_state():
 # ============================================================================
 
 
+def _to_jsonable(obj: Any) -> Any:
+    """json.dumps 的 default：展開 dataclass（ResourceConfig 等）與 numpy 型別"""
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def system_config_key(
+    system_type: str,
+    N: int,
+    params: FlockingParams,
+    agent_config: Optional[Dict[str, Any]] = None,
+) -> str:
+    """系統配置的穩定字串 key（存於 session_state，用於判斷是否需要重建）"""
+    return json.dumps(
+        {
+            "system_type": system_type,
+            "N": N,
+            "params": dataclasses.asdict(params),
+            "agent_config": agent_config,
+        },
+        sort_keys=True,
+        default=_to_jsonable,
+    )
+
+
 def create_system(
     system_type: str,
     N: int,
@@ -78,7 +117,7 @@ def create_system(
     agent_config: Optional[Dict[str, Any]] = None,
 ) -> Any:
     """
-    創建模擬系統
+    建立模擬系統並初始化粒子位置
 
     Args:
         system_type: "2D" / "3D" / "Heterogeneous"
@@ -88,7 +127,28 @@ def create_system(
 
     Returns:
         系統實例
+
+    Note:
+        系統存在各 session 自己的 st.session_state，配置 key 改變或 Reset 時重建；
+        不做跨 session 的快取：系統帶有能量、資源等可變狀態，且各系統的建構子
+        會自行 ti.init（重置 runtime，先前建立的系統 fields 即失效）
     """
+    system = _build_system(system_type, N, params, agent_config)
+
+    # 初始化位置
+    system.initialize(box_size=5.0, seed=42)
+
+    return system
+
+
+def _build_system(
+    system_type: str,
+    N: int,
+    params: FlockingParams,
+    agent_config: Optional[Dict[str, Any]],
+) -> Any:
+    """依類型建構模擬系統（尚未初始化位置）"""
+
     if system_type == "2D":
         system = Flocking2D(N=N, params=params)
     elif system_type == "3D":
@@ -141,9 +201,6 @@ def create_system(
     else:
         raise ValueError(f"Unknown system type: {system_type}")
 
-    # 初始化位置
-    system.initialize(box_size=5.0, seed=42)
-
     return system
 
 
@@ -152,127 +209,337 @@ def create_system(
 # ============================================================================
 
 
-def create_3d_plot(system, show_velocity: bool = False, show_energy: bool = False):
+def _speeds(v: np.ndarray) -> np.ndarray:
+    """每列向量的長度（einsum 單次乘加，免 np.linalg.norm 的前處理開銷）"""
+    return np.sqrt(np.einsum("ij,ij->i", v, v))
+
+
+def _colorscale_lut(scale) -> np.ndarray:
+    """
+    把 Plotly 色階內插成 256 色的查表，每格為 '#rrggbb' 字串
+
+    動畫中 marker 顏色直接查表，只送出短字串；免送 float 陣列 + 色階由瀏覽器端映射
+    """
+    rgb, _ = plotly.colors.convert_colors_to_same_type(scale, colortype="tuple")
+    rgb = np.asarray(rgb, dtype=np.float64)
+    t = np.linspace(0.0, 1.0, 256)
+    stops = np.linspace(0.0, 1.0, len(rgb))
+    table = np.stack([np.interp(t, stops, rgb[:, c]) for c in range(3)], axis=1)
+    table = np.rint(table * 255).astype(np.uint8)
+    return np.array([f"#{r:02x}{g:02x}{b:02x}" for r, g, b in table])
+
+
+COLOR_LUTS = {
+    "Viridis": _colorscale_lut(plotly.colors.sequential.Viridis),
+    "RdYlGn": _colorscale_lut(plotly.colors.diverging.RdYlGn),
+}
+
+
+def lut_colors(values: np.ndarray, colorscale: str) -> np.ndarray:
+    """以 min-max 正規化後查 COLOR_LUTS，返回每點的 '#rrggbb' 顏色"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return COLOR_LUTS[colorscale][:0]
+    lo = values.min()
+    span = values.max() - lo
+    scale = 255.0 / span if span > 0 else 0.0
+    idx = np.clip((values - lo) * scale, 0, 255).astype(np.uint8)
+    return COLOR_LUTS[colorscale][idx]
+
+
+def _unit_sphere_mesh(n_u: int = 20, n_v: int = 10):
+    """
+    單位球面網格（經緯度取樣）
+
+    Returns:
+        vertices: (n_u × n_v, 3) 頂點
+        faces: (2 × (n_u - 1) × (n_v - 1), 3) 三角形頂點索引
+    """
+    u = np.linspace(0, 2 * np.pi, n_u)
+    v = np.linspace(0, np.pi, n_v)
+    U, V = np.meshgrid(u, v, indexing="ij")
+    vertices = np.stack(
+        [np.cos(U) * np.sin(V), np.sin(U) * np.sin(V), np.cos(V)], axis=-1
+    ).reshape(-1, 3)
+
+    # 每個 (u, v) 方格切成兩個三角形
+    idx = np.arange(n_u * n_v).reshape(n_u, n_v)
+    a, b = idx[:-1, :-1].ravel(), idx[1:, :-1].ravel()
+    c, d = idx[1:, 1:].ravel(), idx[:-1, 1:].ravel()
+    faces = np.concatenate([np.stack([a, b, c], 1), np.stack([a, c, d], 1)])
+    return vertices, faces
+
+
+# 球面網格只計算一次，各資源 / 障礙物以平移與縮放重用
+SPHERE_VERTICES, SPHERE_FACES = _unit_sphere_mesh()
+
+
+def spheres_mesh3d(centers, radii, color: str, opacity: float, name: str):
+    """
+    將多個球合併成單一 Mesh3d trace spec（一個類別一次 draw call）
+
+    Args:
+        centers: (K, 3) 球心
+        radii: (K,) 半徑
+        color: 顏色
+        opacity: 透明度
+        name: 圖例名稱
+    """
+    return dict(
+        type="mesh3d",
+        **spheres_mesh_arrays(centers, radii),
+        color=color,
+        opacity=opacity,
+        flatshading=True,
+        name=name,
+        showlegend=True,
+    )
+
+
+def spheres_mesh_arrays(centers, radii) -> Dict[str, np.ndarray]:
+    """多個球合併後的 Mesh3d 頂點（x, y, z）與三角形索引（i, j, k）"""
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+    n_verts = len(SPHERE_VERTICES)
+
+    vertices = (
+        radii[:, None, None] * SPHERE_VERTICES[None] + centers[:, None, :]
+    ).reshape(-1, 3)
+    faces = (
+        SPHERE_FACES[None] + (np.arange(len(centers)) * n_verts)[:, None, None]
+    ).reshape(-1, 3)
+
+    return dict(
+        x=vertices[:, 0],
+        y=vertices[:, 1],
+        z=vertices[:, 2],
+        i=faces[:, 0],
+        j=faces[:, 1],
+        k=faces[:, 2],
+    )
+
+
+def new_figure() -> go.Figure:
+    """
+    建立空白圖表；traces 以 dict spec 加入
+
+    預設關閉 plotly 的逐欄位驗證與陣列強制轉型（_validate=False），
+    之後 update_plot 每幀的 update_traces 也不再驗證
+    """
+    return go.Figure(_validate=PLOTLY_VALIDATE)
+
+
+def velocity_segments(x: np.ndarray, v: np.ndarray, scale: float = 2.0):
+    """
+    將速度向量組成單一 lines trace 的座標
+
+    每個向量佔三個點：[起點, 終點, NaN]，NaN 讓 Plotly 斷開線段，
+    所有向量只需一個 trace
+
+    Returns:
+        每個維度一個長度 3 × len(x) 的陣列
+    """
+    ends = x + v * scale
+    segments = np.full((3 * len(x), x.shape[1]), np.nan, dtype=np.float64)
+    segments[0::3] = x
+    segments[1::3] = ends
+    return tuple(segments[:, d] for d in range(x.shape[1]))
+
+
+def velocity_sample(x_np: np.ndarray, v_np: np.ndarray):
+    """採樣約 50 個 agent 的速度向量（避免過度擁擠），返回線段座標"""
+    sample_rate = max(1, len(x_np) // 50)
+    # 縮放 2 倍顯示
+    return velocity_segments(x_np[::sample_rate], v_np[::sample_rate], 2.0)
+
+
+def colors_by_energy(system, show_energy: bool) -> bool:
+    """agent 是否以能量著色（否則以速度著色）"""
+    return show_energy and hasattr(system, "get_agent_energies")
+
+
+def frame_snapshot(system, need_v: bool = True) -> Dict[str, Any]:
+    """
+    本幀一次讀回 host 的資料，統計與繪圖共用（同一 field 每幀只複製一次）
+
+    Args:
+        need_v: 是否讀取速度（以能量著色且不畫速度向量時用不到）
+
+    Returns:
+        {x, v, energies, targets, groups}；非異質性系統後三者為 None
+    """
+    snapshot = {
+        "x": system.x.to_numpy(),
+        "v": system.v.to_numpy() if need_v else None,
+        "energies": None,
+        "targets": None,
+        "groups": None,
+    }
+    if hasattr(system, "get_agent_energies"):
+        snapshot["energies"] = system.get_agent_energies()
+        snapshot["targets"] = system.get_agent_targets()
+        snapshot["groups"] = system.get_all_groups()
+    return snapshot
+
+
+@functools.lru_cache(maxsize=8)
+def render_indices(n: int) -> Optional[np.ndarray]:
+    """
+    N 超過 MAX_RENDER_POINTS 時要繪製的 agent 索引（固定種子，跨幀為同一批 agents）
+
+    Returns:
+        排序後的索引；不需抽樣時為 None
+    """
+    if n <= MAX_RENDER_POINTS:
+        return None
+    idx = np.random.default_rng(0).permutation(n)[:MAX_RENDER_POINTS]
+    idx.sort()  # 保持記憶體順序，取樣較快
+    return idx
+
+
+def decimate_snapshot(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """返回只含 render_indices() 抽樣 agents 的 snapshot（供繪圖使用）"""
+    idx = render_indices(len(snapshot["x"]))
+    if idx is None:
+        return snapshot
+    view = dict(snapshot)
+    for key in ("x", "v", "energies"):
+        if view[key] is not None:
+            view[key] = view[key][idx]
+    return view
+
+
+def agent_colors(snapshot: Dict[str, Any], show_energy: bool):
+    """
+    agent 著色
+
+    Returns:
+        (colors, colorscale, colorbar_title)
+    """
+    if show_energy and snapshot["energies"] is not None:
+        return snapshot["energies"], "RdYlGn", "Energy"  # 紅-黃-綠
+    # 根據速度大小著色
+    return _speeds(snapshot["v"]), "Viridis", "Speed"
+
+
+def agent_marker(
+    values: np.ndarray, colorscale: str, colorbar_title: str, animating: bool
+) -> Dict[str, Any]:
+    """
+    agent marker 的顏色設定
+
+    動畫中用查表顏色並隱藏 colorbar（減少每幀傳輸量），暫停時才顯示 colorbar
+    """
+    if animating:
+        return dict(color=lut_colors(values, colorscale), showscale=False)
+    return dict(
+        color=values,
+        colorscale=colorscale,
+        showscale=True,
+        colorbar=dict(title=colorbar_title),
+    )
+
+
+def resource_mesh_update(system) -> Dict[str, Any]:
+    """資源 Mesh3d 的逐幀更新內容（位置 / 半徑 / 存量可能改變）"""
+    resources = system.get_all_resources()
+    total_amount = sum(res["amount"] for res in resources)
+    return dict(
+        **spheres_mesh_arrays(
+            [res["position"] for res in resources],
+            [res["radius"] for res in resources],
+        ),
+        name=f"Resources (amt={total_amount:.0f})",
+        showlegend=bool(resources),
+    )
+
+
+def create_3d_plot(
+    system,
+    snapshot: Dict[str, Any],
+    show_velocity: bool = False,
+    show_energy: bool = False,
+    animating: bool = False,
+):
     """
     創建 Plotly 3D 圖表
 
     Args:
         system: 模擬系統
+        snapshot: frame_snapshot() 的本幀資料
         show_velocity: 是否顯示速度向量
         show_energy: 是否用能量著色（僅異質性系統）
+        animating: 動畫中（查表顏色、不顯示 colorbar）
     """
-    x_np = system.x.to_numpy()
-    v_np = system.v.to_numpy()
+    x_np = snapshot["x"]
+    v_np = snapshot["v"]
 
     # 基礎顏色
-    if show_energy and hasattr(system, "get_agent_energies"):
-        energies = system.get_agent_energies()
-        colors = energies
-        colorscale = "RdYlGn"  # 紅-黃-綠
-        colorbar_title = "Energy"
-    else:
-        # 根據速度大小著色
-        speeds = np.linalg.norm(v_np, axis=1)
-        colors = speeds
-        colorscale = "Viridis"
-        colorbar_title = "Speed"
+    colors, colorscale, colorbar_title = agent_colors(snapshot, show_energy)
 
     # 創建圖表
-    fig = go.Figure()
+    fig = new_figure()
 
     # Agent 散點圖
     fig.add_trace(
-        go.Scatter3d(
+        dict(
+            type="scatter3d",
             x=x_np[:, 0],
             y=x_np[:, 1],
             z=x_np[:, 2],
             mode="markers",
             marker=dict(
                 size=4,
-                color=colors,
-                colorscale=colorscale,
-                showscale=True,
-                colorbar=dict(title=colorbar_title),
+                **agent_marker(colors, colorscale, colorbar_title, animating),
             ),
             name="Agents",
         )
     )
 
-    # 速度向量（可選）
+    # 速度向量（可選）：所有向量合成一個 trace
     if show_velocity:
-        # 採樣顯示（避免過度擁擠）
-        sample_rate = max(1, len(x_np) // 50)
-        x_sample = x_np[::sample_rate]
-        v_sample = v_np[::sample_rate]
-
-        for i in range(len(x_sample)):
-            x_start = x_sample[i]
-            x_end = x_start + v_sample[i] * 2.0  # 縮放顯示
-
-            fig.add_trace(
-                go.Scatter3d(
-                    x=[x_start[0], x_end[0]],
-                    y=[x_start[1], x_end[1]],
-                    z=[x_start[2], x_end[2]],
-                    mode="lines",
-                    line=dict(color="yellow", width=2),
-                    showlegend=False,
-                    hoverinfo="skip",
-                )
+        xs, ys, zs = velocity_sample(x_np, v_np)
+        fig.add_trace(
+            dict(
+                type="scatter3d",
+                x=xs,
+                y=ys,
+                z=zs,
+                uid="velocity",
+                mode="lines",
+                line=dict(color="yellow", width=2),
+                connectgaps=False,
+                showlegend=False,
+                hoverinfo="skip",
             )
+        )
 
-    # 資源（如果有）
+    # 資源（如果有）：所有資源合成一個 Mesh3d（之後由 update_plot 原地更新）
     if hasattr(system, "get_all_resources"):
-        resources = system.get_all_resources()
-        for res in resources:
-            pos = res["position"]
-            radius = res["radius"]
-            amount = res["amount"]
-
-            # 球體表面採樣
-            u = np.linspace(0, 2 * np.pi, 20)
-            v = np.linspace(0, np.pi, 10)
-            x_sphere = radius * np.outer(np.cos(u), np.sin(v)) + pos[0]
-            y_sphere = radius * np.outer(np.sin(u), np.sin(v)) + pos[1]
-            z_sphere = radius * np.outer(np.ones(np.size(u)), np.cos(v)) + pos[2]
-
-            fig.add_trace(
-                go.Surface(
-                    x=x_sphere,
-                    y=y_sphere,
-                    z=z_sphere,
-                    colorscale=[[0, "lightblue"], [1, "lightblue"]],
-                    showscale=False,
-                    opacity=0.3,
-                    name=f"Resource (amt={amount:.0f})",
-                )
+        fig.add_trace(
+            dict(
+                type="mesh3d",
+                **resource_mesh_update(system),
+                uid="resources",
+                color="lightblue",
+                opacity=0.3,
+                flatshading=True,
             )
+        )
 
-    # 障礙物（如果有）
+    # 障礙物（如果有）：所有球形障礙物合成一個 Mesh3d
     if hasattr(system, "get_all_obstacles"):
-        obstacles = system.get_all_obstacles()
-        for obs in obstacles:
-            if obs["type"] == 0:  # Sphere
-                pos = obs["position"]
-                radius = obs["param1"]
-
-                u = np.linspace(0, 2 * np.pi, 20)
-                v = np.linspace(0, np.pi, 10)
-                x_sphere = radius * np.outer(np.cos(u), np.sin(v)) + pos[0]
-                y_sphere = radius * np.outer(np.sin(u), np.sin(v)) + pos[1]
-                z_sphere = radius * np.outer(np.ones(np.size(u)), np.cos(v)) + pos[2]
-
-                fig.add_trace(
-                    go.Surface(
-                        x=x_sphere,
-                        y=y_sphere,
-                        z=z_sphere,
-                        colorscale=[[0, "gray"], [1, "gray"]],
-                        showscale=False,
-                        opacity=0.5,
-                        name="Obstacle",
-                    )
+        spheres = [obs for obs in system.get_all_obstacles() if obs["type"] == 0]
+        if spheres:
+            fig.add_trace(
+                spheres_mesh3d(
+                    [obs["position"] for obs in spheres],
+                    [obs["params"][0] for obs in spheres],
+                    color="gray",
+                    opacity=0.5,
+                    name="Obstacles",
                 )
+            )
 
     # 佈局
     box_size = system.params.box_size
@@ -291,27 +558,28 @@ def create_3d_plot(system, show_velocity: bool = False, show_energy: bool = Fals
     return fig
 
 
-def create_2d_plot(system, show_velocity: bool = False):
+def create_2d_plot(
+    system,
+    snapshot: Dict[str, Any],
+    show_velocity: bool = False,
+    animating: bool = False,
+):
     """創建 Plotly 2D 圖表"""
-    x_np = system.x.to_numpy()
-    v_np = system.v.to_numpy()
+    x_np = snapshot["x"]
+    v_np = snapshot["v"]
 
-    speeds = np.linalg.norm(v_np, axis=1)
-
-    fig = go.Figure()
+    fig = new_figure()
 
     # Agent 散點圖
     fig.add_trace(
-        go.Scatter(
+        dict(
+            type="scatter",
             x=x_np[:, 0],
             y=x_np[:, 1],
             mode="markers",
             marker=dict(
                 size=6,
-                color=speeds,
-                colorscale="Viridis",
-                showscale=True,
-                colorbar=dict(title="Speed"),
+                **agent_marker(_speeds(v_np), "Viridis", "Speed", animating),
             ),
             name="Agents",
         )
@@ -319,24 +587,20 @@ def create_2d_plot(system, show_velocity: bool = False):
 
     # 速度向量
     if show_velocity:
-        sample_rate = max(1, len(x_np) // 50)
-        x_sample = x_np[::sample_rate]
-        v_sample = v_np[::sample_rate]
-
-        for i in range(len(x_sample)):
-            x_start = x_sample[i]
-            x_end = x_start + v_sample[i] * 2.0
-
-            fig.add_trace(
-                go.Scatter(
-                    x=[x_start[0], x_end[0]],
-                    y=[x_start[1], x_end[1]],
-                    mode="lines",
-                    line=dict(color="yellow", width=2),
-                    showlegend=False,
-                    hoverinfo="skip",
-                )
+        xs, ys = velocity_sample(x_np, v_np)
+        fig.add_trace(
+            dict(
+                type="scatter",
+                x=xs,
+                y=ys,
+                uid="velocity",
+                mode="lines",
+                line=dict(color="yellow", width=2),
+                connectgaps=False,
+                showlegend=False,
+                hoverinfo="skip",
             )
+        )
 
     # 佈局
     box_size = system.params.box_size
@@ -355,13 +619,94 @@ def create_2d_plot(system, show_velocity: bool = False):
     return fig
 
 
+def update_plot(
+    fig,
+    system,
+    snapshot: Dict[str, Any],
+    show_velocity: bool = False,
+    show_energy: bool = False,
+    animating: bool = False,
+):
+    """
+    原地更新圖表中隨時間改變的 traces（agents、速度向量、資源）
+
+    佈局、障礙物與色階設定沿用 create_*_plot 建立時的內容
+    """
+    x_np = snapshot["x"]
+    v_np = snapshot["v"]
+    colors, colorscale, _ = agent_colors(snapshot, show_energy)
+    if animating:
+        colors = lut_colors(colors, colorscale)
+    axes = "xyz"[: x_np.shape[1]]
+
+    with fig.batch_update():
+        agents = {axis: x_np[:, d] for d, axis in enumerate(axes)}
+        fig.update_traces(agents, marker_color=colors, selector=dict(name="Agents"))
+
+        if show_velocity:
+            segments = velocity_sample(x_np, v_np)
+            fig.update_traces(dict(zip(axes, segments)), selector=dict(uid="velocity"))
+
+        if hasattr(system, "get_all_resources"):
+            fig.update_traces(
+                resource_mesh_update(system), selector=dict(uid="resources")
+            )
+
+
+def get_plot(
+    system,
+    snapshot: Dict[str, Any],
+    system_type: str,
+    show_velocity: bool,
+    show_energy: bool,
+    animating: bool,
+    step_count: int,
+):
+    """
+    取得本幀圖表：系統、視覺化選項或播放 / 暫停狀態改變時重建，
+    其餘時候沿用 st.session_state 中的圖表並只更新資料；
+    系統沒有前進（step_count 未變，如暫停時調整其他 widget）則原樣返回
+    """
+    key = (id(system), system_type, show_velocity, show_energy, animating)
+    if st.session_state.get("fig_key") != key:
+        if system_type == "2D":
+            fig = create_2d_plot(
+                system, snapshot, show_velocity=show_velocity, animating=animating
+            )
+        else:
+            fig = create_3d_plot(
+                system,
+                snapshot,
+                show_velocity=show_velocity,
+                show_energy=show_energy,
+                animating=animating,
+            )
+        st.session_state.fig = fig
+        st.session_state.fig_key = key
+        st.session_state.fig_step = step_count
+        return fig
+
+    fig = st.session_state.fig
+    if st.session_state.fig_step != step_count:
+        update_plot(
+            fig,
+            system,
+            snapshot,
+            show_velocity=show_velocity,
+            show_energy=show_energy,
+            animating=animating,
+        )
+        st.session_state.fig_step = step_count
+    return fig
+
+
 # ============================================================================
 # Statistics Display
 # ============================================================================
 
 
-def display_statistics(system, step_count: int, fps: float):
-    """顯示統計資訊"""
+def display_statistics(system, snapshot: Dict[str, Any], step_count: int, fps: float):
+    """顯示統計資訊（異質性系統的能量 / 目標 / 群組取自 frame_snapshot）"""
     diag = system.compute_diagnostics()
 
     col1, col2, col3, col4, col5 = st.columns(5)
@@ -379,19 +724,18 @@ def display_statistics(system, step_count: int, fps: float):
         st.metric("Polarization", f"{diag['polarization']:.3f}")
 
     # 異質性系統的額外資訊
-    if hasattr(system, "get_agent_energies"):
+    if snapshot["energies"] is not None:
         with col4:
-            energies = system.get_agent_energies()
+            energies = snapshot["energies"]
             st.metric("Avg Energy", f"{np.mean(energies):.1f}")
             st.metric("Min Energy", f"{np.min(energies):.1f}")
 
         with col5:
-            targets = system.get_agent_targets()
+            targets = snapshot["targets"]
             n_foraging = np.sum(targets >= 0)
             st.metric("Foraging", f"{n_foraging}/{len(targets)}")
 
-            groups = system.get_all_groups()
-            st.metric("Groups", len(groups))
+            st.metric("Groups", len(snapshot["groups"]))
 
 
 # ============================================================================
@@ -587,13 +931,8 @@ def main():
         boundary_mode=boundary_mode_int,
     )
 
-    # 檢查是否需要重新創建系統
-    current_params = {
-        "system_type": system_type,
-        "N": N,
-        "params": params.__dict__,
-        "agent_config": agent_config,
-    }
+    # 檢查是否需要重新創建系統（以字串 key 比較，避免比較含 numpy 陣列的 dataclass）
+    current_params = system_config_key(system_type, N, params, agent_config)
 
     if (
         st.session_state.system is None
@@ -605,52 +944,75 @@ def main():
             )
             st.session_state.last_params = current_params
             st.session_state.step_count = 0
+            # 新系統可能重用舊系統的 id()，清除以 id 為 key 的資料 / 圖表快取
+            st.session_state.snapshot_key = None
+            st.session_state.fig_key = None
             st.info(f"✅ System created: {system_type}, N={N}")
 
     system = st.session_state.system
 
-    # 統計資訊
-    fps = (
-        np.mean(st.session_state.fps_history[-10:])
-        if st.session_state.fps_history
-        else 0.0
+    # 模擬與繪圖放在 fragment 內：執行中只有這一段定時重跑，
+    # 側邊欄與系統建立檢查不會每幀重新執行
+    run_every = FRAME_INTERVAL if st.session_state.running else None
+    st.fragment(sim_tick, run_every=run_every)(
+        system, system_type, dt, steps_per_frame, show_velocity, show_energy
     )
-    display_statistics(system, st.session_state.step_count, fps)
 
-    st.divider()
 
-    # 視覺化
-    plot_placeholder = st.empty()
+def sim_tick(
+    system,
+    system_type: str,
+    dt: float,
+    steps_per_frame: int,
+    show_velocity: bool,
+    show_energy: bool,
+):
+    """
+    模擬一幀：執行 steps_per_frame 步，更新統計與圖表
 
+    由 main() 以 st.fragment 包裝；執行中每 FRAME_INTERVAL 秒只重跑這個函式
+    """
     # 模擬循環
     if st.session_state.running:
         start_time = time.time()
 
-        # 執行多步
-        for _ in range(steps_per_frame):
-            system.step(dt)
-            st.session_state.step_count += 1
+        # 執行多步（一次呼叫，系統可把每步融合成單一 kernel）
+        system.step_n(dt, steps_per_frame)
+        st.session_state.step_count += steps_per_frame
 
         # 計算 FPS
         elapsed = time.time() - start_time
         current_fps = steps_per_frame / elapsed if elapsed > 0 else 0
-        st.session_state.fps_history.append(current_fps)
-        if len(st.session_state.fps_history) > 50:
-            st.session_state.fps_history.pop(0)
+        st.session_state.fps_history.append(current_fps)  # deque 自動丟棄最舊的
+
+    # 統計資訊（最近 10 幀平均）
+    recent = list(itertools.islice(reversed(st.session_state.fps_history), 10))
+    fps = sum(recent) / len(recent) if recent else 0.0
+    # 本幀資料一次讀回，統計與繪圖共用；以能量著色且不畫速度向量時不讀 v
+    show_energy = show_energy and system_type != "2D"  # 2D 圖只用速度著色
+    need_v = show_velocity or not colors_by_energy(system, show_energy)
+    # 系統沒有前進時（暫停中其他 widget 觸發重跑）沿用上次讀回的資料
+    snapshot_key = (id(system), st.session_state.step_count, need_v)
+    if st.session_state.get("snapshot_key") != snapshot_key:
+        st.session_state.snapshot = frame_snapshot(system, need_v=need_v)
+        st.session_state.snapshot_key = snapshot_key
+    snapshot = st.session_state.snapshot
+
+    display_statistics(system, snapshot, st.session_state.step_count, fps)
 
-        # 自動重新執行
-        time.sleep(0.01)  # 小延遲避免過度刷新
-        st.rerun()
+    st.divider()
 
-    # 繪製圖表
-    with plot_placeholder.container():
-        if system_type == "2D":
-            fig = create_2d_plot(system, show_velocity=show_velocity)
-        else:
-            fig = create_3d_plot(
-                system, show_velocity=show_velocity, show_energy=show_energy
-            )
-        st.plotly_chart(fig, use_container_width=True)
+    # 繪製圖表（建立一次，之後原地更新資料；N 大時只畫抽樣的 agents）
+    fig = get_plot(
+        system,
+        decimate_snapshot(snapshot),
+        system_type,
+        show_velocity,
+        show_energy,
+        animating=st.session_state.running,
+        step_count=st.session_state.step_count,
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 
 if __name__ == "__main__":
@@ -196,7 +196,8 @@ try:
     # 檢查 Leaders 是否接近目標
     x_np = system_goal.x.to_numpy()
     leader_positions = x_np[leader_indices]
-    distances = np.linalg.norm(leader_positions - np.array(goal_pos), axis=1)
+    d = leader_positions - np.array(goal_pos)
+    distances = np.sqrt(np.einsum("ij,ij->i", d, d))
     avg_distance = np.mean(distances)
 
     print(f"     - After 20 steps: avg distance to goal = {avg_distance:.2f}")
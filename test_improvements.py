@@ -15,6 +15,7 @@ import numpy as np
 from flocking_heterogeneous import HeterogeneousFlocking3D, AgentType
 from flocking_3d import FlockingParams
 from resources import ResourceConfig
+from agents.types import TRAIT_MASS, TRAIT_V0
 
 print("=" * 70)
 print("測試改進項目")
@@ -35,8 +36,8 @@ system.x.from_numpy(np.array([[0, 0, 0], [3, 0, 0]], dtype=np.float32))
 system.v.from_numpy(np.array([[0, 0, 0], [0, 0, 0]], dtype=np.float32))
 
 # 取得質量
-mass1 = system.mass_individual[0]
-mass2 = system.mass_individual[1]
+mass1 = system.traits[0][TRAIT_MASS]
+mass2 = system.traits[1][TRAIT_MASS]
 print(f"Agent 0 (Follower) 質量: {mass1:.2f}")
 print(f"Agent 1 (Leader) 質量: {mass2:.2f}")
 
@@ -94,13 +95,13 @@ system.agent_energy[1] = 40.0  # 疲勞
 system.agent_energy[2] = 10.0  # 瀕死
 
 # 記錄基礎速度
-v0_base = system.v0_individual.to_numpy().copy()
+v0_base = system.traits.to_numpy()[:, TRAIT_V0].copy()
 
 # 觸發健康狀態更新
 system.consume_resources_step()
 
 # 檢查速度變化
-v0_after = system.v0_individual.to_numpy()
+v0_after = system.traits.to_numpy()[:, TRAIT_V0]
 health_status = system.agent_health_status.to_numpy()
 
 print(
@@ -39,13 +39,14 @@ class MinimalForagingSystem(ForagingBehaviorMixin):
         self.f = ti.Vector.field(3, ti.f32, N)
         self.agent_alive = ti.field(ti.i32, N)
         self.v0_base = ti.field(ti.f32, N)
-        self.v0_individual = ti.field(ti.f32, N)
+        self.traits = ti.Vector.field(4, ti.f32, N)
         self.agent_health_status = ti.field(ti.i32, N)
+        self.boundary_mode = 1  # 非週期邊界：距離直接相減
 
         # 初始化
         self.agent_alive.fill(1)
         self.v0_base.fill(1.0)
-        self.v0_individual.fill(1.0)
+        self.traits.fill(1.0)
 
         # 初始化覓食行為
         resources = ResourceSystem(max_resources=32)
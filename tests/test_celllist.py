@@ -0,0 +1,131 @@
+"""
+Unit Tests for CellListFlockingFixed
+
+測試 Cell List 分箱與鄰居掃描的正確性（與 O(N²) 暴力法比對）
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import numpy as np
+import pytest
+import taichi as ti
+
+from flocking_celllist import (
+    CellListFlockingFixed,
+    FlockingParams,
+    make_celllist_flocking,
+)
+
+
+def brute_force_forces(x: np.ndarray, v: np.ndarray, params: FlockingParams):
+    """O(N²) 參考實作：Morse + 對齊力（與 compute_forces_celllist 相同的模型）"""
+    box = params.box_size
+    rij = x[:, None, :] - x[None, :, :]
+    if params.use_pbc:
+        rij -= box * np.round(rij / box)
+    r2 = np.einsum("ijk,ijk->ij", rij, rij)
+    mask = (r2 <= params.rc**2) & (r2 >= 1e-6)
+    np.fill_diagonal(mask, False)
+
+    r = np.sqrt(np.where(mask, r2, 1.0))
+    coeff = params.Ca / params.la * np.exp(-r / params.la) - params.Cr / params.lr * (
+        np.exp(-r / params.lr)
+    )
+    f = np.einsum("ij,ijk->ik", np.where(mask, coeff / r, 0.0), rij)
+
+    n_nb = mask.sum(axis=1)
+    v_sum = mask.astype(np.float64) @ v
+    has_nb = n_nb > 0
+    f[has_nb] += params.beta * (v_sum[has_nb] / n_nb[has_nb, None] - v[has_nb])
+    return f, n_nb
+
+
+class TestCellList:
+    def setup_method(self):
+        ti.reset()
+
+    def test_binning_uses_full_precision_positions(self):
+        """
+        貼近 cell 邊界的粒子要分到正確的 cell
+
+        x = 19.995 在 FP16 會捨入成 20.0，跨過 box=50、cell_size=2.5 的邊界
+        """
+        params = FlockingParams(rc=2.5, box_size=50.0)
+        system = CellListFlockingFixed(N=2, params=params, arch=ti.cpu)
+
+        x = np.array([[19.995, 0.0, 0.0], [-2.5001, 7.4999, 0.0]], dtype=np.float32)
+        system.x.from_numpy(x)
+        system.build_cell_list()
+
+        assert system.cell_size == 2.5
+        idx = np.floor((x + 25.0) / np.float32(2.5)).astype(np.int64) % system.grid_n
+        expected = idx[:, 0] + idx[:, 1] * system.grid_n + idx[:, 2] * system.grid_n2
+        np.testing.assert_array_equal(system.last_cell.to_numpy(), expected)
+        assert system.check_cells_changed() == 0
+
+    def test_forces_match_brute_force(self):
+        """Cell List 的力與鄰居數應與 O(N²) 暴力法一致（含 rc 附近的 pair）"""
+        params = FlockingParams(rc=2.5, box_size=20.0, beta=0.5)
+        N = 400
+        system = CellListFlockingFixed(N=N, params=params, arch=ti.cpu)
+
+        rng = np.random.default_rng(3)
+        x = rng.uniform(-10.0, 10.0, (N, 3))
+        # 一半的粒子放在 cell 邊界附近（±1e-3），檢查跨 cell 的 pair
+        faces = np.round((x[: N // 2] + 10.0) / 2.5) * 2.5 - 10.0
+        x[: N // 2, 0] = faces[:, 0] + rng.uniform(-1e-3, 1e-3, N // 2)
+        x = x.astype(np.float32)
+        v = rng.uniform(-1.0, 1.0, (N, 3)).astype(np.float32)
+        system.x.from_numpy(x)
+        system.v.from_numpy(v)
+
+        system.build_cell_list()
+        system.compute_forces_celllist(0.0, 0)
+
+        f_ref, n_ref = brute_force_forces(
+            x.astype(np.float64), v.astype(np.float64), params
+        )
+        np.testing.assert_array_equal(system.n_nb.to_numpy(), n_ref)
+        np.testing.assert_allclose(system.f.to_numpy(), f_ref, rtol=1e-3, atol=1e-3)
+
+    def test_numba_backend_matches_taichi(self):
+        """Numba 版的力與短軌跡應與 Taichi 版一致"""
+        pytest.importorskip("numba")
+
+        params = FlockingParams(rc=2.5, box_size=20.0, beta=0.5)
+        N, dt, steps = 300, 0.01, 5
+        rng = np.random.default_rng(5)
+        x = rng.uniform(-10.0, 10.0, (N, 3)).astype(np.float32)
+        v = rng.uniform(-1.0, 1.0, (N, 3)).astype(np.float32)
+
+        taichi_sys = make_celllist_flocking(N, params, arch=ti.cpu)
+        assert isinstance(taichi_sys, CellListFlockingFixed)
+        taichi_sys.x.from_numpy(x)
+        taichi_sys.v.from_numpy(v)
+        taichi_sys.build_cell_list()
+        taichi_sys.compute_forces_celllist(0.0, 0)
+        f_taichi = taichi_sys.f.to_numpy()
+        for _ in range(steps):
+            taichi_sys.step(dt)
+        x_taichi, v_taichi = taichi_sys.get_state()
+
+        numba_sys = make_celllist_flocking(N, params, arch="numba")
+        assert numba_sys.grid_n == taichi_sys.grid_n
+        numba_sys.x[:] = x
+        numba_sys.v[:] = v
+        numba_sys.build_cell_list()
+        numba_sys.compute_forces()
+        np.testing.assert_allclose(numba_sys.f, f_taichi, rtol=1e-3, atol=1e-3)
+
+        for _ in range(steps):
+            numba_sys.step(dt)
+        x_numba, v_numba = numba_sys.get_state()
+        np.testing.assert_allclose(x_numba, x_taichi, rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(v_numba, v_taichi, rtol=1e-3, atol=1e-3)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
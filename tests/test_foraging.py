@@ -17,6 +17,7 @@ from flocking_heterogeneous import (
     HeterogeneousFlocking3D,
 )
 from flocking_3d import FlockingParams
+from agents.types import TRAIT_V0
 from resources import ResourceConfig, create_resource, create_renewable_resource
 
 
@@ -67,6 +68,56 @@ def test_resource_creation(system):
     np.testing.assert_allclose(info["position"], [5.0, 5.0, 5.0], rtol=1e-5)
 
 
+def test_resource_snapshot(system):
+    """測試 snapshot 與 get_all_resources 一致（略過已移除的資源）"""
+    system.add_resource(create_resource(position=(1.0, 2.0, 3.0), amount=50.0))
+    removed = system.add_resource(create_resource(position=(4.0, 5.0, 6.0)))
+    system.add_resource(create_renewable_resource(position=(7.0, 8.0, 9.0)))
+    system.remove_resource(removed)
+
+    snap = system.resources.snapshot_resources()
+    assert snap["position"].shape == (3, 3)
+    np.testing.assert_array_equal(snap["active"], [1, 0, 1])
+
+    resources = system.get_all_resources()
+    assert [r["res_id"] for r in resources] == [0, 2]
+    assert resources[0]["amount"] == 50.0
+    np.testing.assert_allclose(resources[1]["position"], [7.0, 8.0, 9.0])
+
+
+def test_consume_resources_batch(system):
+    """測試批次消耗與逐一呼叫 consume_resource 結果相同（含耗盡與 inactive）"""
+    system.add_resource(create_resource(position=(0.0, 0.0, 0.0), amount=5.0))
+    system.add_resource(create_renewable_resource(position=(9.0, 0.0, 0.0)))
+
+    res_ids = np.array([0, 1, 0, 0, 1], dtype=np.int32)
+    amounts = np.array([3.0, 4.0, 3.0, 3.0, 1.5], dtype=np.float32)
+    consumed = np.zeros(5, dtype=np.float32)
+    system.resources.consume_resources_batch(res_ids, amounts, consumed)
+
+    # 資源 0 只有 5：3 → 2 → 耗盡後 inactive 回傳 0
+    np.testing.assert_allclose(consumed, [3.0, 4.0, 2.0, 0.0, 1.5])
+    snap = system.resources.snapshot_resources()
+    np.testing.assert_array_equal(snap["active"], [0, 1])
+    np.testing.assert_allclose(snap["amount"], [0.0, 94.5])
+
+
+def test_find_nearest_resource_batch(system):
+    """測試批次最近資源查詢（略過 inactive 資源）"""
+    system.add_resource(create_resource(position=(0.0, 0.0, 0.0)))
+    removed = system.add_resource(create_resource(position=(10.0, 0.0, 0.0)))
+    system.add_resource(create_resource(position=(20.0, 0.0, 0.0)))
+    system.remove_resource(removed)
+
+    pos = np.array([[1.0, 0.0, 0.0], [11.0, 0.0, 0.0], [19.0, 0.0, 0.0]], np.float32)
+    ids = np.zeros(3, dtype=np.int32)
+    dists = np.zeros(3, dtype=np.float32)
+    system.resources.find_nearest_resource(pos, ids, dists)
+
+    np.testing.assert_array_equal(ids, [0, 2, 2])
+    np.testing.assert_allclose(dists, [1.0, 81.0, 1.0])
+
+
 def test_resource_consumption(system):
     """測試資源消耗"""
     # 新增資源在 (5, 5, 5)
@@ -385,6 +436,39 @@ def test_energy_death():
     print(f"✅ Energy death test passed: {dead_count}/{N} agents starved")
 
 
+def test_health_speed_penalty_does_not_drift(system):
+    """
+    測試健康懲罰反覆改寫 traits 的 v0（f16）不會累積誤差
+
+    每次都由 f32 的 v0_base × 係數重新算出，結果應恆等於 f16(v0_base × 係數)
+    """
+    N = system.N
+    v0_base = np.full(system.max_agents, 1.0, dtype=np.float32)
+    v0_base[:N] = np.linspace(0.7, 2.3, N, dtype=np.float32) + np.float32(1e-3)
+    system.v0_base.from_numpy(v0_base)
+
+    factors = {80.0: 1.0, 40.0: 0.85, 20.0: 0.60, 5.0: 0.30}
+    energy = system.agent_energy.to_numpy()
+    for _ in range(50):
+        for level, factor in factors.items():
+            energy[:N] = level
+            system.agent_energy.from_numpy(energy)
+            system._update_health_status()
+            system._apply_health_speed_penalty()
+
+            v0 = system.traits.to_numpy()[:N, TRAIT_V0]
+            expected = (v0_base[:N] * np.float32(factor)).astype(np.float16)
+            np.testing.assert_array_equal(v0, expected)
+
+    # 回到健康狀態後與基礎速度只差 f16 的捨入（相對誤差 ≤ 2^-11）
+    energy[:N] = 80.0
+    system.agent_energy.from_numpy(energy)
+    system._update_health_status()
+    system._apply_health_speed_penalty()
+    v0 = system.traits.to_numpy()[:N, TRAIT_V0]
+    np.testing.assert_allclose(v0, v0_base[:N], rtol=2.0**-11)
+
+
 def test_predation_dynamic_reward():
     """測試動態掠食獎勵"""
     params = FlockingParams(
@@ -320,6 +320,144 @@ def test_large_angle_threshold():
     print(f"✓ Large angle threshold: all agents in 1 group")
 
 
+def test_label_propagation_early_exit():
+    """測試收斂後提前結束迭代，結果與跑滿迭代次數相同"""
+    N = 20
+    params = FlockingParams(box_size=50.0, boundary_mode=1)
+    sim = HeterogeneousFlocking3D(N, params, enable_fov=False)
+
+    rng = np.random.default_rng(3)
+    sim.x.from_numpy(
+        np.vstack(
+            [
+                rng.normal(0.0, 0.5, (N, 3)),
+                np.zeros((sim.max_agents - N, 3)),
+            ]
+        ).astype(np.float32)
+    )
+    v = np.zeros((sim.max_agents, 3), dtype=np.float32)
+    v[:N, 0] = 1.0
+    sim.v.from_numpy(v)
+
+    sim.update_groups(r_cluster=5.0, theta_cluster=30.0, n_iterations=50)
+
+    # 提前結束時最後一輪沒有任何標籤改變
+    assert sim.labels_changed[None] == 0
+    assert len(np.unique(sim.get_agent_groups())) == 1
+
+    print("✓ Label propagation stops once converged")
+
+
+def test_grid_morton_cell_ids():
+    """測試 grid cell ID 為 Morton 順序的稠密名次，counting sort 後每個 cell 的 agents 正確"""
+    N = 30
+    params = FlockingParams(box_size=50.0, boundary_mode=1)
+    sim = HeterogeneousFlocking3D(N, params, enable_fov=False)
+
+    rng = np.random.default_rng(7)
+    x = np.zeros((sim.max_agents, 3), dtype=np.float32)
+    x[:N] = rng.uniform(-24.0, 24.0, (N, 3))
+    sim.x.from_numpy(x)
+    sim.assign_agents_to_grid()
+
+    def spread(v):
+        return sum(((v >> b) & 1) << (3 * b) for b in range(10))
+
+    res = sim.grid_resolution
+    assert sim.grid_total_cells == res**3  # 不補到 2 的冪次
+
+    # 所有 cell 的 Morton code 排序後的名次即為 cell ID
+    codes = np.array(
+        [
+            spread(a) | (spread(b) << 1) | (spread(c) << 2)
+            for c in range(res)
+            for b in range(res)
+            for a in range(res)
+        ]
+    )
+    rank = np.argsort(np.argsort(codes))
+    idx = np.clip(((x[:N] + 25.0) / sim.grid_cell_size).astype(int), 0, res - 1)
+    expected = rank[idx[:, 0] + res * (idx[:, 1] + res * idx[:, 2])]
+
+    cell_ids = sim.agent_cell_id.to_numpy()
+    offsets = sim.cell_offset.to_numpy()
+    sorted_agents = sim.sorted_agents.to_numpy()
+    for i in range(N):
+        if sim.agent_types_np[i] == 3:
+            continue
+        assert cell_ids[i] == expected[i]
+        assert i in sorted_agents[offsets[cell_ids[i]] : offsets[cell_ids[i] + 1]]
+
+    print("✓ Grid uses Morton cell IDs")
+
+
+def test_grid_offsets_match_prefix_sum():
+    """測試分塊平行 prefix sum 與 NumPy cumsum 一致"""
+    N = 500
+    params = FlockingParams(box_size=50.0, boundary_mode=1)
+    sim = HeterogeneousFlocking3D(
+        N, params, agent_types=[0] * N, max_agents=N, enable_fov=False
+    )
+
+    rng = np.random.default_rng(11)
+    x = np.zeros((sim.max_agents, 3), dtype=np.float32)
+    x[:N] = rng.uniform(-24.0, 24.0, (N, 3))
+    sim.x.from_numpy(x)
+    sim.assign_agents_to_grid()
+
+    n_cells = sim.cell_count.shape[0]
+    assert sim.cell_block_sum.shape[0] > 1  # 確實分成多個區塊
+    counts = np.bincount(sim.agent_cell_id.to_numpy(), minlength=n_cells)
+    expected = np.concatenate([[0], np.cumsum(counts)])
+
+    np.testing.assert_array_equal(sim.cell_offset.to_numpy(), expected)
+    np.testing.assert_array_equal(sim.cell_count.to_numpy(), counts)
+
+    print("✓ Grid offsets match prefix sum")
+
+
+def test_grid_resize_then_query():
+    """測試 update_groups 觸發 grid 重新配置後，分配與鄰居查詢仍正確"""
+    N = 40
+    params = FlockingParams(rc=2.0, box_size=50.0, boundary_mode=1)
+    sim = HeterogeneousFlocking3D(
+        N, params, agent_types=[0] * N, max_agents=N, enable_fov=False
+    )
+
+    # 兩團相距 7：r_cluster=5 時分開，r_cluster=8 時合併
+    rng = np.random.default_rng(3)
+    x = rng.normal(scale=0.3, size=(N, 3)).astype(np.float32)
+    x[N // 2 :, 0] += 7.0
+    sim.x.from_numpy(x)
+    sim.v.from_numpy(np.tile(np.float32([1.0, 0.0, 0.0]), (N, 1)))
+
+    sim.update_groups(r_cluster=5.0, theta_cluster=30.0, n_iterations=10)
+    assert len(np.unique(sim.get_agent_groups())) == 2
+    sim.compute_forces()
+    f_before = sim.f.to_numpy()
+    old_resolution = sim.grid_resolution
+
+    # r_cluster > cell 邊長 → update_grid_resolution 重建 cell fields
+    sim.update_groups(r_cluster=8.0, theta_cluster=30.0, n_iterations=10)
+    assert sim.grid_resolution < old_resolution
+    assert sim.cell_offset.shape[0] == sim.grid_total_cells + 1
+    assert len(np.unique(sim.get_agent_groups())) == 1
+
+    # 以新 grid 重新分配：每個 agent 都在自己 cell 的區段內
+    sim.assign_agents_to_grid()
+    cell_ids = sim.agent_cell_id.to_numpy()
+    offsets = sim.cell_offset.to_numpy()
+    sorted_agents = sim.sorted_agents.to_numpy()
+    for i in range(N):
+        assert i in sorted_agents[offsets[cell_ids[i]] : offsets[cell_ids[i] + 1]]
+
+    # 力的鄰居查詢（27-cell 走訪）與重建前一致
+    sim.compute_forces()
+    np.testing.assert_allclose(sim.f.to_numpy(), f_before, rtol=1e-5, atol=1e-5)
+
+    print("✓ Grid resize keeps assignment and neighbour queries correct")
+
+
 # ============================================================================
 # Run All Tests
 # ============================================================================
@@ -337,6 +475,10 @@ if __name__ == "__main__":
     test_group_detection_with_pbc()
     test_empty_simulation()
     test_large_angle_threshold()
+    test_label_propagation_early_exit()
+    test_grid_morton_cell_ids()
+    test_grid_offsets_match_prefix_sum()
+    test_grid_resize_then_query()
 
     print("=" * 70)
     print("All tests passed!")
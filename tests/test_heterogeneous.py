@@ -24,6 +24,13 @@ from flocking_heterogeneous import (
     DEFAULT_PROFILES,
 )
 from flocking_3d import FlockingParams
+from agents.types import (
+    TRAIT_BETA,
+    TRAIT_ETA,
+    TRAIT_V0,
+    STATUS_ALIVE_BIT,
+    STATUS_TYPE_MASK,
+)
 
 
 # ============================================================================
@@ -43,8 +50,8 @@ def test_agent_type_initialization():
     assert np.sum(type_arr == AgentType.FOLLOWER) == 20
 
     # 驗證個體參數
-    beta_arr = system.beta_individual.to_numpy()
-    eta_arr = system.eta_individual.to_numpy()
+    beta_arr = system.traits.to_numpy()[:, TRAIT_BETA]
+    eta_arr = system.traits.to_numpy()[:, TRAIT_ETA]
 
     # Explorer 應該有較低的 beta, 較高的 eta
     explorer_indices = np.where(type_arr == AgentType.EXPLORER)[0]
@@ -57,6 +64,31 @@ def test_agent_type_initialization():
     print("✓ Agent type initialization correct")
 
 
+def test_agent_status_packing():
+    """測試 agent_status 與 agent_alive / agent_type_field 一致"""
+    N = 12
+    agent_types = [AgentType.EXPLORER] * 4 + [AgentType.LEADER] * 4
+    agent_types += [AgentType.PREDATOR] * 4
+
+    params = FlockingParams(box_size=30.0)
+    system = HeterogeneousFlocking3D(
+        N=N, params=params, agent_types=agent_types, max_agents=16
+    )
+    system.initialize(box_size=5.0, seed=0)
+    system.agent_alive[1] = 0
+    system.compute_forces()  # assign_agents_to_grid 會重新打包
+
+    status = system.agent_status.to_numpy().astype(np.int32)
+    alive = system.agent_alive.to_numpy()
+    types = system.agent_type_field.to_numpy()
+
+    np.testing.assert_array_equal((status & STATUS_ALIVE_BIT) != 0, alive == 1)
+    np.testing.assert_array_equal(status & STATUS_TYPE_MASK, types)
+    assert status[1] & STATUS_ALIVE_BIT == 0
+
+    print("✓ agent_status packing correct")
+
+
 def test_default_profiles():
     """測試預設 profile 值合理"""
     assert (
@@ -89,8 +121,8 @@ def test_custom_profiles():
     )
 
     # 驗證使用了自訂 profile
-    assert np.allclose(system.beta_individual.to_numpy(), 2.0)
-    assert np.allclose(system.v0_individual.to_numpy(), 1.5)
+    assert np.allclose(system.traits.to_numpy()[:, TRAIT_BETA], 2.0)
+    assert np.allclose(system.traits.to_numpy()[:, TRAIT_V0], 1.5)
 
     print("✓ Custom profiles work correctly")
 
@@ -115,7 +147,7 @@ def test_individual_speed_convergence():
     # 檢查速度
     v_np = system.v.to_numpy()
     speeds = np.linalg.norm(v_np, axis=1)
-    v0_arr = system.v0_individual.to_numpy()
+    v0_arr = system.traits.to_numpy()[:, TRAIT_V0]
 
     # 在弱交互作用下，速度應接近各自的 v0
     # 允許較大誤差（因為仍有一些交互作用）
@@ -249,6 +281,42 @@ def test_goal_strength_parameter():
     )
 
 
+def test_set_goals_invalidates_cached_forces():
+    """步與步之間 set_goals 後，第一個半步應使用重算的 f（含新目標的導向力）"""
+    N = 10
+    params = FlockingParams(box_size=50.0)
+    system = HeterogeneousFlocking3D(
+        N=N, params=params, agent_types=[AgentType.LEADER] * N
+    )
+    system.initialize(box_size=5.0, seed=7)
+    for _ in range(5):
+        system.step(dt=0.05)
+    assert system.forces_valid
+
+    system.set_goals(np.tile([10.0, 0.0, 0.0], (N, 1)))
+    assert not system.forces_valid
+
+    # 以目前狀態重算的 f 作為參考，再還原成上一步留下的 f
+    f_stale = system.f.to_numpy()
+    system.compute_forces()
+    f_fresh = system.f.to_numpy()[:N]
+    system.f.from_numpy(f_stale)
+    assert np.abs(f_fresh - f_stale[:N]).max() > 0.1  # 新目標確實改變了力
+
+    # 記錄 verlet_step1 實際使用的 f
+    used = {}
+    verlet_step1 = system.verlet_step1
+
+    def recording_step1(dt):
+        used["f"] = system.f.to_numpy()[:N]
+        verlet_step1(dt)
+
+    system.verlet_step1 = recording_step1
+    system.step(dt=0.05)
+
+    np.testing.assert_allclose(used["f"], f_fresh, rtol=1e-5, atol=1e-5)
+
+
 # ============================================================================
 # Field of View Tests
 # ============================================================================
@@ -325,9 +393,9 @@ def test_homogeneous_fallback():
     system.initialize(seed=42)
 
     # 驗證：所有個體參數相同
-    beta_arr = system.beta_individual.to_numpy()
-    eta_arr = system.eta_individual.to_numpy()
-    v0_arr = system.v0_individual.to_numpy()
+    beta_arr = system.traits.to_numpy()[:, TRAIT_BETA]
+    eta_arr = system.traits.to_numpy()[:, TRAIT_ETA]
+    v0_arr = system.traits.to_numpy()[:, TRAIT_V0]
 
     assert np.allclose(beta_arr, beta_arr[0])
     assert np.allclose(eta_arr, eta_arr[0])
@@ -18,6 +18,7 @@ import pytest
 import taichi as ti
 
 from obstacles import (
+    OBSTACLE_GRID_MAX_RES,
     ObstacleSystem,
     ObstacleType,
     create_sphere_obstacle,
@@ -99,10 +100,32 @@ def test_cylinder_sdf():
     print("✓ Cylinder SDF correct")
 
 
+def test_compute_all_distances_matches_single():
+    """測試批次距離矩陣與逐點計算一致"""
+    obs_sys = ObstacleSystem(max_obstacles=4)
+    obs_sys.add_obstacle(create_sphere_obstacle(center=(0, 0, 0), radius=2.0))
+    obs_sys.add_obstacle(create_box_obstacle(center=(5, 0, 0), half_extents=(1, 2, 1)))
+    obs_sys.add_obstacle(
+        create_cylinder_obstacle(center=(0, 5, 0), radius=1.0, height=4.0)
+    )
+
+    rng = np.random.default_rng(1)
+    points = rng.uniform(-8.0, 8.0, (50, 3)).astype(np.float32)
+    dist = obs_sys.compute_all_distances(points)
+
+    assert dist.shape == (50, 3)
+    expected = np.array(
+        [
+            [obs_sys.compute_obstacle_distance_kernel(p, k) for k in range(3)]
+            for p in points
+        ]
+    )
+    np.testing.assert_allclose(dist, expected, rtol=1e-6, atol=1e-6)
+
+
 # ============================================================================
-# Force Tests (Skipped due to Taichi kernel complexity)
+# Force Tests
 # ============================================================================
-@pytest.mark.skip(reason="測試用 kernel 有變數作用域問題；整合測試已驗證功能正常")
 def test_obstacle_repulsion_force():
     """測試障礙物排斥力"""
     obs_sys = ObstacleSystem(max_obstacles=1)
@@ -123,7 +146,6 @@ def test_obstacle_repulsion_force():
     print(f"✓ Obstacle repulsion force: F={force}")
 
 
-@pytest.mark.skip(reason="測試用 kernel 有變數作用域問題；整合測試已驗證功能正常")
 def test_obstacle_force_decay():
     """測試障礙物力隨距離衰減"""
     obs_sys = ObstacleSystem(max_obstacles=1)
@@ -145,6 +167,156 @@ def test_obstacle_force_decay():
     print(f"✓ Force decay: F(close)={f1_mag:.3f}, F(far)={f2_mag:.3f}")
 
 
+@pytest.mark.parametrize(
+    "config, point, direction",
+    [
+        (
+            create_box_obstacle(center=(0, 0, 0), half_extents=(1, 1, 1)),
+            (2, 0, 0),
+            (1, 0, 0),
+        ),
+        (
+            create_box_obstacle(center=(0, 0, 0), half_extents=(1, 1, 1)),
+            (2, 2, 0),
+            (1, 1, 0),
+        ),
+        (
+            create_cylinder_obstacle(center=(0, 0, 0), radius=1.0, height=2.0),
+            (0, 2, 0),
+            (0, 1, 0),
+        ),
+        (
+            create_cylinder_obstacle(center=(0, 0, 0), radius=1.0, height=2.0),
+            (0, 0, -2),
+            (0, 0, -1),
+        ),
+    ],
+)
+def test_obstacle_force_normal_direction(config, point, direction):
+    """測試長方體與圓柱體的解析法向量方向"""
+    obs_sys = ObstacleSystem(max_obstacles=1)
+    obs_id = obs_sys.add_obstacle(config)
+
+    force = obs_sys.compute_obstacle_force_py(np.array(point, dtype=np.float32), obs_id)
+    expected = np.array(direction, dtype=np.float32)
+    expected /= np.linalg.norm(expected)
+
+    np.testing.assert_allclose(force / np.linalg.norm(force), expected, atol=1e-5)
+
+
+def test_fast_decay_matches_exp_shape():
+    """測試 fast_decay：接觸處與 exp 一致、隨距離遞減、截斷距離外為零"""
+    exact = ObstacleSystem(max_obstacles=1)
+    fast = ObstacleSystem(max_obstacles=1, use_fast_decay=True)
+    config = create_sphere_obstacle(center=(0, 0, 0), radius=2.0, strength=10.0)
+    exact.add_obstacle(config)
+    fast.add_obstacle(config)
+
+    # 球面上（d = 0）兩者相同
+    p_surface = np.array([2.0, 0, 0], dtype=np.float32)
+    np.testing.assert_allclose(
+        fast.compute_obstacle_force_py(p_surface, 0),
+        exact.compute_obstacle_force_py(p_surface, 0),
+        rtol=1e-5,
+    )
+
+    # 距離增加時單調遞減
+    mags = [
+        np.linalg.norm(
+            fast.compute_obstacle_force_py(np.array([r, 0, 0], dtype=np.float32), 0)
+        )
+        for r in (2.5, 3.5, 5.0, 7.0)
+    ]
+    assert all(a > b for a, b in zip(mags, mags[1:]))
+
+    # 超過 3 * decay 不施力
+    p_far = np.array([2.0 + 3.0 * config.decay_length + 0.1, 0, 0], dtype=np.float32)
+    assert np.linalg.norm(fast.compute_obstacle_force_py(p_far, 0)) == 0.0
+
+
+def test_obstacle_grid_matches_brute_force():
+    """測試障礙物網格查詢與逐一測試所有障礙物的總力一致"""
+    configs = [
+        create_sphere_obstacle(center=(-15, 0, 5), radius=3.0),
+        create_sphere_obstacle(center=(20, 20, -20), radius=2.0),
+        create_box_obstacle(center=(5, -10, 0), half_extents=(4, 1, 2)),
+        create_cylinder_obstacle(center=(0, 15, 0), radius=2.0, height=30.0),
+        create_box_obstacle(center=(24, 0, 0), half_extents=(2, 2, 2)),
+    ]
+    brute = ObstacleSystem(max_obstacles=len(configs))
+    grid = ObstacleSystem(max_obstacles=len(configs), domain_size=50.0)
+    for config in configs:
+        brute.add_obstacle(config)
+        grid.add_obstacle(config)
+    # 移除與移動也要反映到網格
+    for system in (brute, grid):
+        system.remove_obstacle(1)
+        system.update_obstacle_position(0, np.array([-10, 0, 5], dtype=np.float32))
+
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-30.0, 30.0, (2000, 3)).astype(np.float32)
+
+    def total_forces(system):
+        out = np.zeros_like(points)
+
+        @ti.kernel
+        def run(pts: ti.types.ndarray(), out: ti.types.ndarray()):
+            for i in range(pts.shape[0]):
+                p = ti.Vector([pts[i, 0], pts[i, 1], pts[i, 2]])
+                f = system.compute_total_obstacle_force(p)
+                for d in ti.static(range(3)):
+                    out[i, d] = f[d]
+
+        run(points, out)
+        return out
+
+    f_brute = total_forces(brute)
+    assert np.count_nonzero(np.linalg.norm(f_brute, axis=1)) > 0
+    np.testing.assert_allclose(total_forces(grid), f_brute, rtol=1e-6, atol=1e-6)
+
+
+def test_obstacle_grid_follows_moved_obstacle():
+    """測試網格增量更新：移動後的障礙物力跟著新位置，舊位置不再受力"""
+    system = ObstacleSystem(max_obstacles=2, domain_size=50.0)
+    system.add_obstacle(create_sphere_obstacle(center=(-15, 0, 0), radius=2.0))
+    system.add_obstacle(create_sphere_obstacle(center=(0, 15, 0), radius=2.0))
+
+    offset = np.array([3.0, 0.5, 0.0], dtype=np.float32)
+    old_pos = np.array([-15, 0, 0], dtype=np.float32)
+    new_pos = np.array([15, -10, 5], dtype=np.float32)
+    points = np.stack([old_pos + offset, new_pos + offset])
+
+    def total_forces():
+        out = np.zeros_like(points)
+
+        @ti.kernel
+        def run(pts: ti.types.ndarray(), out: ti.types.ndarray()):
+            for i in range(pts.shape[0]):
+                p = ti.Vector([pts[i, 0], pts[i, 1], pts[i, 2]])
+                f = system.compute_total_obstacle_force(p)
+                for d in ti.static(range(3)):
+                    out[i, d] = f[d]
+
+        run(points, out)
+        return out
+
+    f_before = total_forces()
+    assert np.linalg.norm(f_before[0]) > 0 and np.linalg.norm(f_before[1]) == 0
+
+    system.update_obstacle_position(0, new_pos)
+    f_after = total_forces()
+    np.testing.assert_allclose(f_after[1], f_before[0], rtol=1e-5, atol=1e-6)
+    assert np.linalg.norm(f_after[0]) == 0
+
+    # device 端的網格只含兩個障礙物目前登錄的 cell（舊位置的 cell 已清除）
+    counts = system.obstacle_cell_count.to_numpy()
+    assert counts.sum() == sum(len(c) for c in system._host_obstacle_cells[:2])
+
+    # 大區域時每軸 cell 數有上限
+    large = ObstacleSystem(max_obstacles=2, domain_size=1000.0)
+    assert large.grid_n == OBSTACLE_GRID_MAX_RES
+
+
 # ============================================================================
 # Integration Tests
 # ============================================================================
@@ -246,6 +418,60 @@ def test_dynamic_obstacle():
     print(f"✓ Dynamic obstacle: final pos={obs_info['position']}")
 
 
+def test_obstacle_added_after_first_step():
+    """模擬開始後才新增的障礙物也應該產生排斥力"""
+    N = 10
+    params = FlockingParams(beta=1.0, alpha=1.0, box_size=50.0)
+
+    system = HeterogeneousFlocking3D(
+        N=N,
+        params=params,
+        agent_types=[AgentType.FOLLOWER] * N,
+        max_obstacles=2,
+    )
+    system.initialize(box_size=3.0, seed=42)
+    system.step(dt=0.01)  # 先編譯並執行一次（此時沒有障礙物）
+
+    system.compute_forces()
+    f_before = system.f.to_numpy()[:N]
+
+    system.add_obstacle(
+        create_sphere_obstacle(center=(0, 0, 0), radius=2.0, strength=20.0)
+    )
+    system.compute_forces()
+    f_after = system.f.to_numpy()[:N]
+
+    diff = np.abs(f_after - f_before).max()
+    assert diff > 1e-3, "Obstacle added after the first step should affect forces"
+
+
+def test_update_obstacle_positions_batch():
+    """測試批次更新障礙物位置：結果與逐一更新相同，不合法 ID 被略過"""
+    batch = ObstacleSystem(max_obstacles=3, domain_size=50.0)
+    single = ObstacleSystem(max_obstacles=3, domain_size=50.0)
+    for x in (-10.0, 0.0, 10.0):
+        config = create_sphere_obstacle(center=(x, 0, 0), radius=1.0)
+        batch.add_obstacle(config)
+        single.add_obstacle(config)
+
+    new_pos = np.array([[-5, 1, 2], [15, -3, 4], [0, 0, 0]], dtype=np.float32)
+    batch.update_obstacle_positions(np.array([0, 2, 7]), new_pos)
+    single.update_obstacle_position(0, new_pos[0])
+    single.update_obstacle_position(2, new_pos[1])
+
+    np.testing.assert_allclose(batch.get_obstacle_info(0)["position"], new_pos[0])
+    np.testing.assert_allclose(batch.get_obstacle_info(1)["position"], [0, 0, 0])
+    np.testing.assert_allclose(batch.get_obstacle_info(2)["position"], new_pos[1])
+
+    # 受影響的 cell 只上傳一次，但網格內容與逐一更新相同
+    np.testing.assert_array_equal(
+        batch.obstacle_cell_count.to_numpy(), single.obstacle_cell_count.to_numpy()
+    )
+    np.testing.assert_array_equal(
+        batch.obstacle_cell_list.to_numpy(), single.obstacle_cell_list.to_numpy()
+    )
+
+
 def test_obstacle_remove():
     """測試移除障礙物"""
     obs_sys = ObstacleSystem(max_obstacles=5)
@@ -182,6 +182,27 @@ class TestFOVEdgeCases:
 
         assert test() == 1, "is_in_fov_indexed 應該正確工作"
 
+    @pytest.mark.parametrize("fov_angle", [90.0, 180.0, 270.0])
+    def test_fov_sq_matches_fov(self, fov_angle):
+        """is_in_fov_sq（平方比較）應與 is_in_fov 結果一致"""
+        system = TestPerceptionSystem(N=256, fov_angle=fov_angle, enable_fov=True)
+
+        rng = np.random.default_rng(0)
+        system.v.from_numpy(rng.normal(size=(256, 3)).astype(np.float32))
+        system.x.from_numpy(rng.normal(size=(256, 3)).astype(np.float32))
+        result = ti.field(ti.i32, (256, 2))
+
+        @ti.kernel
+        def test():
+            for i in range(256):
+                vi, rij = system.v[i], system.x[i]
+                result[i, 0] = system.is_in_fov(vi, rij)
+                result[i, 1] = system.is_in_fov_sq(vi, rij, vi.dot(vi), rij.dot(rij))
+
+        test()
+        res = result.to_numpy()
+        assert np.array_equal(res[:, 0], res[:, 1])
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
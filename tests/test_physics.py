@@ -502,6 +502,29 @@ class TestPhysicsProperties:
         # 能量應該有界（不應該無限增長）
         assert np.all(energies < 1000.0), "Kinetic energy unbounded"
 
+    @pytest.mark.parametrize(
+        "system_cls, params_cls", [(Flocking2D, Params2D), (Flocking3D, Params3D)]
+    )
+    def test_step_n_matches_step(self, system_cls, params_cls):
+        """step_n(dt, n) 應與呼叫 n 次 step(dt) 結果一致（含 Vicsek noise 的 RNG 狀態）"""
+        params = params_cls(beta=1.0, eta=0.2, box_size=50.0)
+
+        # 建構子會重新 ti.init，因此兩個系統依序建立、先取出結果
+        looped = system_cls(N=50, params=params)
+        looped.initialize(box_size=5.0, seed=7)
+        for _ in range(5):
+            looped.step(0.01)
+        x_ref, v_ref = looped.x.to_numpy(), looped.v.to_numpy()
+        rng_ref = looped.rng_state.to_numpy()
+
+        fused = system_cls(N=50, params=params)
+        fused.initialize(box_size=5.0, seed=7)
+        fused.step_n(0.01, 5)
+
+        np.testing.assert_allclose(fused.x.to_numpy(), x_ref, rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(fused.v.to_numpy(), v_ref, rtol=1e-5, atol=1e-5)
+        np.testing.assert_array_equal(fused.rng_state.to_numpy(), rng_ref)
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])